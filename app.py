@@ -1,44 +1,172 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory, Response
-import yt_dlp
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, abort
 import os
 import threading
 import time
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
+import json
 import sys
 import subprocess
-import requests # Add this import
+import functools
+import importlib
+import logging
+import http_session
+import metrics
 import uuid
 import shutil
-from mutagen.mp3 import MP3
-from mutagen.id3 import ID3, APIC, TIT2, TPE1, TALB, TDRC, TCON, TRCK, TPE2, TPE3
-from mutagen.id3._util import ID3NoHeaderError
-from mutagen import File
-import io
-import instaloader
-import re
+from email.utils import parsedate_to_datetime
+from urllib.parse import urljoin
+from jobs import JobManager, Handoff, FAILED
+from info_cache import InfoCache
+from batch import DownloadArchive, HostLimiter, run_batch
+from bulk_lookup import resolve_all
+from job_store import JobStore
+from media_cache import MediaCache, make_key as make_media_key
+from formats import audio_postprocessor, build_format_options, parse_audio_codecs
+from postprocessing import DeferredPostProcessing, step_timer
+from cover_art import find_written_thumbnail, prepare_cover
+from tagging import GENRE_RULES, add_metadata_to_audio, configure_genres
+from instagram_downloader import download_instagram_post, extract_instagram_shortcode, load_post
+from instagram_config import INSTAGRAM_CONFIG, CACHE_SETTINGS, DOWNLOAD_SETTINGS, LOGGING_CONFIG
+from log_config import configure_logging
+from post_cache import PostCache
+from thumbnail_cache import ThumbnailCache
+from direct_download import download_url, filename_from_url, remove_partial, reserve_path
+from file_serving import check_serve_mode, serve_file
 
 app = Flask(__name__)
+logger = logging.getLogger(__name__)
 
 # --- Configuration ---
-app.config['DOWNLOAD_FOLDER'] = 'D:/Universal Video Downloader Downloads'
+# Any setting can be overridden with a DOWNLOADER_ environment variable, e.g.
+# DOWNLOADER_MAX_CONCURRENT_DOWNLOADS=5 (values are parsed as JSON when possible)
+if os.name == 'nt':
+    DEFAULT_DOWNLOAD_FOLDER = 'D:/Universal Video Downloader Downloads'
+else:
+    DEFAULT_DOWNLOAD_FOLDER = os.path.join(os.path.expanduser('~'), 'Universal Video Downloader Downloads')
+app.config['DOWNLOAD_FOLDER'] = os.environ.get('DOWNLOADER_DOWNLOAD_FOLDER', DEFAULT_DOWNLOAD_FOLDER)
 app.config['ALLOWED_EXTENSIONS'] = {'mp4', 'mp3', 'webm'}
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
+app.config['MAX_CONCURRENT_DOWNLOADS'] = 3  # Number of downloads running at the same time
+app.config['POSTPROCESS_WORKERS'] = os.cpu_count() or 2  # Merges, conversions and tagging running at the same time
+app.config['INFO_CACHE_SIZE'] = 256  # Number of extracted video infos kept in memory
+app.config['INFO_CACHE_TTL'] = 600  # Seconds before extracted info is fetched again
+app.config['FETCH_TITLES_MAX_URLS'] = 100  # URLs accepted by one /fetch_titles request
+app.config['FETCH_TITLES_WORKERS'] = 8  # URLs of a /fetch_titles request resolved at the same time
+app.config['FETCH_TITLES_TIMEOUT'] = 30  # Seconds before a URL is reported as timed out
+app.config['SSE_MAX_UPDATES_PER_SECOND'] = 4  # Upper bound for progress events sent per job
+app.config['SSE_KEEPALIVE'] = 15  # Seconds between keep-alive comments on idle streams
+app.config['BATCH_MAX_WORKERS'] = 8  # Concurrent entries per playlist/batch download
+app.config['MAX_DOWNLOADS_PER_HOST'] = 4  # Concurrent batch entries from the same site
+app.config['DOWNLOAD_ARCHIVE'] = os.path.join(app.config['DOWNLOAD_FOLDER'], 'download_archive.txt')
+app.config['JOB_DATABASE'] = os.path.join(app.config['DOWNLOAD_FOLDER'], 'jobs.db')
+app.config['JOB_STORE_FLUSH_INTERVAL'] = 2  # Seconds between batched progress writes
+app.config['CONCURRENT_FRAGMENT_DOWNLOADS'] = 4  # Parallel HLS/DASH fragments per job (default)
+app.config['MAX_FRAGMENT_DOWNLOADS'] = 16  # Upper bound for the per-job fragments setting
+app.config['USE_EXTERNAL_DOWNLOADER'] = False  # Download with aria2c when it is installed
+app.config['ARIA2C_ARGS'] = ['--max-connection-per-server=8', '--split=8', '--min-split-size=1M']
+app.config['MEDIA_CACHE_INDEX'] = os.path.join(app.config['DOWNLOAD_FOLDER'], 'media_index.db')
+app.config['MEDIA_CACHE_QUOTA'] = None  # Bytes of indexed downloads to keep, None keeps everything
+app.config['HTTP_CONNECT_TIMEOUT'] = 5  # Seconds, for direct requests through http_session
+app.config['HTTP_READ_TIMEOUT'] = 30
+app.config['HTTP_RETRIES'] = 3
+app.config['HTTP_POOL_SIZE'] = 16  # Keep-alive connections per host
+app.config['HTTP_CHUNK_SIZE'] = 64 * 1024  # Bytes per chunk when streaming direct downloads
+app.config['SERVE_MODE'] = 'direct'  # 'direct', or 'x-accel' (nginx) / 'x-sendfile' (Apache) behind a proxy
+app.config['SERVE_ACCEL_PREFIX'] = '/protected-downloads/'  # nginx internal location for the download folder
+app.config['DIRECT_DOWNLOAD_SEGMENTS'] = 4  # Parallel ranged requests per direct download
+app.config['DIRECT_DOWNLOAD_MIN_SEGMENT'] = 4 * 1024 * 1024  # Smaller files are fetched in one request
+app.config['INSTAGRAM_MAX_WORKERS'] = 4  # Carousel items downloaded at the same time
+app.config['THUMBNAIL_CACHE_FOLDER'] = os.path.join(app.root_path, '.cache', 'thumbnails')
+app.config['THUMBNAIL_CACHE_MEMORY'] = 32 * 1024 * 1024  # Bytes of thumbnails kept in memory
+app.config['THUMBNAIL_CACHE_DISK'] = 512 * 1024 * 1024  # Bytes of thumbnails kept on disk
+app.config['THUMBNAIL_CACHE_TTL'] = 7 * 24 * 3600  # Seconds before a thumbnail is fetched again
+app.config['THUMBNAIL_MAX_BYTES'] = 5 * 1024 * 1024  # Larger images are refused by the proxy
+app.config['THUMBNAIL_MAX_REDIRECTS'] = 5  # Each hop must also be on the allowed hosts
+app.config['THUMBNAIL_ALLOWED_HOSTS'] = [  # Hosts (and their subdomains) the proxy will fetch from
+    'ytimg.com', 'ggpht.com', 'googleusercontent.com', 'cdninstagram.com', 'fbcdn.net',
+    'twimg.com', 'tiktokcdn.com', 'tiktokcdn-us.com', 'ibyteimg.com', 'vimeocdn.com',
+    'dmcdn.net', 'sndcdn.com',
+]
+app.config['GENRE_RULES'] = GENRE_RULES  # (genre, priority, keywords) rules for audio genre tags
+app.config['KEEP_AUDIO_INFO_JSON'] = False  # Keep .info.json next to audio files, retag.py can retag them later
+app.config.from_prefixed_env('DOWNLOADER')
+check_serve_mode(app.config['SERVE_MODE'])
+
+# Shared by all worker processes of one server run (set by the server before forking)
+SERVER_RUN_ID = os.environ.setdefault('DOWNLOADER_SERVER_RUN', f'run-{uuid.uuid4().hex}')
+
+configure_genres(app.config['GENRE_RULES'])
+
+http_session.configure(
+    connect_timeout=app.config['HTTP_CONNECT_TIMEOUT'],
+    read_timeout=app.config['HTTP_READ_TIMEOUT'],
+    retries=app.config['HTTP_RETRIES'],
+    pool_maxsize=app.config['HTTP_POOL_SIZE'],
+    chunk_size=app.config['HTTP_CHUNK_SIZE'],
+)
 
 # --- Global Variables ---
-download_status = {
+job_store = JobStore(app.config['JOB_DATABASE'], flush_interval=app.config['JOB_STORE_FLUSH_INTERVAL'],
+                     owner=SERVER_RUN_ID)
+job_manager = JobManager(max_workers=app.config['MAX_CONCURRENT_DOWNLOADS'], store=job_store,
+                         postprocess_workers=app.config['POSTPROCESS_WORKERS'])
+info_cache = InfoCache(max_entries=app.config['INFO_CACHE_SIZE'], ttl=app.config['INFO_CACHE_TTL'])
+host_limiter = HostLimiter(per_host=app.config['MAX_DOWNLOADS_PER_HOST'])
+media_cache = MediaCache(app.config['MEDIA_CACHE_INDEX'], quota_bytes=app.config['MEDIA_CACHE_QUOTA'])
+thumbnail_cache = ThumbnailCache(app.config['THUMBNAIL_CACHE_FOLDER'], app.config['THUMBNAIL_ALLOWED_HOSTS'],
+                                 memory_budget=app.config['THUMBNAIL_CACHE_MEMORY'],
+                                 disk_budget=app.config['THUMBNAIL_CACHE_DISK'],
+                                 ttl=app.config['THUMBNAIL_CACHE_TTL'])
+instagram_pool = None  # Created on first use by get_instagram_pool()
+instagram_pool_lock = threading.Lock()
+instagram_post_cache = None
+if CACHE_SETTINGS['enabled']:
+    instagram_post_cache = PostCache(os.path.join(app.root_path, CACHE_SETTINGS['cache_folder'], 'instagram'),
+                                     ttl=CACHE_SETTINGS['cache_duration'])
+
+def cache_counts():
+    """
+    (hits, misses) of every cache, read by the cache metrics on each scrape
+    """
+    counts = {}
+    for name, cache in (('info', info_cache), ('media', media_cache), ('instagram_post', instagram_post_cache)):
+        if cache is not None:
+            stats = cache.stats()
+            counts[name] = (stats['hits'], stats['misses'])
+    stats = thumbnail_cache.stats()
+    counts['thumbnail'] = (stats['memory_hits'] + stats['disk_hits'], stats['misses'])
+    return counts
+
+metrics.CallbackMetric('downloader_cache_hits_total', 'Lookups answered from a cache',
+                       lambda: [({'cache': name}, hits) for name, (hits, _) in cache_counts().items()],
+                       type='counter')
+metrics.CallbackMetric('downloader_cache_misses_total', 'Lookups a cache could not answer',
+                       lambda: [({'cache': name}, misses) for name, (_, misses) in cache_counts().items()],
+                       type='counter')
+metrics.CallbackMetric('downloader_stage_queued_jobs', 'Jobs waiting in the queue of a stage',
+                       lambda: [({'stage': name}, stats['queued']) for name, stats in job_manager.stats().items()])
+metrics.CallbackMetric('downloader_stage_active_jobs', 'Jobs running in a stage',
+                       lambda: [({'stage': name}, stats['active']) for name, stats in job_manager.stats().items()])
+
+# Status reported when no download job exists yet
+IDLE_STATUS = {
+    'job_id': None,
+    'state': None,
     'is_paused': False,
     'is_downloading': False,
     'progress': 0,
     'current_file': None,
     'message': 'Ready to download',
     'title': '',
-    'download_thread': None
 }
 
-# Generate a unique ID for the device
+# Generate a unique ID for the device, on first use
 DEVICE_ID_FILE = os.path.join(app.config['DOWNLOAD_FOLDER'], 'device_id.txt')
+@functools.lru_cache(maxsize=None)
 def get_device_id():
     if not os.path.exists(DEVICE_ID_FILE):
+        os.makedirs(app.config['DOWNLOAD_FOLDER'], exist_ok=True)
         device_id = str(uuid.uuid4())
         with open(DEVICE_ID_FILE, 'w') as f:
             f.write(device_id)
@@ -47,12 +175,13 @@ def get_device_id():
             device_id = f.read().strip()
     return device_id
 
-DEVICE_ID = get_device_id()
-
 # --- Helper Functions ---
+@functools.lru_cache(maxsize=None)
 def get_ffmpeg_location():
     """
     Find ffmpeg location with fallback options
+    
+    The result is cached, restart the app after installing ffmpeg.
     """
     # First check if ffmpeg is in PATH
     ffmpeg_path = shutil.which('ffmpeg')
@@ -70,12 +199,45 @@ def get_ffmpeg_location():
     
     for path in common_paths:
         if os.path.exists(os.path.join(path, 'ffmpeg.exe')):
-            print(f"✅ Found ffmpeg at: {path}")  # للـ debugging
+            logger.info('Found ffmpeg', extra={'ffmpeg_location': path})
             return path
     
-    print("❌ ffmpeg not found in any expected location")  # للـ debugging
+    logger.warning('ffmpeg not found in any expected location')
+    return None
+
+def get_aria2c_location():
+    """
+    Find the aria2c executable used as optional external downloader
+    """
+    aria2c_path = shutil.which('aria2c')
+    if aria2c_path:
+        return aria2c_path
+    
+    # Common Windows aria2 locations as fallback
+    common_paths = [
+        r"C:\aria2",
+        r"C:\Program Files\aria2",
+        r"C:\Program Files (x86)\aria2",
+    ]
+    
+    for path in common_paths:
+        if os.path.exists(os.path.join(path, 'aria2c.exe')):
+            return os.path.join(path, 'aria2c.exe')
+    
     return None
 
+ARIA2C_PATH = get_aria2c_location()
+
+def get_fragment_concurrency(value):
+    """
+    Parse the per-job fragments setting, falling back to the configured default
+    """
+    try:
+        fragments = int(value)
+    except (TypeError, ValueError):
+        fragments = app.config['CONCURRENT_FRAGMENT_DOWNLOADS']
+    return min(max(fragments, 1), app.config['MAX_FRAGMENT_DOWNLOADS'])
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
@@ -94,270 +256,365 @@ def create_download_folder():
         with open(os.path.join(app.config['DOWNLOAD_FOLDER'], 'first_run.txt'), 'w') as f:
             f.write("This file indicates the program was run for the first time.\n")
 
+def extract_video_info(url):
+    """
+    Return the raw (unprocessed) yt-dlp info for url, extracting it only once per cache TTL
+    
+    The result can be handed to `YoutubeDL.process_ie_result` to download without
+    running the extractor again.
+    """
+    def extract():
+        import yt_dlp
+        started = time.monotonic()
+        with yt_dlp.YoutubeDL({'quiet': True, 'noplaylist': True}) as ydl:
+            info = resolve_url_result(ydl, ydl.extract_info(url, download=False, process=False))
+        metrics.EXTRACTION_SECONDS.observe(time.monotonic() - started,
+                                           extractor=info.get('extractor_key') or 'unknown')
+        return info
+    return info_cache.get_or_extract(url, extract)
+
+def resolve_url_result(ydl, info, max_depth=5):
+    """
+    Follow 'url' and 'url_transparent' results to the video they point to
+
+    A page embedding another site's video is only a reference with
+    process=False; the target is extracted too (like process_ie_result
+    does), with the page's own fields kept for 'url_transparent'.
+    """
+    for _ in range(max_depth):
+        if info.get('_type') not in ('url', 'url_transparent'):
+            break
+        target = ydl.extract_info(info['url'], ie_key=info.get('ie_key'), download=False, process=False)
+        if info['_type'] == 'url_transparent':
+            exempted = {'_type', 'url', 'ie_key', 'id', 'extractor', 'extractor_key'}
+            target = dict(target, **{key: value for key, value in info.items()
+                                     if value is not None and key not in exempted})
+        info = target
+    return info
+
+def get_thumbnail_url(info):
+    """
+    Return the best thumbnail URL of an info dict (processed or raw)
+    """
+    if info.get('thumbnail'):
+        return info['thumbnail']
+    thumbnails = [t for t in info.get('thumbnails') or [] if t.get('url')]
+    if thumbnails:
+        return max(thumbnails, key=lambda t: t.get('preference') or 0)['url']
+    return None
+
 def get_available_formats():
     return ['Video', 'Audio']
 
 def get_available_qualities():
     return ['144p', '240p', '360p', '480p', '720p', '1080p', '1440p', '2160p']
 
-def add_metadata_to_audio(file_path, video_info, thumbnail_data=None):
-    """
-    Add metadata to audio file using information from video_info
-    """
-    try:
-        # Load the audio file
-        audio_file = MP3(file_path, ID3=ID3)
-        
-        # Try to load existing tags, if not create new ones
-        try:
-            audio_file.add_tags()
-        except ID3NoHeaderError:
-            pass
-        
-        # Extract information from video_info
-        title = video_info.get('title', '')
-        uploader = video_info.get('uploader', '') or video_info.get('artist', '') or video_info.get('creator', '')
-        album = video_info.get('album', '') or video_info.get('playlist_title', '') or uploader
-        upload_date = video_info.get('upload_date', '')
-        description = video_info.get('description', '')
-        
-        # Format upload date
-        if upload_date and len(upload_date) >= 4:
-            year = upload_date[:4]
-        else:
-            year = ''
-        
-        # Set basic metadata
-        if title:
-            audio_file.tags.add(TIT2(encoding=3, text=title))  # Title
-        
-        if uploader:
-            audio_file.tags.add(TPE1(encoding=3, text=uploader))  # Artist
-            audio_file.tags.add(TPE2(encoding=3, text=uploader))  # Album Artist
-        
-        if album:
-            audio_file.tags.add(TALB(encoding=3, text=album))  # Album
-        
-        if year:
-            audio_file.tags.add(TDRC(encoding=3, text=year))  # Year
-        
-        # Try to determine genre from title or description
-        genre = determine_genre(title, description)
-        if genre:
-            audio_file.tags.add(TCON(encoding=3, text=genre))  # Genre
-        
-        # Add track number (default to 1)
-        audio_file.tags.add(TRCK(encoding=3, text="1"))
-        
-        # Add thumbnail as album art if available
-        if thumbnail_data:
-            audio_file.tags.add(APIC(
-                encoding=3,
-                mime='image/jpeg',
-                type=3,  # Cover (front)
-                desc='Cover',
-                data=thumbnail_data
-            ))
-        
-        # Save the changes
-        audio_file.save()
-        print(f"✅ Metadata added to: {file_path}")
-        
-    except Exception as e:
-        print(f"❌ Error adding metadata to {file_path}: {str(e)}")
-
-def determine_genre(title, description):
-    """
-    Try to determine genre based on title and description
-    """
-    title_lower = title.lower() if title else ''
-    desc_lower = description.lower() if description else ''
-    
-    # Common Arabic music genres
-    if any(word in title_lower or word in desc_lower for word in ['أغنية', 'أغاني', 'موسيقى', 'مهرجان', 'شعبي']):
-        return 'Arabic Pop'
-    elif any(word in title_lower or word in desc_lower for word in ['راب', 'rap', 'hip hop']):
-        return 'Arabic Rap'
-    elif any(word in title_lower or word in desc_lower for word in ['كلاسيكي', 'طرب', 'أم كلثوم', 'فيروز']):
-        return 'Arabic Classical'
-    elif any(word in title_lower or word in desc_lower for word in ['مهرجان', 'شعبي']):
-        return 'Mahraganat'
-    elif any(word in title_lower or word in desc_lower for word in ['pop', 'بوب']):
-        return 'Pop'
-    elif any(word in title_lower or word in desc_lower for word in ['rock', 'روك']):
-        return 'Rock'
-    elif any(word in title_lower or word in desc_lower for word in ['jazz', 'جاز']):
-        return 'Jazz'
-    elif any(word in title_lower or word in desc_lower for word in ['classical', 'كلاسيكي']):
-        return 'Classical'
-    else:
-        return 'Music'  # Default genre
-
 # --- Download Functions ---
-def progress_hook(d):
-    if download_status['is_paused']:
-        raise Exception("Download paused")
+def progress_hook(job, d):
+    # Pausing blocks this worker inside yt-dlp instead of aborting the download
+    job.wait_while_paused()
     
     if d['status'] == 'downloading':
         total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
         downloaded_bytes = d.get('downloaded_bytes')
         if total_bytes and downloaded_bytes:
             percentage = (downloaded_bytes / total_bytes) * 100
-            download_status['progress'] = percentage
-            download_status['message'] = f"Downloading... {percentage:.1f}%"
+            job.update(progress=percentage, message=f"Downloading... {percentage:.1f}%",
+                       downloaded_bytes=downloaded_bytes, total_bytes=total_bytes)
     
     elif d['status'] == 'finished':
-        download_status['progress'] = 100
-        download_status['message'] = "Finalizing..."
+        job.update(progress=100, message="Finalizing...")
     
     elif d['status'] == 'error':
-        download_status['message'] = "Error occurred during download"
+        job.update(message="Error occurred during download")
+
+def finish_from_media_cache(job, cache_key, title, download_folder):
+    """
+    Complete job with the file of an identical earlier download, returns True on a cache hit
+    """
+    cached_path = media_cache.lookup(cache_key)
+    if not cached_path:
+        return False
+    name = secure_filename(title) if title else os.path.splitext(os.path.basename(cached_path))[0]
+    destination = media_cache.materialize(
+        cached_path, os.path.join(download_folder, name + os.path.splitext(cached_path)[1]))
+    job.update(current_file=os.path.basename(destination), output_path=destination,
+               message="Download complete!", progress=100)
+    return True
+
+def follow_job(job, owner):
+    """
+    Mirror the progress of an identical running job until it finishes
+    """
+    version = None
+    while not owner.is_finished:
+        version = owner.wait_for_change(version, timeout=app.config['SSE_KEEPALIVE'])
+        job.update(progress=owner.get('progress'), message=owner.get('message'))
 
-def download_video(url, quality, mode, download_folder, platform=None):
-    global download_status
+def download_video(job, url, quality, mode, download_folder, platform=None, fragments=None, audio_codecs=None):
+    """
+    Download the streams of a video, then hand the job to the post-processing stage
     
+    `audio_codecs` lists the audio codecs the client accepts as downloaded
+    (see formats.parse_audio_codecs), those are kept without re-encoding.
+    """
+    import yt_dlp
+    cache_key = None
+    ydl = None
+    handed_off = False
     try:
-        download_status.update({
-            'is_downloading': True,
-            'is_paused': False,
-            'progress': 0,
-            'message': 'Starting download...',
-            'current_file': None
-        })
+        job.update(progress=0, message='Starting download...', current_file=None)
         
-        processed_quality = quality[:-1] if quality.endswith('p') else quality
+        title = job.get('title')
+        # Kept audio keeps its own extension, converted audio is always mp3
+        ext = 'mp3' if mode == "Audio" and not audio_codecs else '%(ext)s'
         
-        # Use the title from download_status if available, otherwise fallback to yt-dlp's title
-        if download_status.get('title'):
+        # Use the title fetched for this job if available, otherwise fallback to yt-dlp's title
+        if title:
             # Sanitize the title to be used as a filename
-            sanitized_title = secure_filename(download_status['title'])
-            outtmpl_path = os.path.join(download_folder, f'{sanitized_title}.%(ext)s')
+            sanitized_title = secure_filename(title)
+            outtmpl_path = os.path.join(download_folder, f'{sanitized_title}.{ext}')
         else:
-            outtmpl_path = os.path.join(download_folder, '%(title)s.%(ext)s')
+            outtmpl_path = os.path.join(download_folder, f'%(title)s.{ext}')
 
-        ydl_opts_base = {
+        ydl_opts = {
             'outtmpl': outtmpl_path,
             'noplaylist': True,
-            'progress_hooks': [progress_hook],
+            'progress_hooks': [lambda d: progress_hook(job, d)],
             'postprocessors': [],
             'quiet': True,
             'merge_output_format': 'mp4',
             'compat_options': ['no-sabr'],
             'restrictfilenames': True,
             'writeinfojson': True,  # Save video info for metadata
+            'continuedl': True,  # Resume from .part files if the connection drops while paused
+            'retries': 10,
+            'fragment_retries': 10,
+            # Download HLS/DASH fragments in parallel instead of one at a time
+            'concurrent_fragment_downloads': get_fragment_concurrency(fragments),
         }
         
+        if app.config['USE_EXTERNAL_DOWNLOADER'] and ARIA2C_PATH:
+            ydl_opts['external_downloader'] = {'default': ARIA2C_PATH}
+            ydl_opts['external_downloader_args'] = {'aria2c': app.config['ARIA2C_ARGS']}
+        
         # Add ffmpeg location if available
         ffmpeg_location = get_ffmpeg_location()
         if ffmpeg_location:
-            ydl_opts_base['ffmpeg_location'] = ffmpeg_location
-            print(f"🎯 Using ffmpeg from: {ffmpeg_location}")
+            ydl_opts['ffmpeg_location'] = ffmpeg_location
+            logger.debug('Using ffmpeg', extra={'ffmpeg_location': ffmpeg_location})
         else:
-            print("⚠️ ffmpeg not found - download quality may be limited")
+            logger.warning('ffmpeg not found - download quality may be limited')
+
+        # Only download the streams needed for the selected quality
+        ydl_opts.update(build_format_options(quality, mode, audio_codecs))
 
         if mode == "Audio":
-            ydl_opts = ydl_opts_base.copy()
-            ydl_opts['format'] = 'bestaudio/best'
+            # The thumbnail is embedded by add_metadata_to_audio together with the other
+            # tags, so the audio file is only rewritten once (no EmbedThumbnail postprocessor)
             ydl_opts['writethumbnail'] = True
-            ydl_opts['postprocessors'].append({
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            })
-            ydl_opts['postprocessors'].append({
-                'key': 'EmbedThumbnail',
-            })
-            if download_status.get('title'):
-                sanitized_title = secure_filename(download_status['title'])
-                ydl_opts['outtmpl'] = os.path.join(download_folder, f'{sanitized_title}.mp3')
-            else:
-                ydl_opts['outtmpl'] = os.path.join(download_folder, '%(title)s.mp3')
-        else:  # Video
-            ydl_opts = ydl_opts_base.copy()
+            if not audio_codecs:
+                ydl_opts['postprocessors'].append(audio_postprocessor())
 
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            download_status['message'] = 'Extracting video information...'
-            info = ydl.extract_info(url, download=True)
-            filename = ydl.prepare_filename(info)
+        job.update(message='Extracting video information...')
+        raw_info = extract_video_info(url)
+        cache_key = make_media_key(raw_info, ydl_opts.get('format'), mode)
+        if finish_from_media_cache(job, cache_key, title, download_folder):
+            return
+        # An identical download may already be running, share it instead of
+        # downloading twice; if it fails another job may take over the key
+        while True:
+            owner = media_cache.begin(cache_key, job)
+            if owner is None:
+                break
+            follow_job(job, owner)
+            if finish_from_media_cache(job, cache_key, title, download_folder):
+                return
+
+        labels = {'extractor': raw_info.get('extractor_key') or 'unknown', 'mode': mode.lower()}
+        transfer = metrics.TransferMetrics(**labels)
+        stream_bytes = {}
+        
+        def measure(d):
+            # Files yt-dlp finds already downloaded only report 'finished', they aren't counted
+            if d['status'] == 'downloading':
+                transfer.progress(d.get('downloaded_bytes'))
+                stream_bytes[d.get('filename')] = d.get('downloaded_bytes') or 0
+            elif d['status'] == 'finished' and d.get('filename') in stream_bytes:
+                stream_bytes[d['filename']] = d.get('downloaded_bytes') or stream_bytes[d['filename']]
+        
+        ydl_opts['progress_hooks'].append(measure)
+        step_names = {}
+        ydl_opts['postprocessor_hooks'] = [step_timer(step_names=step_names, **labels)]
+
+        ydl = yt_dlp.YoutubeDL(ydl_opts)
+        # Merging, conversion and tagging run in the post-processing stage,
+        # this download worker moves on to the next job
+        deferred = DeferredPostProcessing(ydl)
+        info = ydl.process_ie_result(raw_info, download=True)
+        if mode == "Audio" and audio_codecs:
+            # Only known now: the audio is kept when the selected stream has an accepted
+            # codec, the postprocessor itself runs later with the deferred ones
+            from yt_dlp.postprocessor import get_postprocessor
+            options = audio_postprocessor(audio_codecs, info.get('acodec'))
+            if options['preferredcodec'] != 'mp3':
+                # Kept audio is only copied into its own container
+                step_names['ExtractAudio'] = 'remux'
+            ydl.add_post_processor(get_postprocessor(options.pop('key'))(ydl, **options))
+        transfer.finish(sum(stream_bytes.values()))
+        job.update(message='Waiting for processing...')
+        handed_off = True
+        return Handoff(job_manager.postprocess_stage, post_process_video, ydl, deferred, info, mode,
+                       download_folder, cache_key, ffmpeg_location, labels)
+
+    except Exception as e:
+        error_message = str(e).splitlines()[0]
+        job.update(state=FAILED, message=f"Error: {error_message}")
+    finally:
+        if not handed_off:
+            if ydl is not None:
+                ydl.close()
+            media_cache.end(cache_key, job)
+
+def post_process_video(job, ydl, deferred, info, mode, download_folder, cache_key, ffmpeg_location, labels):
+    """
+    Merge, convert and tag a finished download in the post-processing stage
+    
+    `labels` are the extractor and mode the steps are timed under in metrics.
+    """
+    try:
+        job.update(message='Processing...')
+        info = deferred.run() or info
+        filename = info.get('filepath') or ydl.prepare_filename(info)
+        
+        if mode == "Audio":
+            # Get the actual output filename after conversion
+            base_filename = os.path.splitext(filename)[0]
+            mp3_filename = base_filename + '.mp3'
             
-            if mode == "Audio":
-                # Get the actual output filename after conversion
-                base_filename = os.path.splitext(filename)[0]
-                mp3_filename = base_filename + '.mp3'
+            # Check if the file exists with different possible names
+            possible_files = [
+                filename,
+                mp3_filename,
+                filename.replace('.webm', '.mp3').replace('.m4a', '.mp3'),
+                os.path.join(download_folder, os.path.basename(base_filename) + '.mp3')
+            ]
+            
+            actual_file = None
+            for possible_file in possible_files:
+                if os.path.exists(possible_file):
+                    actual_file = possible_file
+                    break
+            
+            if actual_file:
+                filename = actual_file
                 
-                # Check if the file exists with different possible names
-                possible_files = [
-                    mp3_filename,
-                    filename.replace('.webm', '.mp3').replace('.m4a', '.mp3'),
-                    os.path.join(download_folder, os.path.basename(base_filename) + '.mp3')
-                ]
+                # Add metadata to audio file
+                job.update(message='Adding metadata...')
                 
-                actual_file = None
-                for possible_file in possible_files:
-                    if os.path.exists(possible_file):
-                        actual_file = possible_file
-                        break
+                # Use the thumbnail yt-dlp already wrote as album art
+                thumbnail_data = None
+                thumbnail_path = find_written_thumbnail(info)
+                if thumbnail_path:
+                    with metrics.POSTPROCESS_SECONDS.time(step='cover', **labels):
+                        thumbnail_data = prepare_cover(thumbnail_path, ffmpeg_location)
+                    os.remove(thumbnail_path)
                 
-                if actual_file:
-                    filename = actual_file
-                    
-                    # Add metadata to audio file
-                    download_status['message'] = 'Adding metadata...'
-                    
-                    # Download thumbnail data for album art
-                    thumbnail_data = None
-                    if info.get('thumbnail'):
-                        try:
-                            thumbnail_response = requests.get(info['thumbnail'], timeout=10)
-                            if thumbnail_response.status_code == 200:
-                                thumbnail_data = thumbnail_response.content
-                        except Exception as e:
-                            print(f"⚠️ Could not download thumbnail: {e}")
-                    
-                    # Add metadata to the audio file
+                # Add metadata to the audio file
+                with metrics.POSTPROCESS_SECONDS.time(step='tag', **labels):
                     add_metadata_to_audio(filename, info, thumbnail_data)
-                    
-                    # Clean up info.json file if it exists
-                    info_json_path = os.path.splitext(filename)[0] + '.info.json'
-                    if os.path.exists(info_json_path):
-                        os.remove(info_json_path)
-                else:
-                    print(f"⚠️ Could not find converted audio file. Expected: {mp3_filename}")
-            
-            download_status['current_file'] = os.path.basename(filename)
-            download_status['message'] = "Download complete!"
-            download_status['progress'] = 100
+                
+                # Clean up info.json file if it exists
+                info_json_path = os.path.splitext(filename)[0] + '.info.json'
+                if os.path.exists(info_json_path) and not app.config['KEEP_AUDIO_INFO_JSON']:
+                    os.remove(info_json_path)
+            else:
+                logger.warning('Could not find converted audio file', extra={'path': mp3_filename})
+        
+        job.update(current_file=os.path.basename(filename), output_path=filename,
+                   message="Download complete!", progress=100)
+        media_cache.add(cache_key, filename)
 
     except Exception as e:
         error_message = str(e).splitlines()[0]
-        if "Download paused" in error_message:
-            download_status['message'] = "Download paused"
-        else:
-            download_status['message'] = f"Error: {error_message}"
+        job.update(state=FAILED, message=f"Error: {error_message}")
     finally:
-        download_status['is_downloading'] = False
+        ydl.close()
+        media_cache.end(cache_key, job)
+
+def download_batch(job, url, quality, mode, download_folder, fragments=None, audio_codecs=None):
+    """
+    Expand a playlist or channel and download all of its entries concurrently
+    """
+    import yt_dlp
+    job.update(message='Expanding playlist...')
+    with yt_dlp.YoutubeDL({'quiet': True, 'extract_flat': 'in_playlist'}) as ydl:
+        info = ydl.extract_info(url, download=False)
+    
+    entries = [entry for entry in info.get('entries') or [] if entry]
+    if not entries:
+        # Not a playlist, download the single video as a batch of one
+        entries = [dict(info, webpage_url=info.get('webpage_url') or url)]
+    if not job.get('title'):
+        job.update(title=info.get('title', ''))
+    
+    archive = DownloadArchive(app.config['DOWNLOAD_ARCHIVE'])
+    run_batch(job, entries,
+              lambda child, entry_url: download_video(child, entry_url, quality, mode, download_folder,
+                                                      fragments=fragments, audio_codecs=audio_codecs),
+              archive, host_limiter, max_workers=app.config['BATCH_MAX_WORKERS'])
+
+def fetch_thumbnail(url):
+    """
+    Fetch a thumbnail from its origin for the thumbnail cache
+    """
+    max_bytes = app.config['THUMBNAIL_MAX_BYTES']
+    # Redirects are followed here so every hop is checked against the allowed hosts
+    for _ in range(app.config['THUMBNAIL_MAX_REDIRECTS'] + 1):
+        response = http_session.get(url, stream=True, allow_redirects=False)
+        if not response.is_redirect:
+            break
+        response.close()
+        url = urljoin(url, response.headers['location'])
+        if not thumbnail_cache.is_allowed(url):
+            raise ValueError("Thumbnail redirects to a host that is not allowed")
+    else:
+        raise ValueError("Too many redirects for thumbnail")
+    with response:
+        response.raise_for_status()
+        data = bytearray()
+        for chunk in response.iter_content(chunk_size=http_session.chunk_size()):
+            data += chunk
+            if len(data) > max_bytes:
+                raise ValueError(f"Thumbnail is larger than {max_bytes} bytes")
+        try:
+            last_modified = parsedate_to_datetime(response.headers['last-modified']).timestamp()
+        except (KeyError, TypeError, ValueError):
+            last_modified = None
+        return bytes(data), response.headers.get('content-type', 'image/jpeg'), last_modified
 
 @app.route('/download_thumbnail_proxy')
 def download_thumbnail_proxy():
     thumbnail_url = request.args.get('url')
     if not thumbnail_url:
         return "Missing URL parameter", 400
+    if not thumbnail_cache.is_allowed(thumbnail_url):
+        return "Thumbnail host is not allowed", 403
 
     try:
-        response = requests.get(thumbnail_url, stream=True)
-        response.raise_for_status() # Raise an exception for bad status codes
-
-        # Get the content type from the original response
-        content_type = response.headers.get('content-type', 'image/jpeg')
-
-        # Create a streaming response to send to the client
-        return Response(response.iter_content(chunk_size=8192),
-                        content_type=content_type,
-                        headers={"Content-Disposition": "attachment; filename=thumbnail.jpg"})
-
-    except requests.exceptions.RequestException as e:
+        entry = thumbnail_cache.get(thumbnail_url, fetch_thumbnail)
+    except (OSError, ValueError) as e:  # requests errors are OSErrors too
         return str(e), 500
 
+    proxy_response = Response(entry.data, content_type=entry.content_type,
+                              headers={"Content-Disposition": "attachment; filename=thumbnail.jpg"})
+    proxy_response.set_etag(entry.etag)
+    proxy_response.last_modified = entry.last_modified
+    proxy_response.cache_control.public = True
+    proxy_response.cache_control.max_age = app.config['THUMBNAIL_CACHE_TTL']
+    # Answers If-None-Match / If-Modified-Since with 304 Not Modified
+    return proxy_response.make_conditional(request)
+
 # --- Routes ---
 @app.route('/')
 def index():
@@ -374,24 +631,61 @@ def fetch_title():
         return jsonify({'success': False, 'title': 'Please enter a video URL', 'thumbnail': None})
     
     try:
-        with yt_dlp.YoutubeDL({'quiet': True, 'extract_flat': 'in_playlist', 'force_generic_extractor': True}) as ydl:
-            info = ydl.extract_info(url, download=False)
-            title = info.get('title', 'No title found')
-            thumbnail = info.get('thumbnail', None)
-            download_status['title'] = title
-            return jsonify({'success': True, 'title': title, 'thumbnail': thumbnail})
+        return jsonify(dict(get_video_title(url), success=True))
     except Exception as e:
         return jsonify({'success': False, 'title': f'Error fetching title: {str(e)}', 'thumbnail': None})
 
+def get_video_title(url):
+    info = extract_video_info(url)
+    return {'title': info.get('title', 'No title found'), 'thumbnail': get_thumbnail_url(info)}
+
+def lookup_title(url):
+    """
+    Title and thumbnail of a video or Instagram post, for /fetch_titles
+    """
+    shortcode = extract_instagram_shortcode(url)
+    if shortcode:
+        return dict(get_instagram_post_info(shortcode), platform='instagram')
+    return dict(get_video_title(url), platform='video')
+
+@app.route('/fetch_titles', methods=['POST'])
+def fetch_titles():
+    """
+    Resolve many URLs concurrently, streaming one JSON line per URL as it finishes
+    
+    `urls` holds the URLs separated by whitespace (a pasted list). Each line
+    carries the `index` of its URL, as lines arrive in the order lookups finish.
+    """
+    urls = (request.form.get('urls') or '').split()
+    max_urls = app.config['FETCH_TITLES_MAX_URLS']
+    if not urls:
+        return jsonify(success=False, message='URLs are required'), 400
+    if len(urls) > max_urls:
+        return jsonify(success=False, message=f'At most {max_urls} URLs per request'), 400
+    
+    def generate():
+        for index, url, result, error in resolve_all(urls, lookup_title,
+                                                     max_workers=app.config['FETCH_TITLES_WORKERS'],
+                                                     timeout=app.config['FETCH_TITLES_TIMEOUT']):
+            if error is None:
+                line = dict(result, index=index, url=url, success=True)
+            else:
+                detail = (str(error) or type(error).__name__).splitlines()[0]
+                line = {'index': index, 'url': url, 'success': False, 'message': f'Error fetching title: {detail}'}
+            yield json.dumps(line) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/start_download', methods=['POST'])
 def start_download():
-    global download_status
-    
     url = request.form.get('url')
     quality = request.form.get('quality')
     mode = request.form.get('mode')
     download_folder = request.form.get('download_folder')
     platform = request.form.get('platform')
+    title = request.form.get('title', '')
+    fragments = request.form.get('fragments')
     
     if not url:
         return jsonify(success=False, message='URL is required')
@@ -403,28 +697,47 @@ def start_download():
 
     if platform != 'other':
         try:
-            with yt_dlp.YoutubeDL({'quiet': True, 'extract_flat': 'in_playlist', 'force_generic_extractor': True}) as ydl:
-                info = ydl.extract_info(url, download=False)
-                extractor = info.get('extractor_key', '').lower()
-                if platform.lower() not in extractor:
-                    return jsonify(success=False, message=f"The URL is not a valid {platform} link.")
+            info = extract_video_info(url)
+            extractor = (info.get('extractor_key') or info.get('ie_key') or '').lower()
+            if platform.lower() not in extractor:
+                return jsonify(success=False, message=f"The URL is not a valid {platform} link.")
         except Exception as e:
             return jsonify(success=False, message=f"Error verifying URL: {str(e)}")
 
-    if download_status['is_downloading']:
-        return jsonify(success=False, message='Another download is already in progress')
+    job = job_manager.submit('video', download_video, title=title, url=url, quality=quality, mode=mode,
+                             download_folder=download_folder, platform=platform,
+                             fragments=get_fragment_concurrency(fragments),
+                             audio_codecs=parse_audio_codecs(request.form.get('audio_codecs')))
+    
+    return jsonify(success=True, job_id=job.id)
+
+
+@app.route('/start_batch', methods=['POST'])
+def start_batch():
+    url = request.form.get('url')
+    quality = request.form.get('quality')
+    mode = request.form.get('mode')
+    download_folder = request.form.get('download_folder', app.config['DOWNLOAD_FOLDER'])
+    
+    if not url:
+        return jsonify(success=False, message='URL is required')
+    
+    try:
+        download_folder = secure_path(download_folder)
+    except ValueError as e:
+        return jsonify(success=False, message=str(e))
     
-    download_status['download_thread'] = threading.Thread(
-        target=download_video, 
-        args=(url, quality, mode, download_folder, platform)
-    )
-    download_status['download_thread'].start()
+    job = job_manager.submit('batch', download_batch, title=request.form.get('title', ''),
+                             url=url, quality=quality, mode=mode, download_folder=download_folder,
+                             fragments=get_fragment_concurrency(request.form.get('fragments')),
+                             audio_codecs=parse_audio_codecs(request.form.get('audio_codecs')))
     
-    return jsonify(success=True)
+    return jsonify(success=True, job_id=job.id)
 
 
 @app.route('/download_thumbnail', methods=['POST'])
 def download_thumbnail():
+    import yt_dlp
     url = request.form.get('url')
     download_folder = request.form.get('download_folder', app.config['DOWNLOAD_FOLDER'])
 
@@ -443,30 +756,171 @@ def download_thumbnail():
             }],
         }
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.extract_info(url, download=True)
+            ydl.process_ie_result(extract_video_info(url), download=True)
         
         return jsonify(success=True, message='Thumbnail downloaded successfully!')
     except Exception as e:
         return jsonify(success=False, message=f'Error downloading thumbnail: {str(e)}')
 
 
+def find_job(job_id):
+    """
+    Return the job with the given ID, or the latest job when no ID is given
+    """
+    if job_id:
+        return job_manager.get(job_id)
+    return job_manager.latest()
+
 @app.route('/toggle_pause', methods=['POST'])
 def toggle_pause():
-    download_status['is_paused'] = not download_status['is_paused']
-    if download_status['is_paused']:
-        return jsonify({'success': True, 'is_paused': True, 'message': 'Download paused'})
+    job_id = request.form.get('job_id') or request.args.get('job_id')
+    job = find_job(job_id)
+    if not job and job_id:
+        return toggle_pause_elsewhere(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Download job not found'})
+    
+    if job.is_finished:
+        return jsonify({'success': False, 'job_id': job.id, 'message': 'Download already finished'})
+    
+    if not job.get('is_paused'):
+        job.pause()
+        return jsonify({'success': True, 'job_id': job.id, 'is_paused': True, 'message': 'Download paused'})
     else:
-        return jsonify({'success': True, 'is_paused': False, 'message': 'Download resumed'})
+        job.resume()
+        return jsonify({'success': True, 'job_id': job.id, 'is_paused': False, 'message': 'Download resumed'})
+
+def toggle_pause_elsewhere(job_id):
+    """
+    Pause or resume a job running in another worker process through the job store
+    """
+    row = job_store.get(job_id)
+    if not row:
+        return jsonify({'success': False, 'message': 'Download job not found'})
+    action = 'resume' if row['paused'] else 'pause'
+    if not job_store.request_control(job_id, action):
+        return jsonify({'success': False, 'job_id': job_id, 'message': 'Download already finished'})
+    paused = action == 'pause'
+    return jsonify({'success': True, 'job_id': job_id, 'is_paused': paused,
+                    'message': 'Download paused' if paused else 'Download resumed'})
 
 @app.route('/get_status', methods=['GET'])
 def get_status():
+    job_id = request.args.get('job_id')
+    job = find_job(job_id)
+    if not job:
+        if job_id:
+            # Jobs from before a restart are only known to the job store
+            row = job_store.get(job_id)
+            if row:
+                return jsonify(stored_job_status(row))
+            return jsonify(dict(IDLE_STATUS, job_id=job_id, message='Download job not found')), 404
+        return jsonify(IDLE_STATUS)
+    return jsonify(job.snapshot())
+
+def stored_job_status(row):
+    """
+    Convert a job store row to the status format of `/get_status`
+    """
+    return dict(IDLE_STATUS,
+                job_id=row['job_id'],
+                kind=row['kind'],
+                state=row['state'],
+                progress=row['progress'],
+                message=row['message'],
+                title=row['title'] or '',
+                is_paused=bool(row['paused']),
+                is_downloading=row['state'] == 'running',
+                url=row['url'],
+                current_file=os.path.basename(row['output_path']) if row['output_path'] else None,
+                downloaded_bytes=row['bytes_done'],
+                total_bytes=row['total_bytes'],
+                created_at=row['created_at'],
+                started_at=row['started_at'],
+                finished_at=row['finished_at'])
+
+@app.route('/history', methods=['GET'])
+def history():
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+    rows, total = job_store.history(page=page, per_page=per_page, state=request.args.get('state'))
+    return jsonify({
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'items': [stored_job_status(row) for row in rows]
+    })
+
+@app.route('/events/<job_id>')
+def job_events(job_id):
+    """
+    Stream status updates of a job as Server-Sent Events
+    
+    `/get_status` stays available as a polling fallback.
+    """
+    job = job_manager.get(job_id)
+    if not job:
+        if job_store.get(job_id):
+            return stored_job_events(job_id)
+        return jsonify(dict(IDLE_STATUS, job_id=job_id, message='Download job not found')), 404
+    
+    min_interval = 1.0 / app.config['SSE_MAX_UPDATES_PER_SECOND']
+    keepalive = app.config['SSE_KEEPALIVE']
+    
+    def generate():
+        while True:
+            version = job.version
+            yield f"data: {json.dumps(job.snapshot())}\n\n"
+            if job.is_finished:
+                break
+            # Coalesce bursts of progress_hook calls into at most one event per interval
+            time.sleep(min_interval)
+            while job.wait_for_change(version, timeout=keepalive) == version:
+                yield ": keep-alive\n\n"
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def stored_job_events(job_id):
+    """
+    Stream a job that runs in another worker process by polling the job store
+    """
+    interval = app.config['JOB_STORE_FLUSH_INTERVAL']
+    
+    def generate():
+        last = None
+        while True:
+            row = job_store.get(job_id)
+            status = stored_job_status(row)
+            if status != last:
+                yield f"data: {json.dumps(status)}\n\n"
+                last = status
+            else:
+                yield ": keep-alive\n\n"
+            if row['state'] not in ('queued', 'running'):
+                break
+            time.sleep(interval)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({'info_cache': info_cache.stats(), 'media_cache': media_cache.stats(),
+                    'thumbnail_cache': thumbnail_cache.stats(), 'instagram': instagram_pool.stats() if instagram_pool else None,
+                    'instagram_posts': instagram_post_cache.stats() if instagram_post_cache else None})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
     return jsonify({
-        'is_downloading': download_status['is_downloading'],
-        'is_paused': download_status['is_paused'],
-        'progress': download_status['progress'],
-        'message': download_status['message'],
-        'current_file': download_status['current_file'],
-        'title': download_status['title']
+        'queued': job_manager.queue_size(),
+        'max_workers': job_manager.max_workers,
+        'stages': job_manager.stats(),
+        'jobs': [job.snapshot() for job in reversed(job_manager.jobs())]
     })
 
 @app.route('/open_folder', methods=['POST'])
@@ -487,77 +941,52 @@ def open_folder():
     except Exception as e:
         return jsonify({'success': False, 'message': f'Could not open folder: {str(e)}'})
 
-@app.route('/downloads/<filename>')
+@app.route('/downloads/<path:filename>', methods=['GET', 'HEAD'])
 def download_file(filename):
-    return send_from_directory(app.config['DOWNLOAD_FOLDER'], filename, as_attachment=True)
+    root = os.path.abspath(app.config['DOWNLOAD_FOLDER'])
+    path = safe_join(root, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    return serve_file(request.environ, path, download_name=os.path.basename(path), mode=app.config['SERVE_MODE'],
+                      root=root, accel_prefix=app.config['SERVE_ACCEL_PREFIX'])
 
 @app.route('/get_device_id', methods=['GET'])
 def get_device_id_route():
-    return jsonify({'device_id': DEVICE_ID})
+    return jsonify({'device_id': get_device_id()})
 
 # --- Instagram Download Functions ---
-def download_instagram_media(url, download_folder):
+def get_instagram_pool():
     """
-    Download photos/videos from Instagram posts, reels, or stories
+    Return the shared Instaloader pool, created on first use since importing instaloader is slow
     """
-    try:
-        # Create an Instaloader instance
-        L = instaloader.Instaloader(
-            download_pictures=True,
-            download_videos=True,
-            download_video_thumbnails=False,
-            download_geotags=False,
-            download_comments=False,
-            save_metadata=False,
-            compress_json=False,
-            dirname_pattern=download_folder,
-            filename_pattern='{date_utc}_UTC_{typename}',
-        )
-        
-        # Extract shortcode from URL
-        shortcode = extract_instagram_shortcode(url)
-        if not shortcode:
-            return {'success': False, 'message': 'Invalid Instagram URL'}
-        
-        # Get the post
-        post = instaloader.Post.from_shortcode(L.context, shortcode)
-        
-        # Download the post
-        L.download_post(post, target=download_folder)
-        
-        # Get downloaded files
-        downloaded_files = []
-        for file in os.listdir(download_folder):
-            if file.startswith(post.date_utc.strftime('%Y-%m-%d_%H-%M-%S')):
-                downloaded_files.append(file)
-        
-        return {
-            'success': True, 
-            'message': f'Downloaded {len(downloaded_files)} file(s) successfully!',
-            'files': downloaded_files,
-            'caption': post.caption if post.caption else 'No caption'
-        }
-        
-    except Exception as e:
-        return {'success': False, 'message': f'Error: {str(e)}'}
+    global instagram_pool
+    if instagram_pool is None:
+        with instagram_pool_lock:
+            if instagram_pool is None:
+                from instagram_pool import InstaloaderPool
+                instagram_pool = InstaloaderPool(INSTAGRAM_CONFIG)
+    return instagram_pool
 
-def extract_instagram_shortcode(url):
+def get_subfolder_format():
     """
-    Extract shortcode from various Instagram URL formats
+    Subfolder of the download folder for new files, None to write into it directly
     """
-    patterns = [
-        r'instagram\.com/p/([^/?]+)',
-        r'instagram\.com/reel/([^/?]+)',
-        r'instagram\.com/tv/([^/?]+)',
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
-    
+    if DOWNLOAD_SETTINGS.get('create_subfolders'):
+        return DOWNLOAD_SETTINGS.get('subfolder_format') or '{platform}'
     return None
 
+def download_instagram_media(job, url, download_folder):
+    """
+    Download photos/videos from Instagram posts, reels, or stories
+    """
+    transfer = metrics.TransferMetrics('Instagram', 'instagram')
+    with get_instagram_pool().loader() as loader:
+        download_instagram_post(job, loader, url, download_folder,
+                                max_workers=app.config['INSTAGRAM_MAX_WORKERS'], cache=instagram_post_cache,
+                                subfolder_format=get_subfolder_format())
+    paths = [os.path.join(download_folder, name) for name in job.get('files') or []]
+    transfer.finish(sum(os.path.getsize(path) for path in paths if os.path.isfile(path)))
+
 @app.route('/download_instagram', methods=['POST'])
 def download_instagram():
     url = request.form.get('url')
@@ -570,23 +999,49 @@ def download_instagram():
     if 'instagram.com' not in url:
         return jsonify({'success': False, 'message': 'Please provide a valid Instagram URL'})
     
+    if not extract_instagram_shortcode(url):
+        return jsonify({'success': False, 'message': 'Invalid Instagram URL'})
+    
     try:
         download_folder = secure_path(download_folder)
     except ValueError as e:
         return jsonify({'success': False, 'message': str(e)})
     
-    # Download in a separate thread to avoid blocking
-    def download_thread():
-        result = download_instagram_media(url, download_folder)
-        # Store result for the next status check
-        download_status['instagram_result'] = result
+    # Download in the background, the client follows the job like a video download
+    job = job_manager.submit('instagram', download_instagram_media, url=url, download_folder=download_folder)
+    return jsonify({'success': True, 'job_id': job.id, 'message': 'Download started'})
+
+def download_direct(job, url, path):
+    """
+    Download a direct media link, continuing from the .part file after a restart
+    """
+    try:
+        download_url(url, path, job=job, segments=app.config['DIRECT_DOWNLOAD_SEGMENTS'],
+                     min_segment_size=app.config['DIRECT_DOWNLOAD_MIN_SEGMENT'])
+    except Exception:
+        # Only an interrupted server keeps the .part file to resume from
+        remove_partial(path)
+        raise
+    job.update(current_file=os.path.basename(path), output_path=path,
+               message="Download complete!", progress=100)
+
+@app.route('/start_direct_download', methods=['POST'])
+def start_direct_download():
+    url = request.form.get('url')
+    download_folder = request.form.get('download_folder', app.config['DOWNLOAD_FOLDER'])
+    filename = secure_filename(request.form.get('filename', '')) or filename_from_url(url or '')
+    
+    if not url or not url.startswith(('http://', 'https://')):
+        return jsonify(success=False, message='A http(s) URL is required')
     
-    thread = threading.Thread(target=download_thread)
-    thread.start()
-    thread.join()  # Wait for download to complete
+    try:
+        download_folder = secure_path(download_folder)
+    except ValueError as e:
+        return jsonify(success=False, message=str(e))
     
-    result = download_status.get('instagram_result', {'success': False, 'message': 'Unknown error'})
-    return jsonify(result)
+    path = reserve_path(download_folder, filename)
+    job = job_manager.submit('direct', download_direct, title=os.path.basename(path), url=url, path=path)
+    return jsonify(success=True, job_id=job.id)
 
 @app.route('/download_instagram_single', methods=['POST'])
 def download_instagram_single():
@@ -601,24 +1056,23 @@ def download_instagram_single():
     try:
         download_folder = secure_path(download_folder)
         
-        # Generate filename
+        # Generate filename, a second download in the same second gets "(1)" appended
         timestamp = time.strftime('%Y%m%d_%H%M%S')
         ext = 'mp4' if media_type == 'video' else 'jpg'
-        filename = f'instagram_{timestamp}.{ext}'
-        filepath = os.path.join(download_folder, filename)
+        filepath = reserve_path(download_folder, f'instagram_{timestamp}.{ext}')
         
         # Download the media
-        response = requests.get(media_url, stream=True)
-        response.raise_for_status()
-        
-        with open(filepath, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        try:
+            download_url(media_url, filepath, segments=app.config['DIRECT_DOWNLOAD_SEGMENTS'],
+                         min_segment_size=app.config['DIRECT_DOWNLOAD_MIN_SEGMENT'])
+        except Exception:
+            remove_partial(filepath)
+            raise
         
         return jsonify({
             'success': True,
             'message': 'Media downloaded successfully!',
-            'filename': filename
+            'filename': os.path.basename(filepath)
         })
         
     except Exception as e:
@@ -640,45 +1094,84 @@ def fetch_instagram_info():
         if not shortcode:
             return jsonify({'success': False, 'message': 'Invalid Instagram URL'})
         
-        # Create Instaloader instance
-        L = instaloader.Instaloader()
-        
-        # Get post info
-        post = instaloader.Post.from_shortcode(L.context, shortcode)
-        
-        # Get all media URLs (for carousel posts)
-        media_items = []
-        if post.typename == 'GraphSidecar':  # Carousel post
-            for node in post.get_sidecar_nodes():
-                media_items.append({
-                    'url': node.video_url if node.is_video else node.display_url,
-                    'is_video': node.is_video,
-                    'type': 'video' if node.is_video else 'image'
-                })
-        else:
-            # Single post
-            media_items.append({
-                'url': post.video_url if post.is_video else post.url,
-                'is_video': post.is_video,
-                'type': 'video' if post.is_video else 'image'
-            })
-        
-        return jsonify({
-            'success': True,
-            'title': post.caption[:100] + '...' if post.caption and len(post.caption) > 100 else (post.caption or 'Instagram Post'),
-            'thumbnail': post.url,
-            'owner': post.owner_username,
-            'likes': post.likes,
-            'is_video': post.is_video,
-            'media_count': len(media_items),
-            'media_items': media_items,
-            'typename': post.typename
-        })
+        return jsonify(dict(get_instagram_post_info(shortcode), success=True))
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error fetching Instagram info: {str(e)}'})
 
+def get_instagram_post_info(shortcode):
+    # Get post info with a shared Instaloader instance
+    # The post is cached so the download that follows doesn't fetch it again
+    with get_instagram_pool().loader() as L:
+        post, media_items = load_post(L, shortcode, instagram_post_cache)
+    
+    return {
+        'title': post.caption[:100] + '...' if post.caption and len(post.caption) > 100 else (post.caption or 'Instagram Post'),
+        'thumbnail': post.url,
+        'owner': post.owner_username,
+        'likes': post.likes,
+        'is_video': post.is_video,
+        'media_count': len(media_items),
+        'media_items': media_items,
+        'typename': post.typename
+    }
+
+# Functions that can be resumed from the job store after a restart
+JOB_TARGETS = {
+    'video': download_video,
+    'batch': download_batch,
+    'instagram': download_instagram_media,
+    'direct': download_direct,
+}
+
+def resume_unfinished_jobs():
+    """
+    Queue again the jobs that were queued or running when the server stopped
+    
+    Partial downloads continue from their .part files. With several worker
+    processes every job is claimed in the job store first, so only one of
+    them resumes it.
+    """
+    resumed = 0
+    for row in job_store.unfinished():
+        target = JOB_TARGETS.get(row['kind'])
+        if target is None or not job_store.claim(row['job_id']):
+            continue
+        job_manager.submit(row['kind'], target, title=row['title'] or '', job_id=row['job_id'], **row['options'])
+        resumed += 1
+    if resumed:
+        logger.info('Resumed unfinished downloads', extra={'count': resumed})
+    return resumed
+
+def warm_up():
+    """
+    Load the extractors and run the one-time lookups in a background thread
+    
+    The server starts without waiting for them, and the first download
+    doesn't pay for them either.
+    """
+    def run():
+        started = time.time()
+        import yt_dlp
+        yt_dlp.YoutubeDL({'quiet': True}).close()
+        # Imported only to load it now, tagging imports it again when needed
+        importlib.import_module('mutagen.mp3')
+        get_instagram_pool()
+        http_session.get_session()
+        get_ffmpeg_location()
+        get_device_id()
+        logger.info('Ready for downloads', extra={'warm_up_seconds': round(time.time() - started, 1)})
+    
+    thread = threading.Thread(target=run, daemon=True, name='warm-up')
+    thread.start()
+    return thread
+
 # --- Main ---
 if __name__ == '__main__':
+    configure_logging(LOGGING_CONFIG, app.root_path)
     create_download_folder()
+    # The debug reloader runs this block in two processes, only resume jobs in the serving one
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        resume_unfinished_jobs()
+        warm_up()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,122 @@
+"""
+Batch downloads of playlists and channels.
+
+A batch job expands a playlist into flat entries and downloads them
+concurrently as child jobs. Downloads per host are limited so a large
+playlist can't flood a single site, and entries already listed in the
+download archive are skipped.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from jobs import Job, FINISHED, FAILED, SKIPPED
+
+
+class HostLimiter:
+    """
+    Limit the number of concurrent downloads per host
+    """
+
+    def __init__(self, per_host=4):
+        self.per_host = per_host
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, url):
+        host = urlsplit(url).hostname or ''
+        if host.startswith('www.'):
+            host = host[4:]
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = self._semaphores[host] = threading.BoundedSemaphore(self.per_host)
+        with semaphore:
+            yield
+
+
+class DownloadArchive:
+    """
+    Record of finished downloads in yt-dlp's `download_archive` format
+
+    Each line is "<extractor> <video id>", so the same file can be passed to
+    yt-dlp's own --download-archive option.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._ids = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self._ids = {line.strip() for line in f if line.strip()}
+
+    @staticmethod
+    def make_id(entry):
+        extractor = entry.get('ie_key') or entry.get('extractor_key')
+        video_id = entry.get('id')
+        if not extractor or not video_id:
+            return None
+        return f'{extractor.lower()} {video_id}'
+
+    def __contains__(self, archive_id):
+        with self._lock:
+            return archive_id in self._ids
+
+    def add(self, archive_id):
+        with self._lock:
+            if archive_id in self._ids:
+                return
+            self._ids.add(archive_id)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(archive_id + '\n')
+
+
+def entry_url(entry):
+    """
+    Return the URL of a flat playlist entry
+    """
+    return entry.get('webpage_url') or entry.get('url')
+
+
+def run_batch(job, entries, download_entry, archive, host_limiter, max_workers=8):
+    """
+    Download `entries` as child jobs of `job` using `download_entry(child, url)`
+    """
+    tasks = []
+    for entry in entries:
+        url = entry_url(entry)
+        if not url:
+            continue
+        child = job.add_child(Job('video', title=entry.get('title') or ''))
+        child.update(url=url)
+        tasks.append((child, url, DownloadArchive.make_id(entry)))
+
+    job.update(message=f'Downloading {len(tasks)} entries...')
+
+    def run_entry(child, url, archive_id):
+        # Entries that haven't started yet wait while the batch is paused
+        job.wait_while_paused()
+        if archive_id and archive_id in archive:
+            child.update(state=SKIPPED, progress=100, message='Already downloaded')
+            return
+        # An entry paused on its own starts once it is resumed
+        child.wait_while_paused()
+        with host_limiter.slot(url):
+            child.run(download_entry, url)
+        # The entry may still be converting in the post-processing stage
+        child.wait_until_finished()
+        if archive_id and child.get('state') == FINISHED:
+            archive.add(archive_id)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'batch-{job.id[:8]}') as pool:
+        for task in tasks:
+            pool.submit(run_entry, *task)
+
+    counts = job.snapshot().get('counts', {})
+    job.update(message=(
+        f"Batch complete: {counts.get(FINISHED, 0)} downloaded, "
+        f"{counts.get(SKIPPED, 0)} skipped, {counts.get(FAILED, 0)} failed"))
@@ -0,0 +1,360 @@
+"""
+Benchmark: the whole app end to end, offline, at rising concurrency.
+
+Starts a local origin serving a progressive MP4, an HLS playlist, a large
+file downloaded with ranged requests and thumbnails, replaces Instagram
+with a stub that builds posts from local data, and runs the app on a
+threaded server in the same process. Clients then go through the routes
+a browser uses: `/start_download`, `/start_direct_download` and
+`/download_instagram` followed by `/get_status` polling until the job is
+finished, and `/download_thumbnail_proxy`.
+
+For every scenario and concurrency level it reports jobs/sec, p50 and p99
+latency (submit to finished), bytes/sec and the peak RSS of the process
+(app, origin and clients together). The numbers are compared with
+benchmarks/e2e_baseline.json, made on the same machine with --update.
+
+Usage:
+    python benchmarks/bench_end_to_end.py [--levels 1 2 4 8] [--jobs 4] [--latency 0.02]
+                                          [--scenarios video hls ranged instagram thumbnail]
+                                          [--tolerance 0.5] [--update]
+
+Exits with 1 when a job fails or a result is worse than the baseline by
+more than the tolerance.
+"""
+import argparse
+import contextlib
+import functools
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, 'benchmarks', 'e2e_baseline.json')
+SCENARIOS = ('video', 'hls', 'ranged', 'instagram', 'thumbnail')
+RANGE = re.compile(r'bytes=(\d+)-(\d*)$')
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# --- Local origin ---
+class _Slice:
+    """Read at most `length` bytes of an open file"""
+
+    def __init__(self, f, length):
+        self.f = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.f.close()
+
+
+class OriginHandler(SimpleHTTPRequestHandler):
+    """Static files with single byte ranges and a fixed latency, like a CDN"""
+
+    latency = 0.02
+
+    def send_head(self):
+        time.sleep(self.latency)
+        path = self.translate_path(self.path)
+        match = RANGE.match(self.headers.get('Range', ''))
+        if not match or not os.path.isfile(path):
+            return super().send_head()
+        size = os.path.getsize(path)
+        start = int(match.group(1))
+        end = min(int(match.group(2) or size - 1), size - 1)
+        if start >= size:
+            self.send_error(416)
+            return None
+        f = open(path, 'rb')
+        f.seek(start)
+        self.send_response(206)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Last-Modified', self.date_time_string(os.path.getmtime(path)))
+        self.end_headers()
+        return _Slice(f, end - start + 1)
+
+    def end_headers(self):
+        self.send_header('Accept-Ranges', 'bytes')
+        super().end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class OriginServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # Clients close the connection after probing a range
+
+
+def make_fixture(folder, video_size, ranged_size, segments, segment_size):
+    def write(name, size):
+        with open(os.path.join(folder, name), 'wb') as f:
+            f.write(os.urandom(size))
+
+    write('clip.mp4', video_size)
+    write('large.mp4', ranged_size)
+    write('thumb.jpg', 32 * 1024)
+    for number in range(1, 4):
+        write(f'ig{number}.jpg', 256 * 1024)
+    os.makedirs(os.path.join(folder, 'hls'))
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:2', '#EXT-X-MEDIA-SEQUENCE:0']
+    for i in range(segments):
+        write(os.path.join('hls', f'seg{i:04d}.ts'), segment_size)
+        lines += ['#EXTINF:2.000,', f'seg{i:04d}.ts']
+    lines.append('#EXT-X-ENDLIST')
+    with open(os.path.join(folder, 'hls', 'index.m3u8'), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def start_origin(folder, latency):
+    OriginHandler.latency = latency
+    server = OriginServer(('127.0.0.1', 0), functools.partial(OriginHandler, directory=folder))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+# --- App ---
+def start_app(folder, origin):
+    """
+    Import the app configured for the benchmark, with the stub Instagram backend
+    """
+    os.environ['DOWNLOADER_DOWNLOAD_FOLDER'] = os.path.join(folder, 'downloads')
+    os.environ['DOWNLOADER_THUMBNAIL_CACHE_FOLDER'] = os.path.join(folder, 'thumbnails')
+    os.environ['DOWNLOADER_THUMBNAIL_ALLOWED_HOSTS'] = '["127.0.0.1"]'
+    sys.path.insert(0, ROOT)
+    logging.basicConfig(level=logging.ERROR)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    import app as downloader
+    import instagram_downloader
+    from werkzeug.serving import make_server
+
+    def stub_post(loader, shortcode):
+        # A carousel of three local images, each shortcode gets its own timestamp (and file names)
+        import instaloader
+        loader.context.quiet = True
+        number = int(shortcode.rsplit('x', 1)[-1])
+        node = {
+            'shortcode': shortcode,
+            '__typename': 'GraphSidecar',
+            'taken_at_timestamp': 1700000000 + number,
+            'edge_media_to_caption': {'edges': [{'node': {'text': f'Benchmark post {number}'}}]},
+            'owner': {'id': '1', 'username': 'benchmark'},
+            'edge_sidecar_to_children': {'edges': [
+                {'node': {'__typename': 'GraphImage', 'is_video': False, 'display_url': f'{origin}/ig{i}.jpg'}}
+                for i in range(1, 4)]},
+        }
+        return instaloader.Post(loader.context, node)
+
+    instagram_downloader.get_post = stub_post
+    downloader.instagram_post_cache = None  # Every post goes through the stub
+    downloader.create_download_folder()
+    server = make_server('127.0.0.1', 0, downloader.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}', downloader.app.config['DOWNLOAD_FOLDER']
+
+
+# --- Clients ---
+def wait_for_job(session, app_url, job_id, download_folder):
+    """
+    Poll /get_status like the page does, return (succeeded, bytes written)
+    """
+    while True:
+        status = session.get(f'{app_url}/get_status', params={'job_id': job_id}).json()
+        if status.get('state') in ('finished', 'failed', 'skipped'):
+            break
+        time.sleep(0.02)
+    if status['state'] != 'finished':
+        return False, 0
+    paths = [os.path.join(download_folder, name) for name in status.get('files') or []]
+    if not paths and status.get('output_path'):
+        paths = [status['output_path']]
+    return True, sum(os.path.getsize(path) for path in paths if os.path.isfile(path))
+
+
+def run_job(scenario, number, session, app_url, origin, download_folder):
+    if scenario == 'thumbnail':
+        response = session.get(f'{app_url}/download_thumbnail_proxy',
+                               params={'url': f'{origin}/thumb.jpg?n={number}'})
+        return response.status_code == 200, len(response.content)
+
+    if scenario == 'video':
+        result = session.post(f'{app_url}/start_download', data={
+            'url': f'{origin}/clip.mp4?n={number}', 'quality': 'best', 'mode': 'Video', 'platform': 'other',
+            'title': f'video-{number}', 'download_folder': download_folder}).json()
+    elif scenario == 'hls':
+        result = session.post(f'{app_url}/start_download', data={
+            'url': f'{origin}/hls/index.m3u8?n={number}', 'quality': 'best', 'mode': 'Video',
+            'platform': 'other', 'title': f'hls-{number}', 'download_folder': download_folder}).json()
+    elif scenario == 'ranged':
+        result = session.post(f'{app_url}/start_direct_download', data={
+            'url': f'{origin}/large.mp4?n={number}', 'filename': f'ranged-{number}.mp4',
+            'download_folder': download_folder}).json()
+    else:
+        result = session.post(f'{app_url}/download_instagram', data={
+            'url': f'https://www.instagram.com/p/BENCHx{number}/', 'download_folder': download_folder}).json()
+    if not result.get('success'):
+        return False, 0
+    return wait_for_job(session, app_url, result['job_id'], download_folder)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_level(scenario, concurrency, jobs, app_url, origin, download_folder, first_number):
+    import requests
+    local = threading.local()
+
+    def client(number):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        succeeded, size = run_job(scenario, number, local.session, app_url, origin, download_folder)
+        return succeeded, size, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(client, range(first_number, first_number + jobs)))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for _, _, latency in results]
+    return {
+        'jobs': jobs,
+        'failed': sum(1 for succeeded, _, _ in results if not succeeded),
+        'jobs_per_sec': round(jobs / elapsed, 2),
+        'p50_ms': round(statistics.median(latencies) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'bytes_per_sec': round(sum(size for _, size, _ in results) / elapsed),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return the regressions of results against the baseline results
+    """
+    problems = []
+    for key, result in results.items():
+        if result['failed']:
+            problems.append(f"{key}: {result['failed']} of {result['jobs']} job(s) failed")
+        old = baseline.get(key)
+        if not old:
+            continue
+        if result['jobs_per_sec'] < old['jobs_per_sec'] * (1 - tolerance):
+            problems.append(f"{key}: {result['jobs_per_sec']} jobs/s, baseline {old['jobs_per_sec']}")
+        if result['p99_ms'] > old['p99_ms'] * (1 + tolerance):
+            problems.append(f"{key}: p99 {result['p99_ms']} ms, baseline {old['p99_ms']}")
+        if result['peak_rss_mb'] and old.get('peak_rss_mb') and result['peak_rss_mb'] > old['peak_rss_mb'] * (1 + tolerance):
+            problems.append(f"{key}: peak RSS {result['peak_rss_mb']} MB, baseline {old['peak_rss_mb']}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 2, 4, 8], help='concurrent clients')
+    parser.add_argument('--jobs', type=int, default=4, help='jobs per client at every level')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds the origin adds to every request')
+    parser.add_argument('--video-size', type=int, default=4 * 1024 * 1024)
+    parser.add_argument('--ranged-size', type=int, default=16 * 1024 * 1024)
+    parser.add_argument('--segments', type=int, default=20)
+    parser.add_argument('--segment-size', type=int, default=128 * 1024)
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed regression, 0.5 = 50%%')
+    parser.add_argument('--update', action='store_true', help='save the result as the new baseline')
+    args = parser.parse_args()
+    settings = {key: getattr(args, key) for key in ('jobs', 'latency', 'video_size', 'ranged_size',
+                                                    'segments', 'segment_size')}
+
+    folder = tempfile.mkdtemp(prefix='e2e-bench-')
+    try:
+        fixture = os.path.join(folder, 'origin')
+        os.makedirs(fixture)
+        make_fixture(fixture, args.video_size, args.ranged_size, args.segments, args.segment_size)
+        origin_server, origin = start_origin(fixture, args.latency)
+        app_server, app_url, download_folder = start_app(folder, origin)
+
+        # One unmeasured job per scenario, the first one also pays for the lazy imports
+        number = 0
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for scenario in args.scenarios:
+                run_level(scenario, 1, 1, app_url, origin, download_folder, number)
+                number += 1
+
+        results = {}
+        print(f"{'scenario':<10} {'clients':>7} {'jobs/s':>8} {'p50 ms':>9} {'p99 ms':>9} "
+              f"{'MB/s':>8} {'RSS MB':>8} {'failed':>6}")
+        for concurrency in args.levels:
+            for scenario in args.scenarios:
+                jobs = concurrency * args.jobs
+                # yt-dlp prints its progress bars even when quiet
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    result = run_level(scenario, concurrency, jobs, app_url, origin, download_folder, number)
+                number += jobs
+                results[f'{scenario}@{concurrency}'] = result
+                print(f"{scenario:<10} {concurrency:>7} {result['jobs_per_sec']:>8.2f} {result['p50_ms']:>9.1f} "
+                      f"{result['p99_ms']:>9.1f} {result['bytes_per_sec'] / 1024 / 1024:>8.1f} "
+                      f"{result['peak_rss_mb'] or 0:>8.1f} {result['failed']:>6}")
+        app_server.shutdown()
+        origin_server.shutdown()
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    if args.update:
+        with open(BASELINE, 'w') as f:
+            json.dump({'settings': settings, 'results': results}, f, indent=2)
+            f.write('\n')
+        print(f"✅ Baseline saved to {os.path.relpath(BASELINE, ROOT)}")
+        return 0
+
+    if not os.path.exists(BASELINE):
+        print('⚠️ No baseline yet, run with --update to save one')
+        baseline = {'settings': settings, 'results': {}}
+    else:
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+    if baseline['settings'] != settings:
+        print('⚠️ Settings differ from the baseline, only failures are checked')
+        baseline['results'] = {}
+    problems = compare(results, baseline['results'], args.tolerance)
+    for problem in problems:
+        print(f"❌ {problem}")
+    if not problems:
+        print(f"✅ No job failed and every result is within {args.tolerance:.0%} of the baseline")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
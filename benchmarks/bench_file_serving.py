@@ -0,0 +1,173 @@
+"""
+Benchmark: serving finished downloads, MB/s and server CPU per GB.
+
+Serves one large file from a child server process through the old route
+(`send_from_directory`) and the new one (`file_serving.serve_file`), under
+the Flask development server and under gunicorn. Each case downloads the
+whole file and then the same file as 4 ranged requests (like a player
+seeking or a download manager), and reports throughput and the CPU time
+the server process tree used per GB sent. Linux only (reads /proc).
+
+Usage:
+    python benchmarks/bench_file_serving.py [--size-mb 256] [--rounds 3]
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_app(folder):
+    from flask import Flask, request, send_from_directory
+    from file_serving import serve_file
+
+    app = Flask(__name__)
+
+    @app.route('/old/<path:filename>')
+    def old(filename):
+        return send_from_directory(folder, filename, as_attachment=True)
+
+    @app.route('/new/<path:filename>')
+    def new(filename):
+        return serve_file(request.environ, os.path.join(folder, filename), download_name=filename)
+
+    return app
+
+
+def serve(server, folder, port):
+    app = make_app(folder)
+    if server == 'werkzeug':
+        app.run(host='127.0.0.1', port=port, threaded=True)
+        return
+
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'127.0.0.1:{port}')
+            self.cfg.set('workers', 1)
+            self.cfg.set('threads', 4)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('loglevel', 'warning')
+
+        def load(self):
+            return app
+
+    Server().run()
+
+
+def tree_cpu_seconds(pid):
+    """
+    CPU time of pid and all of its descendants
+    """
+    ticks = os.sysconf('SC_CLK_TCK')
+    stats = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+            except OSError:
+                continue
+            stats[int(entry)] = (int(fields[1]), int(fields[11]) + int(fields[12]))
+    total, todo = 0, [pid]
+    while todo:
+        current = todo.pop()
+        total += stats.get(current, (0, 0))[1]
+        todo.extend(child for child, (parent, _) in stats.items() if parent == current)
+    return total / ticks
+
+
+def wait_for_port(port, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start')
+
+
+def fetch(url, size, ranged):
+    session = requests.Session()
+    if not ranged:
+        with session.get(url, stream=True) as response:
+            received = sum(len(chunk) for chunk in response.iter_content(1024 * 1024))
+    else:
+        part = -(-size // 4)
+        received = 0
+        for start in range(0, size, part):
+            headers = {'Range': f'bytes={start}-{min(start + part, size) - 1}'}
+            with session.get(url, headers=headers, stream=True) as response:
+                assert response.status_code == 206
+                received += sum(len(chunk) for chunk in response.iter_content(1024 * 1024))
+    assert received == size, (received, size)
+
+
+def run_case(server, folder, name, size, rounds):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen([sys.executable, __file__, '--serve', server, '--folder', folder, '--port', str(port)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        results = []
+        for route in ('old', 'new'):
+            for ranged in (False, True):
+                url = f'http://127.0.0.1:{port}/{route}/{name}'
+                fetch(url, size, ranged)  # Warm the page cache and the server
+                cpu = tree_cpu_seconds(process.pid)
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    fetch(url, size, ranged)
+                elapsed = time.perf_counter() - start
+                cpu = tree_cpu_seconds(process.pid) - cpu
+                gigabytes = size * rounds / 1024 ** 3
+                results.append((route, 'ranged x4' if ranged else 'full',
+                                size * rounds / 1024 ** 2 / elapsed, cpu / gigabytes))
+        return results
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=256)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--serve', help=argparse.SUPPRESS)
+    parser.add_argument('--folder', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.folder, args.port)
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        name = 'video.mp4'
+        size = args.size_mb * 1024 * 1024
+        with open(os.path.join(folder, name), 'wb') as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1024 * 1024))
+
+        print(f"{args.rounds} x {args.size_mb} MB per case, server CPU includes all worker processes\n")
+        print(f"{'server':<10} {'route':<22} {'request':<10} {'MB/s':>8} {'CPU s/GB':>9}")
+        for server in ('werkzeug', 'gunicorn'):
+            for route, request, speed, cpu in run_case(server, folder, name, size, args.rounds):
+                label = 'send_from_directory' if route == 'old' else 'serve_file'
+                print(f"{server:<10} {label:<22} {request:<10} {speed:>8.0f} {cpu:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
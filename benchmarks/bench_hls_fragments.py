@@ -0,0 +1,99 @@
+"""
+Benchmark: parallel HLS fragment downloads against a local fixture.
+
+Serves an HLS playlist of small segments with http.server, adding a fixed
+latency per request to simulate a remote CDN, and downloads it with the
+same yt-dlp options `download_video` uses at different values of
+`concurrent_fragment_downloads`.
+
+Usage:
+    python benchmarks/bench_hls_fragments.py [--segments 60] [--latency 0.05]
+"""
+import argparse
+import functools
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import yt_dlp
+
+
+class SlowHandler(SimpleHTTPRequestHandler):
+    """Static file handler that waits before answering, like a distant server"""
+
+    latency = 0.05
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+def make_fixture(folder, segments, segment_size):
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:2', '#EXT-X-MEDIA-SEQUENCE:0']
+    for i in range(segments):
+        with open(os.path.join(folder, f'seg{i:04d}.ts'), 'wb') as f:
+            f.write(os.urandom(segment_size))
+        lines += ['#EXTINF:2.000,', f'seg{i:04d}.ts']
+    lines.append('#EXT-X-ENDLIST')
+    with open(os.path.join(folder, 'index.m3u8'), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def download(url, out_folder, fragments):
+    opts = {
+        'outtmpl': os.path.join(out_folder, f'hls-{fragments}.%(ext)s'),
+        'quiet': True,
+        'noprogress': True,
+        'no_warnings': True,
+        'fixup': 'never',  # The fixture segments are random bytes, nothing to remux
+        'retries': 10,
+        'fragment_retries': 10,
+        'concurrent_fragment_downloads': fragments,
+    }
+    info = {'id': 'hls', 'title': 'hls', 'url': url, 'ext': 'mp4', 'protocol': 'm3u8_native'}
+    start = time.perf_counter()
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        ydl.process_ie_result(info, download=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--segments', type=int, default=60)
+    parser.add_argument('--segment-size', type=int, default=256 * 1024)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every request')
+    parser.add_argument('--fragments', type=int, nargs='+', default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    fixture = tempfile.mkdtemp(prefix='hls-fixture-')
+    output = tempfile.mkdtemp(prefix='hls-output-')
+    make_fixture(fixture, args.segments, args.segment_size)
+
+    SlowHandler.latency = args.latency
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(SlowHandler, directory=fixture))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/index.m3u8'
+
+    try:
+        total_mb = args.segments * args.segment_size / (1024 * 1024)
+        print(f"{args.segments} segments, {total_mb:.1f} MiB, {args.latency * 1000:.0f} ms latency per request\n")
+        print(f"{'fragments':>9} {'seconds':>8} {'MiB/s':>8} {'speedup':>8}")
+        baseline = None
+        for fragments in args.fragments:
+            elapsed = download(url, output, fragments)
+            baseline = baseline or elapsed
+            print(f"{fragments:>9} {elapsed:>8.2f} {total_mb / elapsed:>8.1f} {baseline / elapsed:>7.1f}x")
+    finally:
+        server.shutdown()
+        shutil.rmtree(fixture, ignore_errors=True)
+        shutil.rmtree(output, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Micro-benchmark: repeated thumbnail fetches with and without the shared session.
+
+Serves a thumbnail-sized image from a local keep-alive HTTP server and
+fetches it many times, first with a plain `requests.get` per call (new
+connection every time, like the old code) and then through `http_session`
+(pooled keep-alive connections).
+
+Usage:
+    python benchmarks/bench_http_session.py [--requests 300] [--size 40000]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import http_session  # noqa: E402
+
+
+class ThumbnailHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Allow keep-alive
+    # Send headers and body in one segment, otherwise delayed ACKs dominate keep-alive timings
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    body = b''
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def measure(fetch, url, count):
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = fetch(url)
+        response.content
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{name:<22} {statistics.mean(latencies):>8.3f} {statistics.median(latencies):>8.3f} {p99:>8.3f}")
+    return statistics.mean(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--size', type=int, default=40000, help='thumbnail size in bytes')
+    args = parser.parse_args()
+
+    ThumbnailHandler.body = os.urandom(args.size)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ThumbnailHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/thumbnail.jpg'
+
+    try:
+        # Warm up both paths
+        requests.get(url, timeout=5).content
+        http_session.get(url).content
+
+        print(f"{args.requests} fetches of a {args.size} byte thumbnail (plain HTTP on localhost)\n")
+        print(f"{'':<22} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8}")
+        plain = report('requests.get', measure(lambda u: requests.get(u, timeout=5), url, args.requests))
+        pooled = report('http_session.get', measure(http_session.get, url, args.requests))
+        print(f"\nSaved {plain - pooled:.3f} ms per fetch ({plain / pooled:.1f}x faster). "
+              "Over TLS to a remote host the saving includes the handshake round-trips too.")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
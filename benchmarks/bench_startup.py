@@ -0,0 +1,98 @@
+"""
+Benchmark: cold start of the app (`import app`), fails when it gets slower.
+
+Imports the app in fresh interpreters with `python -X importtime` and takes
+the median. The check compares the import time to the time of importing
+Flask in the same process, so the baseline holds on faster and slower
+machines. It also fails when one of the heavy modules that should load on
+first use (yt_dlp, instaloader, mutagen, requests) is imported at startup.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 7] [--tolerance 0.25] [--update]
+
+Exits with 1 on a regression. --update saves the current numbers as the
+new baseline in benchmarks/startup_baseline.json.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, 'benchmarks', 'startup_baseline.json')
+LAZY_MODULES = ('yt_dlp', 'instaloader', 'mutagen', 'requests')
+
+
+def import_once(folder):
+    """
+    Import the app in a new interpreter, return {module: cumulative microseconds}
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT, DOWNLOADER_DOWNLOAD_FOLDER=os.path.join(folder, 'downloads'))
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=folder, env=env,
+                            capture_output=True, text=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def measure(runs):
+    with tempfile.TemporaryDirectory() as folder:
+        import_once(folder)  # Compile bytecode and warm the file cache
+        samples = [import_once(folder) for _ in range(runs)]
+    app_ms = statistics.median(s['app'] for s in samples) / 1000
+    flask_ms = statistics.median(s['flask'] for s in samples) / 1000
+    slowest = sorted(samples[-1].items(), key=lambda item: item[1], reverse=True)
+    return {
+        'app_ms': round(app_ms, 1),
+        'flask_ms': round(flask_ms, 1),
+        'ratio_to_flask': round(app_ms / flask_ms, 3),
+        'lazy_modules_loaded': sorted({name.split('.')[0] for name in samples[-1]} & set(LAZY_MODULES)),
+        'slowest': [(name, round(us / 1000, 1)) for name, us in slowest if name.split('.')[0] != 'app'][:8],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown, 0.25 = 25%%')
+    parser.add_argument('--update', action='store_true', help='save the result as the new baseline')
+    args = parser.parse_args()
+
+    result = measure(args.runs)
+    print(f"import app: {result['app_ms']:.1f} ms (median of {args.runs}), "
+          f"flask alone: {result['flask_ms']:.1f} ms, ratio {result['ratio_to_flask']:.2f}")
+    print('slowest imports: ' + ', '.join(f'{name} {ms} ms' for name, ms in result['slowest']))
+
+    if args.update:
+        with open(BASELINE, 'w') as f:
+            json.dump({key: result[key] for key in ('app_ms', 'flask_ms', 'ratio_to_flask')}, f, indent=2)
+            f.write('\n')
+        print(f"✅ Baseline saved to {os.path.relpath(BASELINE, ROOT)}")
+        return 0
+
+    failed = False
+    if result['lazy_modules_loaded']:
+        print(f"❌ Imported at startup: {', '.join(result['lazy_modules_loaded'])}")
+        failed = True
+    with open(BASELINE) as f:
+        baseline = json.load(f)
+    limit = baseline['ratio_to_flask'] * (1 + args.tolerance)
+    if result['ratio_to_flask'] > limit:
+        print(f"❌ Startup regressed: ratio {result['ratio_to_flask']:.2f} > {limit:.2f} "
+              f"(baseline {baseline['ratio_to_flask']:.2f}, {baseline['app_ms']} ms)")
+        failed = True
+    if not failed:
+        print(f"✅ Within {args.tolerance:.0%} of the baseline ({baseline['ratio_to_flask']:.2f})")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,48 @@
+"""
+Resolve many URLs at once, for `/fetch_titles`.
+
+Lookups run on a bounded thread pool and every result is yielded as soon
+as it is ready, so a long paste of links shows up progressively instead of
+one round-trip after the other. A lookup that takes longer than the
+timeout is reported as timed out; its thread can't be interrupted, it
+finishes in the background and its result is dropped.
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def resolve_all(urls, resolve, max_workers=8, timeout=30):
+    """
+    Yield (index, url, result, error) for every url, in the order `resolve(url)` finishes
+
+    `error` is the exception raised by resolve, or a TimeoutError.
+    """
+    started = {}
+
+    def run(index, url):
+        # The timeout of a URL counts from the moment a worker picks it up
+        started[index] = time.monotonic()
+        return resolve(url)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(urls))), thread_name_prefix='lookup')
+    try:
+        pending = {pool.submit(run, index, url): (index, url) for index, url in enumerate(urls)}
+        while pending:
+            deadlines = [started[index] + timeout for index, _ in pending.values() if index in started]
+            wait_for = max(0, min(deadlines) - time.monotonic()) if deadlines else timeout
+            done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, url = pending.pop(future)
+                try:
+                    yield index, url, future.result(), None
+                except Exception as e:
+                    yield index, url, None, e
+
+            now = time.monotonic()
+            for future, (index, url) in list(pending.items()):
+                if index in started and now - started[index] >= timeout:
+                    del pending[future]
+                    yield index, url, None, TimeoutError(f'No answer after {timeout} seconds')
+    finally:
+        # Also reached when the client goes away in the middle of the stream
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,104 @@
+"""
+Album art for MP3 downloads, built from the thumbnail yt-dlp wrote to disk.
+
+The cover is resized to fit COVER_MAX_SIZE and recompressed as JPEG until it
+fits COVER_MAX_BYTES, so large `maxresdefault` thumbnails don't bloat every
+MP3. Pillow is used when installed, with ffmpeg (already needed for the MP3
+conversion) as the fallback.
+"""
+import io
+import logging
+import os
+import shutil
+import subprocess
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+COVER_MAX_SIZE = 600           # Longest side of the cover in pixels
+COVER_MAX_BYTES = 200 * 1024   # Upper bound for the embedded JPEG
+JPEG_QUALITIES = (90, 80, 70, 60, 50)
+FFMPEG_QUALITIES = (2, 4, 6, 9, 12)  # mjpeg -q:v, lower is better
+
+
+def find_written_thumbnail(info):
+    """
+    Return the path of the thumbnail yt-dlp wrote for info, if any
+    """
+    for thumbnail in reversed(info.get('thumbnails') or []):
+        path = thumbnail.get('filepath')
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+def is_jpeg(data):
+    return data[:3] == b'\xff\xd8\xff'
+
+
+def _resize_with_pillow(path, max_size, max_bytes):
+    with Image.open(path) as image:
+        image = image.convert('RGB')
+        image.thumbnail((max_size, max_size))
+        data = None
+        for quality in JPEG_QUALITIES:
+            buffer = io.BytesIO()
+            image.save(buffer, format='JPEG', quality=quality, optimize=True)
+            data = buffer.getvalue()
+            if len(data) <= max_bytes:
+                break
+        return data
+
+
+def _resize_with_ffmpeg(path, max_size, max_bytes, ffmpeg_location):
+    ffmpeg = shutil.which('ffmpeg', path=ffmpeg_location) if ffmpeg_location else shutil.which('ffmpeg')
+    if not ffmpeg:
+        return None
+    scale = (f"scale='min({max_size},iw)':'min({max_size},ih)'"
+             ":force_original_aspect_ratio=decrease")
+    data = None
+    for quality in FFMPEG_QUALITIES:
+        result = subprocess.run(
+            [ffmpeg, '-v', 'error', '-i', path, '-vf', scale, '-frames:v', '1',
+             '-q:v', str(quality), '-c:v', 'mjpeg', '-f', 'image2pipe', 'pipe:1'],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=30)
+        if result.returncode != 0 or not result.stdout:
+            return data
+        data = result.stdout
+        if len(data) <= max_bytes:
+            break
+    return data
+
+
+def prepare_cover(path, ffmpeg_location=None, max_size=COVER_MAX_SIZE, max_bytes=COVER_MAX_BYTES):
+    """
+    Return JPEG bytes for the cover at path, or None if it can't be converted
+
+    Pillow is tried first, then ffmpeg, then the file as is; a result larger
+    than max_bytes is never returned.
+    """
+    converters = [lambda: _resize_with_ffmpeg(path, max_size, max_bytes, ffmpeg_location)]
+    if Image is not None:
+        converters.insert(0, lambda: _resize_with_pillow(path, max_size, max_bytes))
+    for convert in converters:
+        try:
+            data = convert()
+        except (OSError, ValueError, subprocess.SubprocessError) as e:
+            # Pillow raises UnidentifiedImageError (an OSError) for formats it can't read
+            logger.debug('Cover converter failed', extra={'path': path, 'error': str(e)})
+            continue
+        if data and len(data) <= max_bytes:
+            return data
+    try:
+        # No converter managed, a small JPEG can still be embedded as is
+        with open(path, 'rb') as f:
+            data = f.read(max_bytes + 1)
+        if is_jpeg(data) and len(data) <= max_bytes:
+            return data
+    except OSError as e:
+        logger.warning('Could not prepare cover art', extra={'path': path, 'error': str(e)})
+    return None
@@ -0,0 +1,278 @@
+"""
+Download engine for direct media URLs (Instagram media, any direct link).
+
+The URL is probed for its size and `Accept-Ranges`. Large files on servers
+that support ranges are split into segments that are fetched in parallel and
+written at their offsets into a preallocated `.part` file. The progress of
+every segment is kept in a `.part.json` file next to it, so an interrupted
+download continues where each segment stopped. The final length is checked
+before the file gets its real name.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+from urllib.parse import unquote, urlsplit
+
+from werkzeug.utils import secure_filename
+
+import http_session
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_RETRIES = 3          # Attempts per segment before the download fails
+STATE_SAVE_INTERVAL = 1.0    # Seconds between writes of the resume state
+
+
+class DownloadError(Exception):
+    pass
+
+
+def probe(url):
+    """
+    Return (total size or None, supports ranges, content type)
+    """
+    session = http_session.get_session()
+    # A one byte range answers both questions, and works where HEAD is not allowed
+    with session.get(url, headers={'Range': 'bytes=0-0'}, stream=True) as response:
+        response.raise_for_status()
+        content_type = response.headers.get('content-type', '')
+        if response.status_code == 206:
+            match = re.search(r'/(\d+)$', response.headers.get('content-range', ''))
+            return (int(match.group(1)) if match else None), True, content_type
+        length = response.headers.get('content-length')
+        accepts = response.headers.get('accept-ranges', '').lower() == 'bytes'
+        return (int(length) if length and length.isdigit() else None), accepts, content_type
+
+
+def filename_from_url(url, default='download'):
+    name = secure_filename(unquote(os.path.basename(urlsplit(url).path)))
+    return name or default
+
+
+def reserve_path(folder, filename):
+    """
+    Return a path in folder that no other download uses, like "name (1).mp4"
+
+    The `.part` file is created right away so concurrent downloads of the
+    same name can't pick the same path.
+    """
+    base, ext = os.path.splitext(filename)
+    number = 0
+    while True:
+        candidate = os.path.join(folder, f'{base} ({number}){ext}' if number else filename)
+        number += 1
+        if os.path.exists(candidate):
+            continue
+        try:
+            os.close(os.open(candidate + '.part', os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            continue
+        return candidate
+
+
+def remove_partial(path):
+    """
+    Remove the .part file (reserved by reserve_path) and resume state of a failed download
+    """
+    for leftover in (path + '.part', path + '.part.json'):
+        try:
+            os.remove(leftover)
+        except FileNotFoundError:
+            pass
+
+
+def plan_segments(total, segments, min_segment_size):
+    """
+    Split total bytes into at most `segments` ranges of at least min_segment_size
+    """
+    count = max(1, min(segments, total // max(1, min_segment_size)))
+    size = -(-total // count)
+    return [[start, min(start + size, total) - 1, 0] for start in range(0, total, size)]
+
+
+class _PartFile:
+    """
+    Positional writes into the .part file from several threads
+    """
+
+    def __init__(self, path):
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0))
+        self._lock = threading.Lock()
+
+    def allocate(self, size):
+        if os.fstat(self.fd).st_size != size:
+            os.ftruncate(self.fd, size)
+
+    def write_at(self, data, offset):
+        if hasattr(os, 'pwrite'):
+            while data:
+                written = os.pwrite(self.fd, data, offset)
+                data = data[written:]
+                offset += written
+        else:
+            # No pwrite on Windows, seek and write under a lock instead
+            with self._lock:
+                os.lseek(self.fd, offset, os.SEEK_SET)
+                while data:
+                    data = data[os.write(self.fd, data):]
+
+    def close(self):
+        os.close(self.fd)
+
+
+class DirectDownload:
+    """
+    Download url to path, resuming from path + '.part' if possible
+    """
+
+    def __init__(self, url, path, job=None, segments=4, min_segment_size=4 * 1024 * 1024):
+        self.url = url
+        self.path = path
+        self.part_path = path + '.part'
+        self.state_path = path + '.part.json'
+        self.job = job
+        self.segments = segments
+        self.min_segment_size = min_segment_size
+        self.total = None
+        self.ranges = []
+        self._lock = threading.Lock()
+        self._failed = threading.Event()
+        self._last_report = 0
+        self.resumed = 0  # Bytes that were already in the .part file
+        self.transfer = metrics.TransferMetrics('Direct', 'direct')
+
+    @property
+    def downloaded(self):
+        with self._lock:
+            return sum(done for _, _, done in self.ranges)
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get('url') != self.url or state.get('total') != self.total:
+            return None
+        if not os.path.exists(self.part_path):
+            return None
+        return state['segments']
+
+    def _save_state(self):
+        with self._lock:
+            state = {'url': self.url, 'total': self.total, 'segments': [list(r) for r in self.ranges]}
+        with open(self.state_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(self.state_path + '.tmp', self.state_path)
+
+    def _report(self, force=False):
+        if self.job is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_report < 0.25:
+            return
+        self._last_report = now
+        downloaded = self.downloaded
+        progress = downloaded * 100 / self.total if self.total else 0
+        self.job.update(progress=round(progress, 1), downloaded_bytes=downloaded, total_bytes=self.total,
+                        message=f'Downloading... {progress:.1f}%' if self.total else 'Downloading...')
+
+    def _fetch_segment(self, part, segment):
+        chunk_size = http_session.chunk_size()
+        session = http_session.get_session()
+        for attempt in range(1, SEGMENT_RETRIES + 1):
+            start, end, done = segment
+            if start + done > end:
+                return
+            try:
+                headers = {'Range': f'bytes={start + done}-{end}'}
+                with session.get(self.url, headers=headers, stream=True) as response:
+                    if response.status_code != 206:
+                        raise DownloadError(f'Server ignored the range request ({response.status_code})')
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        if self._failed.is_set():
+                            return  # Another segment failed, stop early
+                        if self.job is not None:
+                            self.job.wait_while_paused()
+                        chunk = chunk[:end + 1 - (start + segment[2])]
+                        part.write_at(chunk, start + segment[2])
+                        with self._lock:
+                            segment[2] += len(chunk)
+                        self.transfer.progress(len(chunk))
+                        self._report()
+                        if start + segment[2] > end:
+                            return
+                if start + segment[2] <= end:
+                    raise DownloadError('Connection closed before the segment was complete')
+            except (OSError, DownloadError):  # requests errors are OSErrors too
+                if attempt == SEGMENT_RETRIES:
+                    self._failed.set()
+                    raise
+                time.sleep(0.5 * attempt)
+
+    def _download_segments(self):
+        self.ranges = self._load_state() or plan_segments(self.total, self.segments, self.min_segment_size)
+        self.resumed = self.downloaded
+        if self.resumed:
+            logger.info('Resuming download', extra={'path': self.path, 'offset': self.resumed, 'total': self.total})
+        part = _PartFile(self.part_path)
+        try:
+            part.allocate(self.total)
+            self._save_state()
+            with ThreadPoolExecutor(max_workers=len(self.ranges)) as pool:
+                pending = {pool.submit(self._fetch_segment, part, segment) for segment in self.ranges}
+                while pending:
+                    done, pending = wait(pending, timeout=STATE_SAVE_INTERVAL, return_when=FIRST_EXCEPTION)
+                    self._save_state()
+                    for future in done:
+                        future.result()
+            if any(start + done <= end for start, end, done in self.ranges):
+                raise DownloadError('Some segments are incomplete')
+        finally:
+            part.close()
+            self._save_state()
+
+    def _download_stream(self):
+        # No ranges or unknown size, a single request from the start
+        self.ranges = [[0, (self.total or 0) - 1, 0]]
+        with http_session.get(self.url, stream=True) as response:
+            response.raise_for_status()
+            with open(self.part_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=http_session.chunk_size()):
+                    if self.job is not None:
+                        self.job.wait_while_paused()
+                    f.write(chunk)
+                    with self._lock:
+                        self.ranges[0][2] += len(chunk)
+                    self.transfer.progress(len(chunk))
+                    self._report()
+
+    def run(self):
+        self.total, accepts_ranges, content_type = probe(self.url)
+        if accepts_ranges and self.total:
+            self._download_segments()
+        else:
+            self._download_stream()
+
+        size = os.path.getsize(self.part_path)
+        if self.total is not None and size != self.total:
+            raise DownloadError(f'Downloaded {size} bytes, expected {self.total}')
+        os.replace(self.part_path, self.path)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        self.transfer.finish(size - self.resumed)
+        self.total = size
+        self._report(force=True)
+        return self.path
+
+
+def download_url(url, path, job=None, segments=4, min_segment_size=4 * 1024 * 1024):
+    """
+    Download url to path and return the path
+    """
+    return DirectDownload(url, path, job=job, segments=segments, min_segment_size=min_segment_size).run()
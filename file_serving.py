@@ -0,0 +1,139 @@
+"""
+Serving of finished downloads with byte ranges and zero-copy transfer.
+
+Modes (app.config['SERVE_MODE']):
+- 'direct': the app answers Range and conditional requests itself. Under a
+  WSGI server with `wsgi.file_wrapper` (gunicorn, waitress) the file is
+  handed over already positioned at the range start, so gunicorn sends
+  exactly Content-Length bytes with sendfile() without copying them
+  through Python, for ranged responses too.
+- 'x-accel': nginx serves the file, the app only answers with an
+  `X-Accel-Redirect` to an internal location mapped to the download folder.
+- 'x-sendfile': Apache/lighttpd serve the file from an `X-Sendfile` header.
+"""
+import mimetypes
+import os
+import unicodedata
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from flask import Response
+from werkzeug.http import (http_date, is_resource_modified, parse_if_range_header, parse_range_header,
+                           quote_etag)
+
+import metrics
+
+READ_CHUNK_SIZE = 256 * 1024
+SERVE_MODES = ('direct', 'x-accel', 'x-sendfile')
+
+
+def check_serve_mode(mode):
+    """
+    Raise ValueError for a mode that isn't in SERVE_MODES
+    """
+    if mode not in SERVE_MODES:
+        raise ValueError(f"Unknown serve mode {mode!r}, expected one of {', '.join(SERVE_MODES)}")
+    return mode
+
+
+def content_disposition(download_name):
+    """
+    Attachment header with an ASCII filename= fallback and the UTF-8 filename*=
+    """
+    base, ext = os.path.splitext(download_name)
+    fallback = unicodedata.normalize('NFKD', base).encode('ascii', 'ignore').decode('ascii')
+    # Nothing of the title may survive in ASCII, e.g. an Arabic title
+    fallback = fallback.replace('"', '').replace('\\', '').strip() or 'download'
+    fallback += ext.encode('ascii', 'ignore').decode('ascii')
+    # RFC 5987 encoding keeps non-ASCII titles intact for clients that support it
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(download_name)}"
+
+
+def file_etag(stat):
+    return f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+
+
+def _if_range_matches(environ, etag, last_modified):
+    value = environ.get('HTTP_IF_RANGE')
+    if not value:
+        return True
+    if_range = parse_if_range_header(value)
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    return if_range.date is not None and if_range.date >= last_modified
+
+
+def _read_range(path, start, length):
+    # Fallback for servers without wsgi.file_wrapper, e.g. the development server
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(READ_CHUNK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def _body(environ, path, start, length):
+    file_wrapper = environ.get('wsgi.file_wrapper')
+    if file_wrapper is None:
+        return _read_range(path, start, length)
+    f = open(path, 'rb')
+    f.seek(start)
+    return file_wrapper(f, READ_CHUNK_SIZE)
+
+
+def serve_file(environ, path, download_name=None, mode='direct', root=None, accel_prefix='/protected-downloads/'):
+    """
+    Return a response for the file at path, honoring Range and conditional headers
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = file_etag(stat)
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), tz=timezone.utc)
+    mimetype = mimetypes.guess_type(download_name or path)[0] or 'application/octet-stream'
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'ETag': quote_etag(etag),
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': 'no-cache',  # Revalidate, the ETag makes that a cheap 304
+    }
+    if download_name:
+        headers['Content-Disposition'] = content_disposition(download_name)
+
+    if not is_resource_modified(environ, etag=etag, last_modified=last_modified):
+        metrics.SERVED_REQUESTS.inc(status='304')
+        return Response(status=304, headers=headers)
+
+    if mode == 'x-accel':
+        relative = os.path.relpath(path, root).replace(os.sep, '/')
+        headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + relative
+        metrics.SERVED_REQUESTS.inc(status='200')
+        return Response(status=200, headers=headers, mimetype=mimetype)
+    if mode == 'x-sendfile':
+        headers['X-Sendfile'] = os.path.abspath(path)
+        metrics.SERVED_REQUESTS.inc(status='200')
+        return Response(status=200, headers=headers, mimetype=mimetype)
+
+    start, length, status = 0, size, 200
+    byte_range = parse_range_header(environ.get('HTTP_RANGE'))
+    # If-Range: only honor the range when the file is still the same version
+    if byte_range is not None and _if_range_matches(environ, etag, last_modified):
+        bounds = byte_range.range_for_length(size)
+        if bounds is None:
+            headers['Content-Range'] = f'bytes */{size}'
+            metrics.SERVED_REQUESTS.inc(status='416')
+            return Response(status=416, headers=headers)
+        start, stop = bounds
+        length = stop - start
+        status = 206
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+
+    headers['Content-Length'] = str(length)
+    metrics.SERVED_REQUESTS.inc(status=str(status))
+    if environ.get('REQUEST_METHOD') == 'HEAD':
+        return Response(status=status, headers=headers, mimetype=mimetype)
+    metrics.SERVED_BYTES.inc(length, status=str(status))
+    return Response(_body(environ, path, start, length), status=status, headers=headers,
+                    mimetype=mimetype, direct_passthrough=True)
@@ -0,0 +1,79 @@
+"""
+yt-dlp format selection for the quality and mode chosen in the UI.
+"""
+
+# After resolution, prefer H.264/AAC in mp4/m4a. Those streams are merged
+# into the mp4 output by copying, without a remux into another container or
+# a transcode.
+CODEC_FORMAT_SORT = ['ext:mp4:m4a', 'vcodec:h264', 'acodec:aac']
+
+# Audio codecs a client can ask to keep as downloaded, and the streams that have them
+ORIGINAL_AUDIO_FORMATS = {
+    'm4a': 'bestaudio[ext=m4a]',
+    'opus': 'bestaudio[acodec=opus]',
+}
+
+# yt-dlp acodec values of the streams that can be kept for each of those codecs
+ORIGINAL_AUDIO_ACODECS = {
+    'm4a': ('mp4a', 'aac'),
+    'opus': ('opus',),
+}
+
+
+def parse_height(quality):
+    """
+    Return the height of a quality like '720p', or None for anything else
+    """
+    if not quality:
+        return None
+    quality = str(quality).strip().lower()
+    if quality.endswith('p'):
+        quality = quality[:-1]
+    return int(quality) if quality.isdigit() else None
+
+
+def parse_audio_codecs(value):
+    """
+    Return the known codecs of a list like 'm4a,opus', in the client's order
+    """
+    codecs = [codec.strip().lower() for codec in (value or '').split(',')]
+    return [codec for codec in dict.fromkeys(codecs) if codec in ORIGINAL_AUDIO_FORMATS]
+
+
+def build_format_options(quality, mode, audio_codecs=None):
+    """
+    Return the yt-dlp options selecting formats for quality and mode
+    
+    For audio, `audio_codecs` lists the codecs the client plays as they
+    are; the first one available is downloaded and kept without re-encoding.
+    """
+    if mode == 'Audio':
+        preferred = [ORIGINAL_AUDIO_FORMATS[codec] for codec in audio_codecs or ()]
+        return {'format': '/'.join(preferred + ['bestaudio/best'])}
+
+    height = parse_height(quality)
+    if height is None:
+        return {'format': 'bestvideo+bestaudio/best', 'format_sort': ['res'] + CODEC_FORMAT_SORT}
+
+    return {
+        'format': f'bestvideo[height<={height}]+bestaudio/best[height<={height}]/bestvideo+bestaudio/best',
+        # res:N prefers the largest resolution up to N, then the smallest above it,
+        # so the fallback picks the closest format when the site has nothing that fits
+        'format_sort': [f'res:{height}'] + CODEC_FORMAT_SORT,
+    }
+
+
+def audio_postprocessor(audio_codecs=None, acodec=None):
+    """
+    Return the yt-dlp postprocessor that turns the download into the audio file
+
+    `acodec` is the codec of the downloaded stream. It is only kept when the
+    client accepts it, a stream the selector fell back to is converted to mp3.
+    """
+    acodec = (acodec or '').lower()
+    for codec in audio_codecs or ():
+        if acodec.startswith(ORIGINAL_AUDIO_ACODECS[codec]):
+            # The stream is copied: m4a is kept as it is and opus is only moved
+            # from its webm (or ogg) container to .opus, nothing is re-encoded
+            return {'key': 'FFmpegExtractAudio', 'preferredcodec': codec}
+    return {'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'}
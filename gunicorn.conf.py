@@ -0,0 +1,17 @@
+"""
+gunicorn settings for `gunicorn wsgi:app`, the same defaults as serve.py
+"""
+from serve import new_server_run, server_settings
+
+_settings = server_settings()
+
+bind = _settings['bind']
+workers = _settings['workers']
+threads = _settings['threads']
+timeout = _settings['timeout']
+worker_class = 'gthread'
+graceful_timeout = 30
+accesslog = '-'
+
+# Loaded by the master process, so the workers it forks share the run ID
+new_server_run()
@@ -0,0 +1,90 @@
+"""
+Shared HTTP session for direct requests (thumbnails, Instagram media).
+
+All direct downloads go through one `requests.Session`, so connections to
+the same host are kept alive and pooled instead of paying a new TCP/TLS
+handshake on every request. The session retries transient failures with
+backoff and always applies connect/read timeouts.
+
+requests is imported when the first session is created, it is slow to
+import and not needed to start the app.
+"""
+import threading
+
+SETTINGS = {
+    'connect_timeout': 5,       # Seconds to establish a connection
+    'read_timeout': 30,         # Seconds to wait between bytes
+    'retries': 3,               # Retries for connection errors and 429/5xx responses
+    'backoff_factor': 0.5,      # Sleep 0.5s, 1s, 2s... between retries
+    'pool_connections': 16,     # Number of hosts with a connection pool
+    'pool_maxsize': 16,         # Connections kept alive per host
+    'chunk_size': 64 * 1024,    # Bytes per chunk when streaming responses
+    'user_agent': None,         # None keeps the requests default
+}
+
+_session = None
+_lock = threading.Lock()
+
+
+def configure(**settings):
+    """
+    Update SETTINGS, the session is rebuilt on next use
+    """
+    global _session
+    unknown = set(settings) - set(SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown HTTP settings: {', '.join(sorted(unknown))}")
+    with _lock:
+        SETTINGS.update(settings)
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def create_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    class _TimeoutSession(requests.Session):
+        """
+        Session that applies the configured timeouts when a call doesn't pass one
+        """
+
+        def request(self, method, url, **kwargs):
+            kwargs.setdefault('timeout', (SETTINGS['connect_timeout'], SETTINGS['read_timeout']))
+            return super().request(method, url, **kwargs)
+
+    retry = Retry(
+        total=SETTINGS['retries'],
+        backoff_factor=SETTINGS['backoff_factor'],
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=('GET', 'HEAD'),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=SETTINGS['pool_connections'],
+                          pool_maxsize=SETTINGS['pool_maxsize'],
+                          max_retries=retry)
+    session = _TimeoutSession()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if SETTINGS['user_agent']:
+        session.headers['User-Agent'] = SETTINGS['user_agent']
+    return session
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def get(url, **kwargs):
+    return get_session().get(url, **kwargs)
+
+
+def chunk_size():
+    return SETTINGS['chunk_size']
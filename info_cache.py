@@ -0,0 +1,146 @@
+"""
+In-process cache for yt-dlp metadata.
+
+Extracting video information is often the slowest step of a download, so the
+raw extractor result is kept per normalized URL and reused by `/fetch_title`,
+`/start_download` and `download_video` instead of extracting it again.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Query parameters that never change which video a URL points to
+TRACKING_PARAMS = {'si', 'feature', 'fbclid', 'gclid', 'igshid', 'igsh', 'pp', 'ab_channel'}
+
+
+def normalize_url(url):
+    """
+    Normalize a media URL so equivalent links share one cache entry
+    """
+    url = (url or '').strip()
+    parts = urlsplit(url)
+    scheme = (parts.scheme or 'https').lower()
+    host = parts.netloc.lower()
+    path = parts.path
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if k not in TRACKING_PARAMS and not k.startswith('utm_')]
+
+    if host.startswith('www.') or host.startswith('m.'):
+        host = host.split('.', 1)[1]
+
+    # youtu.be/<id> and youtube.com/shorts/<id> point to the same video as watch?v=<id>
+    if host == 'youtu.be' and path.strip('/'):
+        query.insert(0, ('v', path.strip('/')))
+        host, path = 'youtube.com', '/watch'
+    elif host == 'youtube.com' and path.startswith('/shorts/'):
+        query.insert(0, ('v', path[len('/shorts/'):].strip('/')))
+        path = '/watch'
+
+    if path != '/':
+        path = path.rstrip('/')
+
+    return urlunsplit((scheme, host, path, urlencode(sorted(query)), ''))
+
+
+class InfoCache:
+    """
+    Thread-safe LRU cache of info dicts with a time to live
+
+    Concurrent lookups of the same URL share a single extraction.
+    """
+
+    def __init__(self, max_entries=256, ttl=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        """
+        Return a copy of the cached info dict for url, or None
+        """
+        key = normalize_url(url)
+        with self._lock:
+            info = self._lookup(key)
+            if info is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return copy.deepcopy(info)
+
+    def put(self, url, info):
+        key = normalize_url(url)
+        with self._lock:
+            self._store(key, info)
+
+    def get_or_extract(self, url, extract):
+        """
+        Return cached info for url, calling `extract()` on a miss
+        """
+        key = normalize_url(url)
+        while True:
+            with self._lock:
+                info = self._lookup(key)
+                if info is not None:
+                    self.hits += 1
+                    return copy.deepcopy(info)
+                pending = self._pending.get(key)
+                if pending is None:
+                    self.misses += 1
+                    pending = self._pending[key] = threading.Event()
+                    break
+            # Another thread is extracting this URL, wait for its result
+            pending.wait()
+
+        try:
+            info = extract()
+            with self._lock:
+                self._store(key, info)
+            return info
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            }
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, info = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return info
+
+    def _store(self, key, info):
+        try:
+            info = copy.deepcopy(info)
+        except (TypeError, copy.Error):
+            # Lazy playlist entries (generators) can't be copied, so they aren't cached
+            return
+        self._entries[key] = (time.monotonic(), info)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
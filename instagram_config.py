@@ -30,13 +30,19 @@ INSTAGRAM_CONFIG = {
     # إعدادات الأمان
     'user_agent': None,                 # اترك None لاستخدام الافتراضي
     'request_timeout': 300,             # مهلة الطلب (ثواني)
+    
+    # إعدادات الاتصال المشترك
+    'pool_size': 4,                     # عدد نسخ Instaloader المعاد استخدامها
+    'requests_per_minute': 60,          # الحد الأقصى للطلبات إلى Instagram في الدقيقة (None للتعطيل)
+    'burst': 5,                         # عدد الطلبات المسموح بها دفعة واحدة
+    'session_username': None,           # اسم المستخدم لتحميل جلسة محفوظة (instaloader --login)
+    'session_file': None,               # مسار ملف الجلسة، None للمسار الافتراضي
 }
 
-# إعدادات مسار التحميل
+# إعدادات مسار التحميل، المجلد الأساسي هو app.config['DOWNLOAD_FOLDER'] (DOWNLOADER_DOWNLOAD_FOLDER)
 DOWNLOAD_SETTINGS = {
-    'base_folder': 'D:/Universal Video Downloader Downloads',
-    'create_subfolders': False,         # إنشاء مجلدات فرعية حسب المنصة
-    'subfolder_format': '{platform}',   # {platform}, {date}, {username}
+    'create_subfolders': True,          # إنشاء مجلدات فرعية حسب المنصة
+    'subfolder_format': '{platform}/{date}',  # {platform}, {date}, {username}, {job_id}
 }
 
 # إعدادات الواجهة
@@ -78,9 +84,9 @@ LOGGING_CONFIG = {
 
 # إعدادات التخزين المؤقت
 CACHE_SETTINGS = {
-    'enabled': False,                   # تفعيل التخزين المؤقت
+    'enabled': True,                    # تفعيل التخزين المؤقت لبيانات المنشورات
     'cache_duration': 3600,             # مدة التخزين المؤقت (ثواني)
-    'cache_folder': '.cache',
+    'cache_folder': '.cache',           # نسبةً إلى مجلد التطبيق
 }
 
 # ملاحظات:
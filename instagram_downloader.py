@@ -0,0 +1,134 @@
+"""
+Instagram downloads run as background jobs.
+
+A post is fetched once with Instaloader, then its media (every item of a
+carousel) is downloaded concurrently with a bounded pool while progress is
+reported on the job like any other download.
+"""
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+SHORTCODE_PATTERNS = [
+    r'instagram\.com/p/([^/?]+)',
+    r'instagram\.com/reel/([^/?]+)',
+    r'instagram\.com/tv/([^/?]+)',
+]
+
+
+def extract_instagram_shortcode(url):
+    """
+    Extract shortcode from various Instagram URL formats
+    """
+    for pattern in SHORTCODE_PATTERNS:
+        match = re.search(pattern, url)
+        if match:
+            return match.group(1)
+
+    return None
+
+
+def get_post(loader, shortcode):
+    # instaloader is imported on first use, it is slow to import
+    import instaloader
+    return instaloader.Post.from_shortcode(loader.context, shortcode)
+
+
+def load_post(loader, shortcode, cache=None):
+    """
+    Return (post, media items) for shortcode, from the cache when possible
+    """
+    if cache is not None:
+        entry = cache.get(shortcode)
+        if entry is not None:
+            import instaloader
+            return instaloader.Post(loader.context, entry['node']), entry['media_items']
+
+    post = get_post(loader, shortcode)
+    media_items = get_media_items(post)
+    if cache is not None:
+        cache.put(shortcode, post._node, media_items)
+    return post, media_items
+
+
+def get_media_items(post):
+    """
+    Return the media of a post, one item per carousel entry
+    """
+    if post.typename == 'GraphSidecar':  # Carousel post
+        return [{
+            'url': node.video_url if node.is_video else node.display_url,
+            'is_video': node.is_video,
+            'type': 'video' if node.is_video else 'image'
+        } for node in post.get_sidecar_nodes()]
+
+    return [{
+        'url': post.video_url if post.is_video else post.url,
+        'is_video': post.is_video,
+        'type': 'video' if post.is_video else 'image'
+    }]
+
+
+def build_subfolder(subfolder_format, job, post, platform='instagram'):
+    """
+    Format DOWNLOAD_SETTINGS['subfolder_format'] into a relative folder
+    """
+    fields = {'platform': platform, 'date': time.strftime('%Y-%m-%d'), 'job_id': job.id}
+    if '{username}' in subfolder_format:
+        fields['username'] = post.owner_username
+    parts = subfolder_format.format(**fields).replace('\\', '/').split('/')
+    parts = [part for part in parts if part not in ('', '.', '..')]
+    return os.path.join(*parts) if parts else ''
+
+
+def download_instagram_post(job, loader, url, download_folder, max_workers=4, cache=None, subfolder_format=None):
+    """
+    Download all media of the post at url into download_folder
+
+    `loader` is a RecordingInstaloader, the job reports exactly the files it wrote.
+    """
+    shortcode = extract_instagram_shortcode(url)
+    if not shortcode:
+        raise ValueError('Invalid Instagram URL')
+
+    job.update(message='Fetching Instagram post...')
+    post, items = load_post(loader, shortcode, cache)
+    caption = post.caption or 'No caption'
+    if not job.get('title'):
+        job.update(title=caption[:100])
+
+    target_folder = download_folder
+    if subfolder_format:
+        target_folder = os.path.join(download_folder, build_subfolder(subfolder_format, job, post))
+        os.makedirs(target_folder, exist_ok=True)
+
+    # Same names as Instaloader.download_post, carousel items get a _1, _2... suffix
+    filename = os.path.join(target_folder, loader.format_filename(post, target=target_folder))
+    is_sidecar = post.typename == 'GraphSidecar'
+
+    def download_item(number, item):
+        job.wait_while_paused()
+        loader.download_pic(filename, item['url'], post.date_local,
+                            filename_suffix=str(number) if is_sidecar else None)
+
+    with loader.recording() as written:
+        job.update(message=f'Downloading {len(items)} item(s)...')
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as pool:
+            futures = [pool.submit(download_item, number, item) for number, item in enumerate(items, start=1)]
+            for done, future in enumerate(as_completed(futures), start=1):
+                future.result()
+                job.update(progress=done * 100 / len(items), message=f'Downloaded {done} of {len(items)} item(s)')
+
+        if post.caption:
+            loader.save_caption(filename, post.date_local, post.caption)
+
+    # Paths relative to the download folder, media first in carousel order
+    written = sorted(written, key=lambda path: (path.endswith('.txt'), path))
+    downloaded_files = [os.path.relpath(path, download_folder).replace(os.sep, '/') for path in written]
+    media_files = [path for path in written if not path.endswith('.txt')]
+
+    job.update(files=downloaded_files, caption=caption,
+               current_file=os.path.basename(media_files[0]) if media_files else None,
+               output_path=media_files[0] if media_files else None,
+               progress=100, message=f'Downloaded {len(downloaded_files)} file(s) successfully!')
@@ -0,0 +1,239 @@
+"""
+Shared Instaloader instances for Instagram requests.
+
+Instead of a new `instaloader.Instaloader()` per request, a small pool of
+long-lived instances configured from INSTAGRAM_CONFIG is reused, keeping
+cookies, an optional logged-in session and keep-alive connections. All
+queries to Instagram go through one token bucket: when it is empty requests
+wait their turn instead of failing, and the time spent waiting is recorded.
+"""
+import functools
+import glob
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import instaloader
+
+logger = logging.getLogger(__name__)
+
+# Files next to a picture that aren't the picture itself (captions, metadata, partial writes)
+SIDECAR_EXTENSIONS = ('.txt', '.json', '.xz', '.temp')
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter, callers wait for a token in arrival order
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate  # Tokens per second
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.delayed = 0
+        self.waiting = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def reserve(self):
+        """
+        Take a token and return the seconds to wait before using it
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Going below zero reserves a future token, later callers queue behind it
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.requests += 1
+            if wait:
+                self.delayed += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            return wait
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            with self._lock:
+                self.waiting += 1
+            try:
+                time.sleep(wait)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+        return wait
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'delayed': self.delayed,
+                'waiting': self.waiting,
+                'total_wait': round(self.total_wait, 3),
+                'max_wait': round(self.max_wait, 3),
+                'avg_wait': round(self.total_wait / self.requests, 3) if self.requests else 0.0,
+            }
+
+
+class LimitedRateController(instaloader.RateController):
+    """
+    Instaloader rate controller that also waits for the shared token bucket
+    """
+
+    def __init__(self, context, limiter, retry_sleep=0):
+        super().__init__(context)
+        self.limiter = limiter
+        self.retry_sleep = retry_sleep
+
+    def wait_before_query(self, query_type):
+        self.limiter.acquire()
+        super().wait_before_query(query_type)
+
+    def handle_429(self, query_type):
+        if self.retry_sleep:
+            self.sleep(self.retry_sleep)
+        super().handle_429(query_type)
+
+
+class RecordingInstaloader(instaloader.Instaloader):
+    """
+    Instaloader that records the exact paths of the files it writes
+
+    Only one job uses a pooled instance at a time, see `recording()`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._written = None
+        self._written_lock = threading.Lock()
+
+    @contextmanager
+    def recording(self):
+        """
+        Collect the paths written inside the with block into the yielded list
+        """
+        written = []
+        self._written = written
+        try:
+            yield written
+        finally:
+            self._written = None
+
+    def _record(self, path):
+        if self._written is not None:
+            with self._written_lock:
+                self._written.append(path)
+
+    def download_pic(self, filename, url, mtime, filename_suffix=None, _attempt=1):
+        downloaded = super().download_pic(filename, url, mtime, filename_suffix=filename_suffix, _attempt=_attempt)
+        if self._written is not None:
+            # Instaloader doesn't return the path: it is the name plus the suffix and
+            # an extension taken from the URL or the response, so look that name up
+            base = filename + '_' + filename_suffix if filename_suffix is not None else filename
+            for path in sorted(glob.glob(glob.escape(base) + '.*')):
+                if not path.endswith(SIDECAR_EXTENSIONS):
+                    self._record(path)
+        return downloaded
+
+    def save_caption(self, filename, mtime, caption):
+        super().save_caption(filename, mtime, caption)
+        self._record(filename + '.txt')
+
+
+class InstaloaderPool:
+    """
+    Thread-safe pool of Instaloader instances, each used by one job at a time
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.size = config.get('pool_size', 4)
+        rate = config.get('requests_per_minute')
+        self.limiter = TokenBucket(rate / 60, config.get('burst', 1)) if rate else None
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self.borrows = 0
+        self.borrow_wait = 0.0
+
+    def create_loader(self):
+        config = self.config
+        if self.limiter is not None:
+            # Called by Instaloader with its context
+            rate_controller = functools.partial(LimitedRateController, limiter=self.limiter,
+                                                retry_sleep=config.get('sleep_time', 0))
+        else:
+            rate_controller = None
+
+        loader = RecordingInstaloader(
+            user_agent=config.get('user_agent'),
+            download_pictures=config.get('download_pictures', True),
+            download_videos=config.get('download_videos', True),
+            download_video_thumbnails=config.get('download_video_thumbnails', False),
+            download_geotags=config.get('download_geotags', False),
+            download_comments=config.get('download_comments', False),
+            save_metadata=config.get('save_metadata', False),
+            compress_json=config.get('compress_json', False),
+            filename_pattern=config.get('filename_pattern', '{date_utc}_UTC_{typename}'),
+            max_connection_attempts=config.get('max_connection_attempts', 3),
+            request_timeout=config.get('request_timeout', 300),
+            rate_controller=rate_controller,
+        )
+        username = config.get('session_username')
+        if username:
+            try:
+                # Reuse a session saved with `instaloader --login USER`
+                loader.load_session_from_file(username, config.get('session_file'))
+                logger.info('Loaded Instagram session', extra={'username': username})
+            except FileNotFoundError:
+                logger.warning('No saved Instagram session, continuing anonymously', extra={'username': username})
+        return loader
+
+    @contextmanager
+    def loader(self):
+        """
+        Borrow an Instaloader, waiting for one to be returned if all are in use
+        """
+        start = time.monotonic()
+        try:
+            loader = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    loader = self.create_loader()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                loader = self._idle.get()
+        with self._lock:
+            self.borrows += 1
+            self.borrow_wait += time.monotonic() - start
+        try:
+            yield loader
+        finally:
+            self._idle.put(loader)
+
+    def stats(self):
+        with self._lock:
+            data = {
+                'size': self.size,
+                'created': self._created,
+                'idle': self._idle.qsize(),
+                'borrows': self.borrows,
+                'avg_borrow_wait': round(self.borrow_wait / self.borrows, 3) if self.borrows else 0.0,
+            }
+        data['rate_limit'] = self.limiter.stats() if self.limiter else None
+        return data
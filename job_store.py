@@ -0,0 +1,256 @@
+"""
+Persistent job store backed by SQLite.
+
+Jobs are recorded when they are submitted, so queued and interrupted
+downloads can be resumed after a restart, and finished jobs form a download
+history that can be queried by the UI. Progress updates are only marked as
+dirty and written in batches by a background thread, so progress hooks never
+wait for the disk.
+
+When the app runs in several worker processes the database is also how they
+share job state: any worker can read the status of a job, pause requests for
+jobs running in another worker are left in the `control` column for the
+owning worker to apply, and `claim()` makes sure an interrupted job is only
+resumed by one worker.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    url TEXT,
+    options TEXT NOT NULL DEFAULT '{}',
+    title TEXT,
+    state TEXT NOT NULL,
+    message TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    bytes_done INTEGER NOT NULL DEFAULT 0,
+    total_bytes INTEGER,
+    output_path TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    paused INTEGER NOT NULL DEFAULT 0,
+    control TEXT,
+    owner TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+"""
+
+# Columns added after the first release, created on older databases
+MIGRATIONS = {
+    'paused': 'INTEGER NOT NULL DEFAULT 0',  # Whether the job was paused at the last flush
+    'control': 'TEXT',                       # 'pause' or 'resume' requested by another worker
+    'owner': 'TEXT',                         # Server run that submitted or resumed the job
+}
+
+# States of jobs that should be started again after a restart
+UNFINISHED_STATES = ('queued', 'running')
+
+
+class JobStore:
+    """
+    SQLite table of jobs with batched progress writes
+    """
+
+    def __init__(self, path, flush_interval=2.0, owner=None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.owner = owner
+        self._conn = None
+        self._jobs = {}  # Unfinished jobs running in this process
+        self._lock = threading.Lock()
+        self._dirty = {}
+        self._dirty_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher = None
+
+    def _connect(self):
+        # Opened lazily so the database file is only created when jobs are used
+        if self._conn is None:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+            for column, definition in MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} {definition}')
+            self._conn = conn
+        return self._conn
+
+    def add(self, job, options):
+        """
+        Record a newly submitted (or resubmitted) job
+        """
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    """
+                    INSERT INTO jobs (id, kind, url, options, title, state, message, created_at, owner)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET state = excluded.state, message = excluded.message,
+                        owner = excluded.owner, control = NULL
+                    """,
+                    (job.id, job.kind, options.get('url'), json.dumps(options), job.get('title'),
+                     job.get('state'), job.get('message'), job.created_at, self.owner))
+            self._jobs[job.id] = job
+        self._ensure_flusher()
+
+    def mark_dirty(self, job):
+        """
+        Queue the current status of a job for the next batched write
+        """
+        with self._dirty_lock:
+            self._dirty[job.id] = job
+        if job.is_finished:
+            # Final states are written right away
+            self._wakeup.set()
+
+    def flush(self):
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+        rows = []
+        for job in dirty.values():
+            status = job.snapshot()
+            rows.append((status.get('title'), status.get('state'), status.get('message'),
+                         status.get('progress') or 0, status.get('downloaded_bytes') or 0,
+                         status.get('total_bytes'), status.get('output_path'),
+                         job.started_at, job.finished_at, int(bool(status.get('is_paused'))), job.id))
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    """
+                    UPDATE jobs SET title = ?, state = ?, message = ?, progress = ?, bytes_done = ?,
+                        total_bytes = ?, output_path = ?, started_at = ?, finished_at = ?, paused = ?
+                    WHERE id = ?
+                    """, rows)
+
+    def unfinished(self):
+        """
+        Return jobs that were queued or running when the server stopped
+        """
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                f"SELECT * FROM jobs WHERE state IN ({', '.join('?' * len(UNFINISHED_STATES))}) "
+                "ORDER BY created_at", UNFINISHED_STATES).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def claim(self, job_id):
+        """
+        Take over an unfinished job for this server run
+
+        Returns False when another worker of the same run already claimed it.
+        """
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                cursor = conn.execute('UPDATE jobs SET owner = ? WHERE id = ? AND (owner IS NULL OR owner != ?)',
+                                      (self.owner, job_id, self.owner))
+        return cursor.rowcount == 1
+
+    def request_control(self, job_id, action):
+        """
+        Ask the worker running job_id to 'pause' or 'resume' it
+        """
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                cursor = conn.execute(
+                    f"UPDATE jobs SET control = ? WHERE id = ? "
+                    f"AND state IN ({', '.join('?' * len(UNFINISHED_STATES))})",
+                    (action, job_id) + UNFINISHED_STATES)
+        return cursor.rowcount == 1
+
+    def apply_controls(self):
+        """
+        Pause or resume local jobs as requested by other workers
+        """
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items() if job.is_finished]:
+                del self._jobs[job_id]
+            if not self._jobs:
+                return
+            conn = self._connect()
+            rows = conn.execute(
+                f"SELECT id, control FROM jobs WHERE control IS NOT NULL "
+                f"AND id IN ({', '.join('?' * len(self._jobs))})", list(self._jobs)).fetchall()
+            if rows:
+                with conn:
+                    conn.executemany('UPDATE jobs SET control = NULL WHERE id = ?', [(row['id'],) for row in rows])
+            requests = [(self._jobs[row['id']], row['control']) for row in rows]
+        for job, action in requests:
+            if action == 'pause':
+                job.pause()
+            elif action == 'resume':
+                job.resume()
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def history(self, page=1, per_page=20, state=None):
+        """
+        Return one page of jobs, newest first, and the total number of jobs
+        """
+        # Include progress that hasn't been written yet
+        self.flush()
+        where, params = '', []
+        if state:
+            where, params = 'WHERE state = ?', [state]
+        with self._lock:
+            conn = self._connect()
+            total = conn.execute(f'SELECT COUNT(*) FROM jobs {where}', params).fetchone()[0]
+            rows = conn.execute(
+                f'SELECT * FROM jobs {where} ORDER BY created_at DESC LIMIT ? OFFSET ?',
+                params + [per_page, (page - 1) * per_page]).fetchall()
+        return [self._row_to_dict(row) for row in rows], total
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _ensure_flusher(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True, name='job-store-flusher')
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                self.apply_controls()
+            except sqlite3.Error as e:
+                logger.error('Error saving job progress', extra={'error': str(e)})
+            time.sleep(0.05)
+
+    @staticmethod
+    def _row_to_dict(row):
+        data = dict(row)
+        data['options'] = json.loads(data.get('options') or '{}')
+        data['job_id'] = data.pop('id')
+        return data
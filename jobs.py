@@ -0,0 +1,363 @@
+"""
+Background job queue for downloads.
+
+Every download request becomes a Job with its own ID and progress record.
+Jobs are queued and executed by a bounded pool of worker threads so several
+downloads can run at the same time.
+
+A job runs in stages: the download stage is bounded by how many network
+transfers should run at once, and a job can hand its CPU-bound remainder
+(merging, converting, tagging) to a post-processing stage sized to the CPU
+count, freeing its download worker for the next job right away.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHED = 'finished'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+FINAL_STATES = (FINISHED, FAILED, SKIPPED)
+
+
+class Handoff:
+    """
+    Returned by a job target to continue the job in another stage
+
+    `target(job, *args, **kwargs)` is queued on `stage` and the job keeps
+    running until it returns.
+    """
+
+    def __init__(self, stage, target, *args, **kwargs):
+        self.stage = stage
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs
+
+
+class Job:
+    """
+    A single download job and its progress record
+    """
+
+    def __init__(self, kind, title='', job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+        # Notified on every status change so listeners don't have to poll
+        self._changed = threading.Condition(self._lock)
+        self.version = 0
+        # Set while the job may run, cleared while it is paused
+        self._resume = threading.Event()
+        self._resume.set()
+        # Stage step set aside because the job was paused before it started
+        self._parked = None
+        # Batch jobs aggregate the progress of one child job per entry
+        self.parent = None
+        self.children = []
+        # Callbacks invoked with the job after every status change
+        self.watchers = []
+        self.status = {
+            'state': QUEUED,
+            'is_downloading': False,
+            'is_paused': False,
+            'progress': 0,
+            'message': 'Waiting in queue...',
+            'current_file': None,
+            'title': title or '',
+        }
+
+    def update(self, **fields):
+        with self._lock:
+            self.status.update(fields)
+            self.version += 1
+            self._changed.notify_all()
+        if self.parent is not None:
+            self.parent.touch()
+        for watcher in self.watchers:
+            watcher(self)
+
+    def touch(self):
+        """
+        Wake up listeners without changing the status (used when a child changes)
+        """
+        with self._lock:
+            self.version += 1
+            self._changed.notify_all()
+
+    def add_child(self, child):
+        child.parent = self
+        with self._lock:
+            self.children.append(child)
+        return child
+
+    def wait_for_change(self, version, timeout=None):
+        """
+        Block until the status version differs from `version` or timeout expires
+        
+        Returns the current version.
+        """
+        with self._lock:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self.status.get(key, default)
+
+    def pause(self):
+        self._resume.clear()
+        for child in self.children:
+            if not child.is_finished:
+                child.pause()
+        self.update(is_paused=True, message='Download paused')
+
+    def resume(self):
+        self.update(is_paused=False, message='Resuming download...')
+        for child in self.children:
+            if child.get('is_paused'):
+                child.resume()
+        with self._lock:
+            self._resume.set()
+            parked, self._parked = self._parked, None
+        if parked is not None:
+            stage, target, args, kwargs = parked
+            stage.submit(self, target, *args, **kwargs)
+
+    def park(self, stage, target, args, kwargs):
+        """
+        Set aside a step dequeued by `stage` while the job is paused
+
+        Returns False when the job is not paused and the step should run now;
+        otherwise the step is submitted to `stage` again by `resume()`.
+        """
+        with self._lock:
+            if self._resume.is_set():
+                return False
+            self._parked = (stage, target, args, kwargs)
+            return True
+
+    def wait_while_paused(self):
+        """
+        Block the calling worker thread for as long as the job is paused
+        
+        The download is suspended in place, so open connections and partial
+        files are kept and the transfer continues from the same byte offset.
+        """
+        self._resume.wait()
+
+    @property
+    def is_finished(self):
+        return self.get('state') in FINAL_STATES
+
+    def wait_until_finished(self, timeout=None):
+        """
+        Block until the job reached a final state, returns whether it did
+        """
+        with self._lock:
+            return self._changed.wait_for(lambda: self.status.get('state') in FINAL_STATES, timeout)
+
+    def run(self, target, *args, **kwargs):
+        """
+        Execute `target(self, *args, **kwargs)` and record the final state
+        
+        When the target returns a Handoff the job is queued on the next
+        stage instead, and the final state is recorded once that finishes.
+        """
+        if self.started_at is None:
+            self.started_at = time.time()
+            self.update(state=RUNNING, is_downloading=True, message='Starting download...')
+        final = {'is_downloading': False}
+        try:
+            result = target(self, *args, **kwargs)
+            if isinstance(result, Handoff) and self.get('state') == RUNNING:
+                result.stage.submit(self, result.target, *result.args, **result.kwargs)
+                return
+        except Exception as e:
+            # First line of the error, or its repr when it has no message
+            detail = str(e).splitlines()[0] if str(e) else repr(e)
+            final.update(state=FAILED, message=f"Error: {detail}")
+        if self.get('state') == RUNNING:
+            final.setdefault('state', FINISHED)
+        self.finished_at = time.time()
+        # A single update so listeners never see a finished job that is still downloading
+        self.update(**final)
+        state = self.get('state')
+        metrics.JOBS.inc(kind=self.kind, state=state)
+        logger.info('Job %s', state, extra={'job_id': self.id, 'kind': self.kind, 'state': state,
+                                            'seconds': round(self.finished_at - self.started_at, 3),
+                                            'detail': self.get('message')})
+
+    def snapshot(self):
+        """
+        Return a JSON serializable copy of the job status
+        """
+        with self._lock:
+            data = dict(self.status)
+            children = list(self.children)
+        data['job_id'] = self.id
+        data['kind'] = self.kind
+        if children:
+            entries = [child.snapshot() for child in children]
+            data['entries'] = entries
+            data['progress'] = sum(e['progress'] for e in entries) / len(entries)
+            data['counts'] = {state: sum(1 for e in entries if e['state'] == state)
+                              for state in (QUEUED, RUNNING, FINISHED, FAILED, SKIPPED)}
+        return data
+
+
+class Stage:
+    """
+    Queue of job steps executed by a fixed number of worker threads, with timings
+    """
+
+    def __init__(self, name, max_workers):
+        self.name = name
+        self.max_workers = max_workers
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._active = 0
+        self._completed = 0
+        self._wait_time = 0.0
+        self._run_time = 0.0
+        self._max_run_time = 0.0
+
+    def submit(self, job, target, *args, **kwargs):
+        """
+        Queue `job.run(target, *args, **kwargs)` on this stage
+        """
+        with self._lock:
+            self._ensure_workers()
+        self._queue.put((time.monotonic(), job, target, args, kwargs))
+
+    def queue_size(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            completed = self._completed
+            return {
+                'workers': self.max_workers,
+                'queued': self._queue.qsize(),
+                'active': self._active,
+                'completed': completed,
+                'avg_wait': round(self._wait_time / completed, 3) if completed else 0.0,
+                'avg_time': round(self._run_time / completed, 3) if completed else 0.0,
+                'max_time': round(self._max_run_time, 3),
+            }
+
+    def _ensure_workers(self):
+        # Workers are started lazily so importing the module stays cheap
+        self._workers = [w for w in self._workers if w.is_alive()]
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._worker, daemon=True,
+                                      name=f'{self.name}-worker-{len(self._workers) + 1}')
+            worker.start()
+            self._workers.append(worker)
+
+    def _worker(self):
+        while True:
+            queued_at, job, target, args, kwargs = self._queue.get()
+            # A job paused while queued gives up its turn until it is resumed
+            if job.started_at is None and job.park(self, target, args, kwargs):
+                self._queue.task_done()
+                continue
+            started = time.monotonic()
+            metrics.QUEUE_WAIT_SECONDS.observe(started - queued_at, stage=self.name, kind=job.kind)
+            with self._lock:
+                self._active += 1
+                self._wait_time += started - queued_at
+            try:
+                job.run(target, *args, **kwargs)
+            finally:
+                elapsed = time.monotonic() - started
+                metrics.STAGE_SECONDS.observe(elapsed, stage=self.name, kind=job.kind)
+                with self._lock:
+                    self._active -= 1
+                    self._completed += 1
+                    self._run_time += elapsed
+                    self._max_run_time = max(self._max_run_time, elapsed)
+                self._queue.task_done()
+
+
+class JobManager:
+    """
+    Jobs executed by a download stage, with a post-processing stage to hand off to
+    """
+
+    def __init__(self, max_workers=3, max_history=200, store=None, postprocess_workers=None):
+        self.max_workers = max_workers
+        self.max_history = max_history
+        # Optional persistent store (see job_store.JobStore)
+        self.store = store
+        self.download_stage = Stage('download', max_workers)
+        self.postprocess_stage = Stage('postprocess', postprocess_workers or os.cpu_count() or 2)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind, target, *args, title='', job_id=None, **kwargs):
+        """
+        Create a job and queue `target(job, *args, **kwargs)` for execution
+        
+        Keyword arguments are saved in the job store, so jobs that should
+        survive a restart must pass their options as keywords.
+        """
+        job = Job(kind, title=title, job_id=job_id)
+        if self.store is not None:
+            self.store.add(job, kwargs)
+            job.watchers.append(self.store.mark_dirty)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self.download_stage.submit(job, target, *args, **kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def latest(self, kind=None):
+        """
+        Return the most recently submitted job (optionally of a given kind)
+        """
+        with self._lock:
+            for job in reversed(self._jobs.values()):
+                if kind is None or job.kind == kind:
+                    return job
+        return None
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def queue_size(self):
+        return self.download_stage.queue_size()
+
+    def stats(self):
+        return {stage.name: stage.stats() for stage in (self.download_stage, self.postprocess_stage)}
+
+    def _prune(self):
+        # Forget the oldest finished jobs once history grows too large
+        if len(self._jobs) <= self.max_history:
+            return
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_history:
+                break
+            if self._jobs[job_id].is_finished:
+                del self._jobs[job_id]
@@ -0,0 +1,84 @@
+"""
+Logging setup from instagram_config.LOGGING_CONFIG.
+
+Messages go to the console in a readable form and, when logging is enabled,
+to a rotating log file as JSON lines. Fields passed with `extra={...}` stay
+separate keys in the file, so it can be filtered without parsing messages:
+
+    logger.info('Download finished', extra={'job_id': job.id, 'bytes': size})
+"""
+import json
+import logging
+import os
+from logging.handlers import RotatingFileHandler
+
+# Attributes every LogRecord has, anything else came from `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+_configured = False
+
+
+def record_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line with time, level, logger, message and the extra fields
+    """
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        data.update(record_fields(record))
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """
+    "time LEVEL logger: message key=value ..."
+    """
+
+    def format(self, record):
+        line = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        return line
+
+
+def configure_logging(config, base_folder='.'):
+    """
+    Set up the root logger once per process from a LOGGING_CONFIG dict
+
+    Returns False when logging was already configured.
+    """
+    global _configured
+    if _configured:
+        return False
+    _configured = True
+
+    root = logging.getLogger()
+    console = logging.StreamHandler()
+    console.setFormatter(ConsoleFormatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    root.addHandler(console)
+
+    if not config.get('enabled', True):
+        root.setLevel(logging.WARNING)
+        return True
+
+    root.setLevel(getattr(logging, str(config.get('level', 'INFO')).upper(), logging.INFO))
+    if config.get('log_file'):
+        # delay: the file is only created when the first message is written
+        handler = RotatingFileHandler(os.path.join(base_folder, config['log_file']),
+                                      maxBytes=config.get('max_log_size', 0), backupCount=3,
+                                      encoding='utf-8', delay=True)
+        handler.setFormatter(JsonFormatter())
+        root.addHandler(handler)
+    return True
@@ -0,0 +1,229 @@
+"""
+Content-addressed index of finished downloads.
+
+Finished files are indexed by (extractor, video id, format selection, mode),
+plus the page URL for the generic extractor whose ids are only file names,
+so a repeated request is served from the existing file through a hardlink
+(or a copy when linking isn't possible) instead of downloading and
+transcoding it again. Identical requests that are already running are
+tracked too, so a duplicate job can follow the running one instead of
+starting a second download. When a quota is set, the least recently used
+files are removed to keep the indexed files under it.
+
+The index is a SQLite table shared by all worker processes. Cache hits
+only move a file up the LRU order, so their times are kept in memory and
+written in batches (with the next added file, or every `touch_interval`
+seconds) instead of on every hit.
+"""
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from info_cache import normalize_url
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS media_last_used ON media (last_used);
+"""
+
+
+def make_key(info, format_selector, mode):
+    """
+    Return the cache key of a download, or None when the video can't be identified
+    """
+    extractor = info.get('extractor_key') or info.get('ie_key') or info.get('extractor')
+    video_id = info.get('id')
+    if not extractor or not video_id:
+        return None
+    parts = [extractor.lower(), str(video_id)]
+    if extractor.lower() == 'generic' or info.get('_type') in ('url', 'url_transparent'):
+        # The id is only the file name of the URL here ("video", "clip"),
+        # unrelated pages share it, so the page itself is part of the key
+        page_url = info.get('webpage_url') or info.get('original_url')
+        if not page_url:
+            return None
+        parts.append(normalize_url(page_url))
+    raw = '\x1f'.join(parts + [format_selector or 'default', mode or 'Video'])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class MediaCache:
+    """
+    LRU index of finished media files with an optional size quota
+    """
+
+    def __init__(self, index_path, quota_bytes=None, touch_interval=30.0):
+        self.index_path = index_path
+        self.quota_bytes = quota_bytes
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._inflight = {}
+        self._touched = {}  # key -> last_used of hits not written yet
+        self._last_touch_write = time.monotonic()
+
+    def _connect(self):
+        # Opened lazily so the index is only created when downloads are cached
+        if self._conn is None:
+            folder = os.path.dirname(self.index_path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            conn = sqlite3.connect(self.index_path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def lookup(self, key):
+        """
+        Return the path of the cached file for key, or None
+        """
+        if key is None:
+            return None
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute('SELECT path FROM media WHERE key = ?', (key,)).fetchone()
+            if row and not os.path.isfile(row[0]):
+                # The file was moved or deleted outside the app
+                with conn:
+                    conn.execute('DELETE FROM media WHERE key = ?', (key,))
+                self._touched.pop(key, None)
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Hits only bump last_used, written in batches rather than on every hit
+            self._touched[key] = time.time()
+            if time.monotonic() - self._last_touch_write >= self.touch_interval:
+                self._write_touched()
+            return row[0]
+
+    def add(self, key, path):
+        """
+        Index a finished file and evict old files if the quota is exceeded
+        """
+        if key is None or not os.path.isfile(path):
+            return
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO media (key, path, size, last_used) VALUES (?, ?, ?, ?)',
+                             (key, os.path.abspath(path), os.path.getsize(path), time.time()))
+            self._touched.pop(key, None)
+            # Eviction needs the recent hits to pick the least recently used files
+            self._write_touched()
+            self._evict(keep=key)
+
+    def flush(self):
+        """
+        Write the last_used times of recent hits
+        """
+        with self._lock:
+            self._write_touched()
+
+    def begin(self, key, job):
+        """
+        Register job as the download for key, returns the job already running it (if any)
+        """
+        if key is None:
+            return None
+        with self._lock:
+            owner = self._inflight.get(key)
+            if owner is not None and not owner.is_finished:
+                return owner
+            self._inflight[key] = job
+            return None
+
+    def end(self, key, job):
+        with self._lock:
+            if self._inflight.get(key) is job:
+                del self._inflight[key]
+
+    def stats(self):
+        with self._lock:
+            files, size = self._connect().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM media').fetchone()
+            total = self.hits + self.misses
+            return {
+                'files': files,
+                'bytes': size,
+                'quota_bytes': self.quota_bytes,
+                'inflight': len(self._inflight),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            }
+
+    @staticmethod
+    def materialize(source, destination):
+        """
+        Make the cached file available at destination, preferring a hardlink
+
+        An unrelated file already at destination is kept and the next free
+        name, like "name (1).mp4", is used instead. Returns the path used.
+        """
+        base, ext = os.path.splitext(destination)
+        number = 0
+        while True:
+            candidate = f'{base} ({number}){ext}' if number else destination
+            number += 1
+            if os.path.exists(candidate):
+                if os.path.samefile(source, candidate):
+                    return candidate
+                continue
+            try:
+                os.link(source, candidate)
+            except FileExistsError:
+                continue
+            except OSError:
+                # Different file system, or links not supported
+                try:
+                    with open(source, 'rb') as src, open(candidate, 'xb') as dst:
+                        shutil.copyfileobj(src, dst)
+                except FileExistsError:
+                    continue
+                shutil.copystat(source, candidate)
+            return candidate
+
+    def _write_touched(self):
+        touched, self._touched = self._touched, {}
+        self._last_touch_write = time.monotonic()
+        if touched:
+            with self._connect() as conn:
+                # Another worker may have marked the file used more recently
+                conn.executemany('UPDATE media SET last_used = MAX(last_used, ?) WHERE key = ?',
+                                 [(last_used, key) for key, last_used in touched.items()])
+
+    def _evict(self, keep=None):
+        if not self.quota_bytes:
+            return
+        conn = self._connect()
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM media').fetchone()[0]
+        if total <= self.quota_bytes:
+            return
+        busy = {os.path.abspath(job.get('output_path') or '') for job in self._inflight.values()}
+        evicted = []
+        for key, path, size in conn.execute('SELECT key, path, size FROM media ORDER BY last_used').fetchall():
+            if total <= self.quota_bytes:
+                break
+            if key == keep or path in busy:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+            evicted.append((key,))
+        with conn:
+            conn.executemany('DELETE FROM media WHERE key = ?', evicted)
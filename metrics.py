@@ -0,0 +1,237 @@
+"""
+Prometheus metrics for the downloader, without extra dependencies.
+
+Counters and histograms with labels are kept in process memory and rendered
+in the Prometheus text format by `/metrics`. Numbers that already live
+elsewhere (cache statistics, queue depths) are read when scraped through
+callbacks. Every worker process keeps its own numbers, so with several
+workers each scrape shows the worker that answered it.
+
+The downloader's metrics are defined at the bottom, labelled by extractor
+(yt-dlp's `extractor_key`) and mode where that is known.
+"""
+import threading
+import time
+
+# Seconds, from a fast cache lookup to a long transcode
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# Bytes per second, from a slow mobile link to a local disk
+THROUGHPUT_BUCKETS = tuple(2 ** power for power in range(16, 31, 2))
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+class Registry:
+    """
+    Metrics rendered together by `/metrics`
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {', '.join(self.labelnames)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key):
+        return dict(zip(self.labelnames, key))
+
+
+class Counter(Metric):
+    """
+    A value that only goes up
+    """
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, self._labels(key), value
+
+
+class Histogram(Metric):
+    """
+    Observations counted into cumulative buckets, with their sum and count
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[0][index] += 1
+                    break
+            counts[1] += value
+            counts[2] += 1
+
+    def time(self, **labels):
+        """
+        Context manager observing the seconds its block took
+        """
+        return _Timer(self, labels)
+
+    def count(self, **labels):
+        with self._lock:
+            counts = self._values.get(self._key(labels))
+            return counts[2] if counts else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, ([*counts[0]], counts[1], counts[2])) for key, counts in self._values.items())
+        for key, (buckets, total, count) in values:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, buckets):
+                cumulative += bucket
+                yield f'{self.name}_bucket', dict(labels, le=_format_value(bound)), cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, count
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.monotonic() - self.started, **self.labels)
+
+
+class CallbackMetric(Metric):
+    """
+    Samples read from `callback()`, an iterable of (labels dict, value), on every scrape
+    """
+
+    def __init__(self, name, documentation, callback, type='gauge', registry=REGISTRY):
+        super().__init__(name, documentation, registry=registry)
+        self.type = type
+        self.callback = callback
+
+    def samples(self):
+        for labels, value in self.callback():
+            yield self.name, labels, value
+
+
+class TransferMetrics:
+    """
+    Time to first byte, duration, bytes and throughput of one download
+    """
+
+    def __init__(self, extractor, mode):
+        self.labels = {'extractor': extractor or 'unknown', 'mode': mode}
+        self.started = time.monotonic()
+        self.first_byte_at = None
+
+    def progress(self, downloaded_bytes):
+        if self.first_byte_at is None and downloaded_bytes:
+            self.first_byte_at = time.monotonic()
+            TIME_TO_FIRST_BYTE.observe(self.first_byte_at - self.started, **self.labels)
+
+    def finish(self, total_bytes):
+        now = time.monotonic()
+        DOWNLOAD_SECONDS.observe(now - self.started, **self.labels)
+        if not total_bytes:
+            return
+        DOWNLOAD_BYTES.inc(total_bytes, **self.labels)
+        transfer_time = now - (self.first_byte_at or self.started)
+        if transfer_time > 0:
+            DOWNLOAD_THROUGHPUT.observe(total_bytes / transfer_time, **self.labels)
+
+
+# --- Downloader metrics ---
+EXTRACTION_SECONDS = Histogram(
+    'downloader_extraction_seconds', 'Time to extract video information with yt-dlp', ['extractor'])
+TIME_TO_FIRST_BYTE = Histogram(
+    'downloader_time_to_first_byte_seconds', 'Time from the start of a download to its first byte',
+    ['extractor', 'mode'])
+DOWNLOAD_SECONDS = Histogram(
+    'downloader_download_seconds', 'Time spent downloading, without post-processing', ['extractor', 'mode'])
+DOWNLOAD_BYTES = Counter(
+    'downloader_download_bytes_total', 'Bytes downloaded from origins', ['extractor', 'mode'])
+DOWNLOAD_THROUGHPUT = Histogram(
+    'downloader_download_throughput_bytes_per_second', 'Average speed of each download after its first byte',
+    ['extractor', 'mode'], buckets=THROUGHPUT_BUCKETS)
+POSTPROCESS_SECONDS = Histogram(
+    'downloader_postprocess_seconds', 'Time of each post-processing step (merge, transcode, remux, tag, cover...)',
+    ['extractor', 'mode', 'step'])
+QUEUE_WAIT_SECONDS = Histogram(
+    'downloader_queue_wait_seconds', 'Time jobs waited in the queue of a stage', ['stage', 'kind'])
+STAGE_SECONDS = Histogram(
+    'downloader_stage_seconds', 'Time jobs spent running in a stage', ['stage', 'kind'])
+JOBS = Counter('downloader_jobs_total', 'Jobs that reached a final state', ['kind', 'state'])
+SERVED_REQUESTS = Counter(
+    'downloader_served_requests_total', 'Requests for finished downloads by response status', ['status'])
+SERVED_BYTES = Counter(
+    'downloader_served_bytes_total', 'Body bytes of finished downloads sent by the app', ['status'])
@@ -0,0 +1,91 @@
+"""
+Cache of Instagram post metadata keyed by shortcode (CACHE_SETTINGS).
+
+Fetching a post and then downloading it needs the same GraphQL response
+twice. The post's node data and its media URLs are kept in memory and on
+disk for `cache_duration` seconds so the second lookup, and lookups after
+a restart, skip the round-trip to Instagram.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class PostCache:
+    """
+    In-memory LRU in front of one JSON file per shortcode
+    """
+
+    def __init__(self, folder, ttl=3600, max_entries=256):
+        self.folder = folder
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, shortcode):
+        return os.path.join(self.folder, f'{shortcode}.json')
+
+    def _is_fresh(self, entry):
+        return time.time() - entry['stored_at'] <= self.ttl
+
+    def get(self, shortcode):
+        """
+        Return {'node', 'media_items', 'stored_at'} for shortcode, or None
+        """
+        with self._lock:
+            entry = self._entries.get(shortcode)
+            if entry is not None and self._is_fresh(entry):
+                self._entries.move_to_end(shortcode)
+                self.hits += 1
+                return entry
+            self._entries.pop(shortcode, None)
+
+        try:
+            with open(self._path(shortcode), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        with self._lock:
+            if entry is None or not self._is_fresh(entry):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(shortcode, entry)
+        return entry
+
+    def put(self, shortcode, node, media_items):
+        entry = {'node': node, 'media_items': media_items, 'stored_at': time.time()}
+        with self._lock:
+            self._remember(shortcode, entry)
+        path = self._path(shortcode)
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(path + '.tmp', path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning('Could not cache Instagram post on disk', extra={'shortcode': shortcode, 'error': str(e)})
+
+    def _remember(self, shortcode, entry):
+        self._entries[shortcode] = entry
+        self._entries.move_to_end(shortcode)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,64 @@
+"""
+Post-processing of yt-dlp downloads as a separate job stage.
+
+yt-dlp merges formats, converts audio and runs its fixups right after the
+download, in the thread that downloaded. `DeferredPostProcessing` makes a
+YoutubeDL record that work instead of running it, so the download worker
+is free as soon as the bytes are on disk, and runs it later in the
+post-processing stage (see jobs.Stage) with the same YoutubeDL.
+"""
+import time
+
+import metrics
+
+# Step reported in metrics.POSTPROCESS_SECONDS for yt-dlp's postprocessors,
+# the others are reported by their lowercased name
+STEP_NAMES = {'Merger': 'merge', 'ExtractAudio': 'transcode', 'MoveFiles': 'move'}
+
+
+def step_timer(extractor, mode, step_names=None):
+    """
+    Return a yt-dlp `postprocessor_hooks` entry timing every postprocessor that runs
+
+    `step_names` overrides STEP_NAMES, it is read when a step finishes.
+    """
+    step_names = {} if step_names is None else step_names
+    started = {}
+
+    def hook(d):
+        name = d.get('postprocessor')
+        if d['status'] == 'started':
+            started[name] = time.monotonic()
+        elif d['status'] == 'finished' and name in started:
+            step = step_names.get(name) or STEP_NAMES.get(name, str(name).lower())
+            metrics.POSTPROCESS_SECONDS.observe(time.monotonic() - started.pop(name), extractor=extractor,
+                                                mode=mode, step=step)
+    return hook
+
+
+class DeferredPostProcessing:
+    """
+    Record the post-processing of ydl's downloads until run() is called
+    """
+
+    def __init__(self, ydl):
+        self.ydl = ydl
+        self.pending = []
+        self._post_process = ydl.post_process
+        ydl.post_process = self._record
+
+    def _record(self, filename, info, files_to_move=None):
+        # Same contract as YoutubeDL.post_process, minus the work
+        info['filepath'] = filename
+        self.pending.append((filename, info, files_to_move))
+        return info
+
+    def run(self):
+        """
+        Merge, convert and move the recorded downloads, return the info of the last one
+        """
+        info = None
+        while self.pending:
+            filename, entry, files_to_move = self.pending.pop(0)
+            info = self._post_process(filename, entry, files_to_move)
+        return info
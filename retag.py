@@ -0,0 +1,111 @@
+"""
+Retag an existing audio library from the .info.json files saved next to it.
+
+Every audio file (mp3, or m4a/opus kept in its original codec) with a
+`<name>.info.json` beside it gets its tags written again by
+`add_metadata_to_audio`, so the library follows the current tagging rules
+(e.g. new genre rules) without downloading anything. Cover art already in
+the files is kept. Files are tagged by several processes in parallel.
+
+The genre rules are the ones the app uses: DOWNLOADER_GENRE_RULES when it
+is set, otherwise the built-in tagging.GENRE_RULES. --rules reads them
+from a JSON file instead, a list of [genre, priority, [keywords]].
+
+The app deletes the .info.json of audio downloads once they are tagged,
+set KEEP_AUDIO_INFO_JSON (DOWNLOADER_KEEP_AUDIO_INFO_JSON=true) to keep them.
+
+Usage:
+    python retag.py LIBRARY [--workers 8] [--rules rules.json] [--dry-run]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from tagging import GENRE_RULES, add_metadata_to_audio, configure_genres
+
+AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.opus')
+
+
+def find_audio_files(folder):
+    """
+    Return (audio files with an .info.json, number of audio files without one)
+    """
+    found = []
+    missing = 0
+    for root, _, names in os.walk(folder):
+        names = set(names)
+        for name in sorted(names):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() not in AUDIO_EXTENSIONS:
+                continue
+            if stem + '.info.json' in names:
+                found.append(os.path.join(root, name))
+            else:
+                missing += 1
+    return found, missing
+
+
+def load_genre_rules(path=None):
+    """
+    Genre rules from a JSON file, DOWNLOADER_GENRE_RULES or the built-in table, in that order
+    """
+    if path:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    if os.environ.get('DOWNLOADER_GENRE_RULES'):
+        return json.loads(os.environ['DOWNLOADER_GENRE_RULES'])
+    return GENRE_RULES
+
+
+def retag_file(path):
+    """
+    Write the tags of path again from its .info.json, return True when they were written
+    """
+    try:
+        with open(os.path.splitext(path)[0] + '.info.json', encoding='utf-8') as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return add_metadata_to_audio(path, info)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('library', help='folder searched recursively for audio files')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='processes tagging files')
+    parser.add_argument('--rules', help='JSON file with the genre rules, instead of the app setting')
+    parser.add_argument('--dry-run', action='store_true', help='only count the files that would be retagged')
+    args = parser.parse_args()
+    args.workers = max(1, args.workers)
+    rules = load_genre_rules(args.rules)
+
+    files, missing = find_audio_files(args.library)
+    print(f"🎵 {len(files)} file(s) to retag, {missing} without .info.json skipped")
+    if args.dry_run or not files:
+        return 0
+
+    started = time.time()
+    failed = []
+    # Every process tags with the same rules
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=configure_genres, initargs=(rules,)) as pool:
+        # Files are handed out in chunks, one task per file costs more than tagging it
+        chunksize = max(1, min(256, len(files) // (args.workers * 4)))
+        for done, (path, ok) in enumerate(zip(files, pool.map(retag_file, files, chunksize=chunksize)), start=1):
+            if not ok:
+                failed.append(path)
+            if done % 1000 == 0:
+                print(f"   {done} of {len(files)}")
+
+    elapsed = time.time() - started
+    print(f"✅ Retagged {len(files) - len(failed)} file(s) in {elapsed:.1f}s "
+          f"({len(files) / elapsed:.0f} files/s)")
+    for path in failed:
+        print(f"❌ {path}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Production server for Universal Video Downloader.
+
+Runs the app under gunicorn with threaded workers and without the debug
+reloader. `python app.py` stays the development server.
+
+Usage:
+    python serve.py [--bind 0.0.0.0:5000] [--workers 1] [--threads 32] [--timeout 120]
+
+Every option can also be set with an environment variable (DOWNLOADER_BIND,
+DOWNLOADER_WORKERS, DOWNLOADER_THREADS, DOWNLOADER_TIMEOUT), and app settings
+with DOWNLOADER_<SETTING>, e.g. DOWNLOADER_DOWNLOAD_FOLDER.
+
+One worker process with many threads is the default: downloads run in
+background threads of the process that accepted them, and every open
+progress stream keeps a thread busy. More workers work too, they share job
+status, pause requests and resuming through the job database.
+
+On Windows, where gunicorn does not run, waitress is used when installed,
+otherwise the threaded Flask server.
+"""
+import argparse
+import os
+import uuid
+
+
+def server_settings():
+    """
+    Server settings from the environment, with the defaults
+    """
+    return {
+        'bind': os.environ.get('DOWNLOADER_BIND', '0.0.0.0:5000'),
+        'workers': int(os.environ.get('DOWNLOADER_WORKERS', 1)),
+        'threads': int(os.environ.get('DOWNLOADER_THREADS', 32)),
+        'timeout': int(os.environ.get('DOWNLOADER_TIMEOUT', 120)),  # Seconds before a stuck worker is restarted
+    }
+
+
+def new_server_run():
+    """
+    Give all worker processes of this run the same ID, before they are started
+    """
+    return os.environ.setdefault('DOWNLOADER_SERVER_RUN', f'run-{uuid.uuid4().hex}')
+
+
+def start_app():
+    """
+    Import the app, resume the downloads a previous run left unfinished and warm up
+    """
+    from app import app, create_download_folder, resume_unfinished_jobs, warm_up
+    from instagram_config import LOGGING_CONFIG
+    from log_config import configure_logging
+    configure_logging(LOGGING_CONFIG, app.root_path)
+    create_download_folder()
+    resume_unfinished_jobs()
+    warm_up()
+    return app
+
+
+def run_gunicorn(settings):
+    from gunicorn.app.base import BaseApplication
+
+    class DownloaderServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', settings['bind'])
+            self.cfg.set('workers', settings['workers'])
+            self.cfg.set('threads', settings['threads'])
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('timeout', settings['timeout'])
+            self.cfg.set('graceful_timeout', 30)
+            self.cfg.set('accesslog', '-')
+
+        def load(self):
+            # Runs in every worker, after the fork
+            return start_app()
+
+    DownloaderServer().run()
+
+
+def run_fallback(settings):
+    host, _, port = settings['bind'].rpartition(':')
+    app = start_app()
+    try:
+        from waitress import serve
+    except ImportError:
+        print("⚠️ gunicorn and waitress are not available, using the threaded Flask server")
+        app.run(host=host or '0.0.0.0', port=int(port), threaded=True, debug=False)
+        return
+    serve(app, host=host or '0.0.0.0', port=int(port), threads=settings['threads'],
+          channel_timeout=settings['timeout'])
+
+
+def main():
+    settings = server_settings()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bind', default=settings['bind'], help='host:port to listen on')
+    parser.add_argument('--workers', type=int, default=settings['workers'], help='worker processes')
+    parser.add_argument('--threads', type=int, default=settings['threads'], help='threads per worker')
+    parser.add_argument('--timeout', type=int, default=settings['timeout'], help='worker timeout in seconds')
+    settings = vars(parser.parse_args())
+
+    new_server_run()
+    print(f"🚀 Serving on {settings['bind']} with {settings['workers']} worker(s) x {settings['threads']} threads")
+    if os.name == 'nt':
+        run_fallback(settings)
+    else:
+        run_gunicorn(settings)
+
+
+if __name__ == '__main__':
+    main()
@@ -28,8 +28,12 @@ document.addEventListener('DOMContentLoaded', function() {
     const downloadSelectedMedia = document.getElementById('downloadSelectedMedia');
     const selectedCountSpan = document.getElementById('selectedCount');
     const mediaCountBadge = document.getElementById('mediaCount');
+    const bulkTitles = document.getElementById('bulk-titles');
+    const bulkTitleList = document.getElementById('bulkTitleList');
 
     let currentFile = null;
+    let currentJobId = null;
+    let currentTitle = '';
     let currentThumbnailUrl = null;
     let instagramMediaItems = [];
     let selectedMediaIndices = new Set();
@@ -66,6 +70,7 @@ document.addEventListener('DOMContentLoaded', function() {
         clearUrlBtn.style.display = 'none';
         hideVideoInfo();
         hideInstagramGallery();
+        bulkTitles.style.display = 'none';
     });
 
     // --- Drag and Drop ---
@@ -82,6 +87,11 @@ document.addEventListener('DOMContentLoaded', function() {
         e.preventDefault();
         urlInputContainer.classList.remove('drag-over');
         const text = e.dataTransfer.getData('text/plain');
+        const urls = splitUrls(text);
+        if (urls.length > 1) {
+            fetchTitles(urls);
+            return;
+        }
         videoUrl.value = text;
         clearUrlBtn.style.display = 'block';
         fetchTitleBtn.click(); // Automatically fetch title on drop
@@ -94,6 +104,7 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     function showVideoInfo(title, thumbnailUrl) {
+        currentTitle = title;
         titleDisplay.textContent = title;
         thumbnailPreview.src = thumbnailUrl;
         videoInfo.style.display = 'block';
@@ -101,6 +112,7 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     function hideVideoInfo() {
+        currentTitle = '';
         videoInfo.style.display = 'none';
     }
 
@@ -235,6 +247,23 @@ document.addEventListener('DOMContentLoaded', function() {
         setProgress(0);
     }
 
+    // Audio codecs this browser plays as they are, sent when the original audio should be kept
+    function acceptedAudioCodecs() {
+        const keepOriginalAudio = document.getElementById('keepOriginalAudio');
+        if (!keepOriginalAudio || !keepOriginalAudio.checked || formatSelect.value !== 'Audio') {
+            return '';
+        }
+        const audio = document.createElement('audio');
+        const codecs = [];
+        if (audio.canPlayType('audio/mp4; codecs="mp4a.40.2"')) {
+            codecs.push('m4a');
+        }
+        if (audio.canPlayType('audio/ogg; codecs="opus"')) {
+            codecs.push('opus');
+        }
+        return codecs.join(',');
+    }
+
     // --- API Calls ---
     fetchTitleBtn.addEventListener('click', function() {
         if (!videoUrl.value.trim()) {
@@ -285,6 +314,72 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
+    // Several links are resolved by one /fetch_titles request, shown as each one arrives
+    function splitUrls(text) {
+        return text.split(/\s+/).filter(part => /^https?:\/\//.test(part));
+    }
+
+    async function fetchTitles(urls) {
+        hideVideoInfo();
+        hideInstagramGallery();
+        bulkTitleList.innerHTML = '';
+        const items = urls.map(url => {
+            const item = document.createElement('li');
+            item.className = 'list-group-item list-group-item-action';
+            item.textContent = url;
+            // Pick a link to download it like a single pasted URL
+            item.addEventListener('click', () => {
+                videoUrl.value = url;
+                clearUrlBtn.style.display = 'block';
+                fetchTitleBtn.click();
+            });
+            bulkTitleList.appendChild(item);
+            return item;
+        });
+        bulkTitles.style.display = 'block';
+        updateStatus(`Fetching ${urls.length} titles...`);
+
+        try {
+            const response = await fetch('/fetch_titles', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/x-www-form-urlencoded',
+                },
+                body: `urls=${encodeURIComponent(urls.join('\n'))}`
+            });
+            if (!response.ok) {
+                const data = await response.json();
+                updateStatus(data.message || 'Error fetching titles', 'error');
+                return;
+            }
+
+            // One JSON object per line, in the order the lookups finish
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let fetched = 0;
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                for (const line of lines) {
+                    if (!line.trim()) continue;
+                    const result = JSON.parse(line);
+                    const item = items[result.index];
+                    item.textContent = result.success ? result.title : `${result.url} - ${result.message}`;
+                    item.classList.toggle('text-danger', !result.success);
+                    fetched++;
+                    updateStatus(`Fetched ${fetched} of ${urls.length} titles`);
+                }
+            }
+        } catch (error) {
+            updateStatus('Error fetching titles', 'error');
+            console.error('Error:', error);
+        }
+    }
+
     downloadThumbnailBtn.addEventListener('click', function() {
         if (!currentThumbnailUrl) {
             updateStatus('No thumbnail to download', 'error');
@@ -341,15 +436,14 @@ document.addEventListener('DOMContentLoaded', function() {
             .then(response => response.json())
             .then(data => {
                 if (data.success) {
-                    updateStatus(data.message, 'success');
-                    showFolderBtn.disabled = false;
-                    if (data.files && data.files.length > 0) {
-                        addDownloadToHistory(data.caption || 'Instagram Post', data.files[0]);
-                    }
+                    // Runs as a background job, follow it like a video download
+                    currentJobId = data.job_id;
+                    updateStatus(data.message, 'info');
+                    watchDownloadStatus();
                 } else {
                     updateStatus(data.message, 'error');
+                    downloadBtn.disabled = false;
                 }
-                downloadBtn.disabled = false;
             })
             .catch(error => {
                 updateStatus('Error downloading from Instagram', 'error');
@@ -368,13 +462,14 @@ document.addEventListener('DOMContentLoaded', function() {
                 headers: {
                     'Content-Type': 'application/x-www-form-urlencoded',
                 },
-                body: `url=${encodeURIComponent(videoUrl.value)}&quality=${qualitySelect.value}&mode=${formatSelect.value}&download_folder=${encodeURIComponent(downloadFolder.value)}&platform=${platformSelect.value}`
+                body: `url=${encodeURIComponent(videoUrl.value)}&quality=${qualitySelect.value}&mode=${formatSelect.value}&download_folder=${encodeURIComponent(downloadFolder.value)}&platform=${platformSelect.value}&title=${encodeURIComponent(currentTitle)}&audio_codecs=${acceptedAudioCodecs()}`
             })
             .then(response => response.json())
             .then(data => {
                 if (data.success) {
+                    currentJobId = data.job_id;
                     updateStatus('Download started', 'info');
-                    checkDownloadStatus();
+                    watchDownloadStatus();
                 } else {
                     updateStatus(data.message, 'error');
                     downloadBtn.disabled = false;
@@ -391,7 +486,13 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 
     pauseBtn.addEventListener('click', function() {
-        fetch('/toggle_pause', { method: 'POST' })
+        fetch('/toggle_pause', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/x-www-form-urlencoded',
+            },
+            body: `job_id=${encodeURIComponent(currentJobId || '')}`
+        })
         .then(response => response.json())
         .then(data => {
             if (data.success) {
@@ -425,6 +526,11 @@ document.addEventListener('DOMContentLoaded', function() {
     clipboardBtn.addEventListener('click', async () => {
         try {
             const text = await navigator.clipboard.readText();
+            const urls = splitUrls(text);
+            if (urls.length > 1) {
+                fetchTitles(urls);
+                return;
+            }
             videoUrl.value = text;
             clearUrlBtn.style.display = 'block';
         } catch (err) {
@@ -452,15 +558,14 @@ document.addEventListener('DOMContentLoaded', function() {
             .then(response => response.json())
             .then(data => {
                 if (data.success) {
-                    updateStatus(data.message, 'success');
-                    showFolderBtn.disabled = false;
-                    if (data.files && data.files.length > 0) {
-                        addDownloadToHistory(data.caption || 'Instagram Post', data.files[0]);
-                    }
+                    // Runs as a background job, follow it like a video download
+                    currentJobId = data.job_id;
+                    updateStatus(data.message, 'info');
+                    watchDownloadStatus();
                 } else {
                     updateStatus(data.message, 'error');
+                    downloadBtn.disabled = false;
                 }
-                downloadBtn.disabled = false;
             })
             .catch(error => {
                 updateStatus('Error downloading from Instagram', 'error');
@@ -525,35 +630,62 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    function checkDownloadStatus() {
-        fetch('/get_status')
-        .then(response => response.json())
-        .then(data => {
-            setProgress(data.progress);
-            updateStatus(data.message, 'info');
+    // Apply a status update to the UI, returns true while the job is still active
+    function applyDownloadStatus(data) {
+        setProgress(data.progress);
+        updateStatus(data.message, 'info');
 
-            if (data.is_paused) {
-                pauseBtn.innerHTML = '<i class="bi bi-play-fill"></i> Resume';
-            } else {
-                pauseBtn.innerHTML = '<i class="bi bi-pause-fill"></i> Pause';
-            }
+        if (data.is_paused) {
+            pauseBtn.innerHTML = '<i class="bi bi-play-fill"></i> Resume';
+        } else {
+            pauseBtn.innerHTML = '<i class="bi bi-pause-fill"></i> Pause';
+        }
+
+        if (data.current_file) {
+            currentFile = data.current_file;
+            showFolderBtn.disabled = false;
+        }
+
+        if (data.is_downloading || data.state === 'queued') {
+            return true;
+        }
+
+        downloadBtn.disabled = false;
+        pauseBtn.disabled = true;
+        if (data.progress === 100) {
+            showFolderBtn.disabled = false;
+            updateStatus('Download complete!', 'success');
+            renderDownloadHistory(); // The server records finished jobs
+            setTimeout(hideProgress, 3000);
+        }
+        return false;
+    }
+
+    // Receive progress pushed by the server, falling back to polling /get_status
+    function watchDownloadStatus() {
+        if (!window.EventSource || !currentJobId) {
+            checkDownloadStatus();
+            return;
+        }
 
-            if (data.current_file) {
-                currentFile = data.current_file;
-                showFolderBtn.disabled = false;
+        const source = new EventSource(`/events/${encodeURIComponent(currentJobId)}`);
+        source.onmessage = (event) => {
+            if (!applyDownloadStatus(JSON.parse(event.data))) {
+                source.close();
             }
+        };
+        source.onerror = () => {
+            source.close();
+            checkDownloadStatus();
+        };
+    }
 
-            if (data.is_downloading) {
+    function checkDownloadStatus() {
+        fetch(`/get_status?job_id=${encodeURIComponent(currentJobId || '')}`)
+        .then(response => response.json())
+        .then(data => {
+            if (applyDownloadStatus(data)) {
                 setTimeout(checkDownloadStatus, 1000);
-            } else {
-                downloadBtn.disabled = false;
-                pauseBtn.disabled = true;
-                if (data.progress === 100) {
-                    showFolderBtn.disabled = false;
-                    updateStatus('Download complete!', 'success');
-                    addDownloadToHistory(data.title, data.current_file);
-                    setTimeout(hideProgress, 3000);
-                }
             }
         })
         .catch(error => {
@@ -565,8 +697,27 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     // --- Download History ---
+    // Finished jobs come from the server, entries that aren't jobs (e.g. single Instagram media) from localStorage
     function renderDownloadHistory() {
-        const history = JSON.parse(localStorage.getItem('downloadHistory')) || [];
+        const localHistory = JSON.parse(localStorage.getItem('downloadHistory')) || [];
+
+        fetch('/history?per_page=10&state=finished')
+        .then(response => response.json())
+        .then(data => {
+            const serverHistory = data.items.map(item => ({
+                title: item.title || item.current_file || 'Untitled',
+                filename: item.current_file,
+                date: new Date((item.finished_at || item.created_at) * 1000).toISOString()
+            }));
+            const history = serverHistory.concat(localHistory)
+                .sort((a, b) => new Date(b.date) - new Date(a.date))
+                .slice(0, 10);
+            showDownloadHistory(history);
+        })
+        .catch(() => showDownloadHistory(localHistory));
+    }
+
+    function showDownloadHistory(history) {
         downloadHistory.innerHTML = '';
         if (history.length === 0) {
             downloadHistory.innerHTML = '<li class="list-group-item">No downloads yet.</li>';
@@ -601,6 +752,11 @@ document.addEventListener('DOMContentLoaded', function() {
     formatSelect.addEventListener('change', function() {
         qualitySelect.disabled = formatSelect.value === 'Audio';
         
+        const keepAudioContainer = document.getElementById('keepAudioContainer');
+        if (keepAudioContainer) {
+            keepAudioContainer.style.display = formatSelect.value === 'Audio' ? 'block' : 'none';
+        }
+        
         // Show/hide metadata info for Audio downloads
         const metadataInfo = document.getElementById('metadata-info');
         if (metadataInfo) {
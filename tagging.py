@@ -0,0 +1,215 @@
+"""
+Audio tags (title, artist, album, year, genre, cover) for downloaded audio.
+
+The genre is guessed from the title and description with a table of
+keyword rules. When keywords of several genres are found, the rule with
+the highest priority wins, whatever order the rules are listed in.
+`configure_genres()` replaces the table (app.config['GENRE_RULES']).
+"""
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# (genre, priority, keywords), keywords match in the lowercased title or
+# description: Latin keywords as whole words, so 'rap' doesn't match
+# 'paragraph', and Arabic ones anywhere, so they also match with prefixes
+# and suffixes attached. Specific genres rank above the generic Arabic
+# words for song and music, so they are not hidden behind 'Arabic Pop'.
+GENRE_RULES = [
+    ('Arabic Rap', 80, ['راب', 'rap', 'hip hop']),
+    ('Arabic Classical', 70, ['طرب', 'أم كلثوم', 'فيروز']),
+    ('Mahraganat', 60, ['مهرجان', 'شعبي']),
+    ('Pop', 50, ['pop', 'بوب']),
+    ('Rock', 40, ['rock', 'روك']),
+    ('Jazz', 30, ['jazz', 'جاز']),
+    ('Classical', 20, ['classical', 'كلاسيكي']),
+    ('Arabic Pop', 10, ['أغنية', 'أغاني', 'موسيقى']),
+]
+DEFAULT_GENRE = 'Music'
+
+
+class GenreMatcher:
+    """
+    Genre rules compiled into one list of keywords, highest priority first
+    """
+
+    def __init__(self, rules, default=DEFAULT_GENRE):
+        self.default = default
+        # A keyword listed under several genres belongs to the one with the highest priority
+        best = {}
+        for genre, priority, keywords in rules:
+            for keyword in keywords:
+                keyword = keyword.lower()
+                if keyword not in best or priority > best[keyword][0]:
+                    best[keyword] = (priority, genre)
+        self.keywords = [(keyword, self._word_pattern(keyword), genre) for keyword, (priority, genre)
+                         in sorted(best.items(), key=lambda item: -item[1][0])]
+
+    @staticmethod
+    def _word_pattern(keyword):
+        if keyword.isascii():
+            return re.compile(r'\b' + re.escape(keyword) + r'\b')
+        return None
+
+    def match(self, *texts):
+        # One search per keyword is faster here than one regex alternating all
+        # keywords, Python's re tries every alternative at every position
+        text = '\n'.join(text.lower() for text in texts if text)
+        for keyword, pattern, genre in self.keywords:
+            if pattern.search(text) if pattern else keyword in text:
+                return genre
+        return self.default
+
+
+_genre_matcher = GenreMatcher(GENRE_RULES)
+
+
+def configure_genres(rules, default=DEFAULT_GENRE):
+    """
+    Replace the genre rules, a list of (genre, priority, keywords)
+    """
+    global _genre_matcher
+    _genre_matcher = GenreMatcher(rules, default)
+
+
+def determine_genre(title, description):
+    """
+    Try to determine genre based on title and description
+    """
+    return _genre_matcher.match(title, description)
+
+
+def get_audio_metadata(video_info):
+    """
+    Return title, artist, album, year and genre tags for video_info
+    """
+    title = video_info.get('title', '')
+    uploader = video_info.get('uploader', '') or video_info.get('artist', '') or video_info.get('creator', '')
+    upload_date = video_info.get('upload_date', '')
+    return {
+        'title': title,
+        'artist': uploader,
+        'album': video_info.get('album', '') or video_info.get('playlist_title', '') or uploader,
+        'year': upload_date[:4] if upload_date and len(upload_date) >= 4 else '',
+        # Try to determine genre from title or description
+        'genre': determine_genre(title, video_info.get('description', '')),
+    }
+
+
+def add_metadata_to_audio(file_path, video_info, thumbnail_data=None):
+    """
+    Add metadata to audio file using information from video_info
+    
+    Returns True when the tags were written.
+    """
+    if not file_path.lower().endswith('.mp3'):
+        # Audio kept in its original codec
+        return add_metadata_to_original_audio(file_path, video_info, thumbnail_data)
+    from mutagen.mp3 import MP3
+    from mutagen.id3 import ID3, APIC, TIT2, TPE1, TALB, TDRC, TCON, TRCK, TPE2
+    try:
+        # Load the audio file
+        audio_file = MP3(file_path, ID3=ID3)
+        
+        # Keep the tags ffmpeg wrote, otherwise create new ones
+        if audio_file.tags is None:
+            audio_file.add_tags()
+        
+        # Extract information from video_info
+        metadata = get_audio_metadata(video_info)
+        title = metadata['title']
+        uploader = metadata['artist']
+        album = metadata['album']
+        year = metadata['year']
+        
+        # Set basic metadata
+        if title:
+            audio_file.tags.add(TIT2(encoding=3, text=title))  # Title
+        
+        if uploader:
+            audio_file.tags.add(TPE1(encoding=3, text=uploader))  # Artist
+            audio_file.tags.add(TPE2(encoding=3, text=uploader))  # Album Artist
+        
+        if album:
+            audio_file.tags.add(TALB(encoding=3, text=album))  # Album
+        
+        if year:
+            audio_file.tags.add(TDRC(encoding=3, text=year))  # Year
+        
+        genre = metadata['genre']
+        if genre:
+            audio_file.tags.add(TCON(encoding=3, text=genre))  # Genre
+        
+        # Add track number (default to 1)
+        audio_file.tags.add(TRCK(encoding=3, text="1"))
+        
+        # Add thumbnail as album art if available
+        if thumbnail_data:
+            audio_file.tags.add(APIC(
+                encoding=3,
+                mime='image/jpeg',
+                type=3,  # Cover (front)
+                desc='Cover',
+                data=thumbnail_data
+            ))
+        
+        # Write all frames in a single save
+        audio_file.save()
+        logger.info('Metadata added', extra={'path': file_path})
+        return True
+        
+    except Exception as e:
+        logger.error('Error adding metadata', extra={'path': file_path, 'error': str(e)})
+        return False
+
+
+def add_metadata_to_original_audio(file_path, video_info, thumbnail_data=None):
+    """
+    Add metadata to an m4a or opus file that was kept without re-encoding
+    """
+    import base64
+    from mutagen.mp4 import MP4, MP4Cover
+    from mutagen.oggopus import OggOpus
+    from mutagen.flac import Picture
+    try:
+        metadata = get_audio_metadata(video_info)
+        if file_path.lower().endswith('.m4a'):
+            audio_file = MP4(file_path)
+            if audio_file.tags is None:
+                audio_file.add_tags()
+            atoms = {'\xa9nam': metadata['title'], '\xa9ART': metadata['artist'], 'aART': metadata['artist'],
+                     '\xa9alb': metadata['album'], '\xa9day': metadata['year'], '\xa9gen': metadata['genre']}
+            for atom, value in atoms.items():
+                if value:
+                    audio_file.tags[atom] = [value]
+            audio_file.tags['trkn'] = [(1, 0)]
+            if thumbnail_data:
+                audio_file.tags['covr'] = [MP4Cover(thumbnail_data, imageformat=MP4Cover.FORMAT_JPEG)]
+        elif file_path.lower().endswith('.opus'):
+            audio_file = OggOpus(file_path)
+            comments = {'title': metadata['title'], 'artist': metadata['artist'], 'albumartist': metadata['artist'],
+                        'album': metadata['album'], 'date': metadata['year'], 'genre': metadata['genre'],
+                        'tracknumber': '1'}
+            for key, value in comments.items():
+                if value:
+                    audio_file[key] = [value]
+            if thumbnail_data:
+                picture = Picture()
+                picture.type = 3  # Cover (front)
+                picture.mime = 'image/jpeg'
+                picture.desc = 'Cover'
+                picture.data = thumbnail_data
+                audio_file['metadata_block_picture'] = [base64.b64encode(picture.write()).decode('ascii')]
+        else:
+            logger.warning('No metadata support', extra={'path': file_path})
+            return False
+        
+        # Write all tags in a single save
+        audio_file.save()
+        logger.info('Metadata added', extra={'path': file_path})
+        return True
+        
+    except Exception as e:
+        logger.error('Error adding metadata', extra={'path': file_path, 'error': str(e)})
+        return False
@@ -0,0 +1,52 @@
+"""
+اختبار تحميل قوائم التشغيل: تخطي المحفوظ في الأرشيف وحد التحميلات المتزامنة لكل موقع
+"""
+import threading
+import time
+
+from batch import DownloadArchive, HostLimiter, run_batch
+from jobs import FAILED, FINISHED, SKIPPED, Job
+
+
+def make_entry(host, video_id):
+    return {'ie_key': 'Test', 'id': video_id, 'title': video_id, 'url': f'https://{host}/watch/{video_id}'}
+
+
+def test_batch_skips_archived_and_limits_hosts(tmp_path):
+    """المحفوظ في الأرشيف لا يُحمَّل مجددًا، ولا يتجاوز أي موقع حد التحميلات المتزامنة"""
+    archive_path = tmp_path / 'archive.txt'
+    archive_path.write_text('test a0\ntest b0\n', encoding='utf-8')
+    archive = DownloadArchive(str(archive_path))
+    entries = [make_entry('a.example', f'a{i}') for i in range(6)]
+    entries += [make_entry('www.b.example', f'b{i}') for i in range(6)]
+    entries.append(make_entry('a.example', 'broken'))
+
+    lock = threading.Lock()
+    active, peak, downloaded = {}, {}, []
+
+    def download_entry(child, url):
+        host = url.split('/')[2]
+        with lock:
+            active[host] = active.get(host, 0) + 1
+            peak[host] = max(peak.get(host, 0), active[host])
+            downloaded.append(url)
+        time.sleep(0.05)
+        with lock:
+            active[host] -= 1
+        if url.endswith('broken'):
+            raise ValueError('Video unavailable')
+        child.update(progress=100, message='Download complete!')
+
+    job = Job('batch')
+    run_batch(job, entries, download_entry, archive, HostLimiter(per_host=2), max_workers=8)
+
+    assert len(downloaded) == 11
+    assert not any(url.endswith(('/a0', '/b0')) for url in downloaded)
+    assert peak == {'a.example': 2, 'www.b.example': 2}
+
+    counts = job.snapshot()['counts']
+    assert counts[FINISHED] == 10 and counts[SKIPPED] == 2 and counts[FAILED] == 1
+    assert job.get('message') == 'Batch complete: 10 downloaded, 2 skipped, 1 failed'
+    # Finished entries are added to the archive, the failed one isn't
+    assert 'test a5' in archive and 'test b5' in archive and 'test broken' not in archive
+    assert len(archive_path.read_text(encoding='utf-8').split()) == 2 * 12
@@ -0,0 +1,44 @@
+"""
+اختبار جلب عناوين عدة روابط بالتوازي
+"""
+import threading
+import time
+
+from bulk_lookup import resolve_all
+
+
+def test_results_arrive_as_they_finish():
+    """النتائج تصل بترتيب انتهائها، والأخطاء لا توقف بقية الروابط"""
+    release = threading.Event()
+
+    def resolve(url):
+        if url == 'slow':
+            release.wait(5)
+        if url == 'broken':
+            raise ValueError('Unsupported URL')
+        return {'title': url.upper()}
+
+    results = resolve_all(['slow', 'fast', 'broken'], resolve, max_workers=3, timeout=10)
+    first = next(results)
+    assert first[:3] == (1, 'fast', {'title': 'FAST'})
+    second = next(results)
+    assert second[0] == 2 and isinstance(second[3], ValueError)
+    release.set()
+    assert next(results)[:3] == (0, 'slow', {'title': 'SLOW'})
+
+
+def test_slow_url_times_out():
+    """الرابط البطيء يُبلَّغ عنه بعد المهلة دون انتظار انتهائه"""
+    release = threading.Event()
+
+    def resolve(url):
+        if url == 'hanging':
+            release.wait(5)
+        return url
+
+    started = time.monotonic()
+    results = list(resolve_all(['hanging', 'quick'], resolve, max_workers=2, timeout=0.2))
+    release.set()
+    assert time.monotonic() - started < 2
+    assert [(index, result) for index, _, result, _ in results] == [(1, 'quick'), (0, None)]
+    assert isinstance(results[1][3], TimeoutError)
@@ -0,0 +1,45 @@
+"""
+اختبار تجهيز صورة الغلاف من الصورة المصغرة المحفوظة
+"""
+from cover_art import find_written_thumbnail, prepare_cover
+
+
+def test_find_written_thumbnail(tmp_path):
+    written = tmp_path / 'video.webp'
+    written.write_bytes(b'RIFF')
+    info = {'thumbnails': [{'url': 'http://x/a.jpg'},
+                           {'url': 'http://x/b.webp', 'filepath': str(written)},
+                           {'url': 'http://x/c.jpg', 'filepath': str(tmp_path / 'missing.jpg')}]}
+    assert find_written_thumbnail(info) == str(written)
+    assert find_written_thumbnail({}) is None
+
+
+def test_cover_is_bounded_jpeg(tmp_path):
+    """الغلاف يكون بصيغة JPEG ولا يتجاوز الحجم المحدد"""
+    small = tmp_path / 'small.jpg'
+    small.write_bytes(b'\xff\xd8\xff\xe0' + b'\x00' * 1000)
+    cover = prepare_cover(str(small), max_bytes=4096)
+    assert cover is not None
+    assert cover[:3] == b'\xff\xd8\xff'
+    assert len(cover) <= 4096
+
+
+def test_unreadable_cover_is_skipped(tmp_path):
+    broken = tmp_path / 'broken.webp'
+    broken.write_bytes(b'not an image')
+    assert prepare_cover(str(broken)) is None
+    assert prepare_cover(str(tmp_path / 'missing.jpg')) is None
+
+
+def test_oversized_conversion_is_not_returned(tmp_path, monkeypatch):
+    """نتيجة التحويل الأكبر من الحد المسموح لا تُستخدم"""
+    import cover_art
+    monkeypatch.setattr(cover_art, 'Image', object())
+    monkeypatch.setattr(cover_art, '_resize_with_pillow', lambda *args: b'\xff\xd8\xff' + b'\x00' * 8192)
+    monkeypatch.setattr(cover_art, '_resize_with_ffmpeg', lambda *args: None)
+    small = tmp_path / 'small.jpg'
+    small.write_bytes(b'\xff\xd8\xff\xe0' + b'\x00' * 1000)
+    assert prepare_cover(str(small), max_bytes=4096) == small.read_bytes()
+    large = tmp_path / 'large.jpg'
+    large.write_bytes(b'\xff\xd8\xff\xe0' + b'\x00' * 8192)
+    assert prepare_cover(str(large), max_bytes=4096) is None
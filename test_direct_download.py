@@ -0,0 +1,149 @@
+"""
+اختبار محرك التحميل المباشر مع طلبات Range والتحميل المتوازي والاستئناف
+"""
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import direct_download
+from jobs import Job
+
+FILE_SIZE = 3 * 1024 * 1024 + 123
+PAYLOAD = os.urandom(FILE_SIZE)
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serve PAYLOAD with optional Range support, logging every requested range"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        start, end = 0, FILE_SIZE - 1
+        range_header = self.headers.get('Range')
+        if range_header and self.server.ranges:
+            first, last = range_header.split('=')[1].split('-')
+            start, end = int(first), min(int(last) if last else FILE_SIZE - 1, FILE_SIZE - 1)
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{FILE_SIZE}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(end - start + 1))
+        if self.server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        with self.server.lock:
+            self.server.requests.append((start, end))
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+        try:
+            self.wfile.write(PAYLOAD[start:end + 1])
+        finally:
+            with self.server.lock:
+                self.server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    def start(ranges=True):
+        httpd = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+        httpd.ranges = ranges
+        httpd.requests = []
+        httpd.lock = threading.Lock()
+        httpd.active = 0
+        httpd.max_active = 0
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        servers.append(httpd)
+        return httpd, f'http://127.0.0.1:{httpd.server_address[1]}/media/clip.mp4'
+
+    servers = []
+    yield start
+    for httpd in servers:
+        httpd.shutdown()
+
+
+def test_parallel_ranged_download(server, tmp_path):
+    """الملف الكبير يُقسَّم إلى أجزاء تُحمَّل بالتوازي"""
+    httpd, url = server()
+    path = str(tmp_path / 'clip.mp4')
+    job = Job('direct')
+    direct_download.download_url(url, path, job=job, segments=4, min_segment_size=512 * 1024)
+
+    with open(path, 'rb') as f:
+        assert f.read() == PAYLOAD
+    ranged = [r for r in httpd.requests if r != (0, 0)]
+    assert len(ranged) == 4
+    assert sum(end - start + 1 for start, end in ranged) == FILE_SIZE
+    assert not os.path.exists(path + '.part')
+    assert not os.path.exists(path + '.part.json')
+    assert job.get('downloaded_bytes') == FILE_SIZE
+
+
+def test_resume_from_partial_file(server, tmp_path):
+    """الاستئناف يحمّل فقط البايتات الناقصة من كل جزء"""
+    httpd, url = server()
+    path = str(tmp_path / 'clip.mp4')
+    segments = direct_download.plan_segments(FILE_SIZE, 2, 512 * 1024)
+    half = segments[0][1] + 1
+    # First segment done, second one stopped 1000 bytes in
+    with open(path + '.part', 'wb') as f:
+        f.write(PAYLOAD[:half + 1000])
+        f.truncate(FILE_SIZE)
+    segments[0][2] = half
+    segments[1][2] = 1000
+    with open(path + '.part.json', 'w') as f:
+        json.dump({'url': url, 'total': FILE_SIZE, 'segments': segments}, f)
+
+    direct_download.download_url(url, path, segments=2, min_segment_size=512 * 1024)
+
+    with open(path, 'rb') as f:
+        assert f.read() == PAYLOAD
+    assert [r for r in httpd.requests if r != (0, 0)] == [(half + 1000, FILE_SIZE - 1)]
+
+
+def test_server_without_ranges_streams_once(server, tmp_path):
+    httpd, url = server(ranges=False)
+    path = str(tmp_path / 'clip.mp4')
+    direct_download.download_url(url, path)
+    with open(path, 'rb') as f:
+        assert f.read() == PAYLOAD
+    assert len(httpd.requests) == 2  # Probe and download
+
+
+def test_reserve_path_never_reuses_a_name(tmp_path):
+    """أسماء الملفات لا تتكرر حتى لو بدأ تحميلان في نفس الثانية"""
+    first = direct_download.reserve_path(str(tmp_path), 'instagram.jpg')
+    second = direct_download.reserve_path(str(tmp_path), 'instagram.jpg')
+    assert first != second
+    assert os.path.basename(second) == 'instagram (1).jpg'
+
+
+def test_plan_segments_covers_the_file():
+    segments = direct_download.plan_segments(10 * 1024 * 1024 + 1, 4, 1024 * 1024)
+    assert len(segments) == 4
+    assert segments[0][0] == 0 and segments[-1][1] == 10 * 1024 * 1024
+    assert all(a[1] + 1 == b[0] for a, b in zip(segments, segments[1:]))
+    assert direct_download.plan_segments(100, 4, 1024) == [[0, 99, 0]]
+
+
+def test_failed_direct_job_removes_part_file(tmp_path, monkeypatch):
+    """فشل التحميل المباشر لا يترك ملف .part المحجوز"""
+    import app as downloader
+    from jobs import FAILED
+
+    def probe(url):
+        raise ConnectionError('Connection refused')
+
+    monkeypatch.setattr(direct_download, 'probe', probe)
+    path = direct_download.reserve_path(str(tmp_path), 'clip.mp4')
+    assert os.path.exists(path + '.part')
+
+    job = Job('direct')
+    job.run(downloader.download_direct, 'http://127.0.0.1:9/clip.mp4', path)
+    assert job.get('state') == FAILED
+    assert os.listdir(tmp_path) == []
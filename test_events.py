@@ -0,0 +1,72 @@
+"""
+اختبار بث تقدم المهام عبر Server-Sent Events
+"""
+import json
+import threading
+import time
+
+import pytest
+
+import app as downloader
+from jobs import FINISHED, JobManager
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(downloader, 'job_manager', JobManager(max_workers=2))
+    monkeypatch.setitem(downloader.app.config, 'SSE_MAX_UPDATES_PER_SECOND', 10)
+    monkeypatch.setitem(downloader.app.config, 'SSE_KEEPALIVE', 0.05)
+    return downloader.app.test_client()
+
+
+def read_events(response):
+    events, comments = [], 0
+    for block in response.get_data(as_text=True).split('\n\n'):
+        if block.startswith('data: '):
+            events.append(json.loads(block[len('data: '):]))
+        elif block.startswith(':'):
+            comments += 1
+    return events, comments
+
+
+def test_finished_job_ends_the_stream(client):
+    job = downloader.job_manager.submit('video', lambda job: job.update(progress=100))
+    assert job.wait_until_finished(5)
+
+    response = client.get(f'/events/{job.id}')
+    assert response.mimetype == 'text/event-stream'
+    events, _ = read_events(response)
+    assert len(events) == 1
+    assert events[0]['state'] == FINISHED and events[0]['job_id'] == job.id
+
+
+def test_rapid_updates_are_coalesced(client):
+    """تحديثات التقدم المتلاحقة تُدمج في حدث واحد لكل فترة"""
+    started = threading.Event()
+
+    def download(job):
+        started.wait(5)
+        for step in range(1, 201):
+            job.update(progress=step / 2)
+            time.sleep(0.005)
+        # Idle before finishing, so the stream sends keep-alive comments
+        time.sleep(0.3)
+
+    job = downloader.job_manager.submit('video', download)
+    start = time.monotonic()
+    started.set()
+    events, comments = read_events(client.get(f'/events/{job.id}'))
+    elapsed = time.monotonic() - start
+
+    assert job.get('state') == FINISHED
+    # 200 updates, but at most 10 events per second (plus the first and the last one)
+    assert len(events) <= elapsed * 10 + 2
+    assert len(events) < 50
+    progress = [event['progress'] for event in events]
+    assert progress == sorted(progress)
+    assert events[-1]['state'] == FINISHED and events[-1]['progress'] == 100
+    assert comments >= 1
+
+
+def test_unknown_job_is_not_found(client):
+    assert client.get('/events/missing').status_code == 404
@@ -0,0 +1,104 @@
+"""
+اختبار تقديم الملفات المحملة مع دعم Range والطلبات الشرطية
+"""
+import os
+
+import pytest
+from flask import Flask, request
+from werkzeug.test import EnvironBuilder
+
+from file_serving import check_serve_mode, content_disposition, serve_file
+
+PAYLOAD = os.urandom(100000)
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(PAYLOAD)
+    app = Flask(__name__)
+
+    @app.route('/file', methods=['GET', 'HEAD'])
+    def file():
+        return serve_file(request.environ, str(path), download_name='فيديو.mp4')
+
+    return app.test_client()
+
+
+def test_full_file(client):
+    response = client.get('/file')
+    assert response.status_code == 200
+    assert response.data == PAYLOAD
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.headers['Content-Length'] == str(len(PAYLOAD))
+    assert "filename*=UTF-8''" in response.headers['Content-Disposition']
+    assert 'filename="download.mp4"' in response.headers['Content-Disposition']
+
+
+def test_content_disposition_ascii_fallback():
+    """اسم ASCII بديل للعملاء التي لا تدعم filename*"""
+    assert content_disposition('Café "live".mp4') == (
+        "attachment; filename=\"Cafe live.mp4\"; filename*=UTF-8''Caf%C3%A9%20%22live%22.mp4")
+
+
+def test_unknown_serve_mode_is_rejected():
+    assert check_serve_mode('x-accel') == 'x-accel'
+    with pytest.raises(ValueError):
+        check_serve_mode('x-acel')
+
+
+def test_byte_range(client):
+    """طلبات Range تعيد الجزء المطلوب فقط"""
+    response = client.get('/file', headers={'Range': 'bytes=1000-1999'})
+    assert response.status_code == 206
+    assert response.data == PAYLOAD[1000:2000]
+    assert response.headers['Content-Range'] == f'bytes 1000-1999/{len(PAYLOAD)}'
+
+    response = client.get('/file', headers={'Range': 'bytes=-500'})
+    assert response.data == PAYLOAD[-500:]
+
+    response = client.get('/file', headers={'Range': f'bytes={len(PAYLOAD)}-'})
+    assert response.status_code == 416
+
+
+def test_conditional_requests(client):
+    etag = client.get('/file').headers['ETag']
+    assert client.get('/file', headers={'If-None-Match': etag}).status_code == 304
+
+    # A range for an older version of the file returns the whole new file
+    response = client.get('/file', headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert response.status_code == 200
+    assert response.data == PAYLOAD
+    response = client.get('/file', headers={'Range': 'bytes=0-9', 'If-Range': etag})
+    assert response.status_code == 206
+
+
+def test_file_wrapper_starts_at_range(tmp_path):
+    """خادم WSGI يستلم الملف في موضع بداية الجزء ليرسله عبر sendfile"""
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(PAYLOAD)
+    wrapped = []
+
+    def file_wrapper(f, block_size):
+        wrapped.append(f)
+        return iter(lambda: f.read(block_size), b'')
+
+    environ = EnvironBuilder(headers={'Range': 'bytes=5000-'}).get_environ()
+    environ['wsgi.file_wrapper'] = file_wrapper
+    with Flask(__name__).app_context():
+        response = serve_file(environ, str(path))
+    assert response.status_code == 206
+    assert wrapped[0].tell() == 5000
+    assert response.headers['Content-Length'] == str(len(PAYLOAD) - 5000)
+    wrapped[0].close()
+
+
+def test_x_accel_redirect(tmp_path):
+    (tmp_path / 'instagram').mkdir()
+    path = tmp_path / 'instagram' / 'a.jpg'
+    path.write_bytes(b'x')
+    environ = EnvironBuilder().get_environ()
+    with Flask(__name__).app_context():
+        response = serve_file(environ, str(path), mode='x-accel', root=str(tmp_path))
+    assert response.headers['X-Accel-Redirect'] == '/protected-downloads/instagram/a.jpg'
+    assert response.get_data() == b''
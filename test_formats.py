@@ -0,0 +1,83 @@
+"""
+اختبار اختيار الصيغة حسب الجودة المطلوبة
+"""
+import yt_dlp
+
+from formats import audio_postprocessor, build_format_options, parse_audio_codecs, parse_height
+
+
+def make_info(heights=(144, 240, 360, 480, 720, 1080, 1440, 2160)):
+    formats = []
+    for height in heights:
+        formats.append({'format_id': f'{height}-vp9', 'ext': 'webm', 'height': height, 'width': height * 16 // 9,
+                        'vcodec': 'vp9', 'acodec': 'none', 'tbr': height * 1.1, 'url': f'http://x/{height}.webm'})
+        formats.append({'format_id': f'{height}-avc', 'ext': 'mp4', 'height': height, 'width': height * 16 // 9,
+                        'vcodec': 'avc1.4d401f', 'acodec': 'none', 'tbr': height, 'url': f'http://x/{height}.mp4'})
+    formats += [
+        {'format_id': 'audio-opus', 'ext': 'webm', 'vcodec': 'none', 'acodec': 'opus', 'abr': 160, 'url': 'http://x/a.webm'},
+        {'format_id': 'audio-aac', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 128, 'url': 'http://x/a.m4a'},
+    ]
+    return {'id': 'canned', 'title': 'canned', 'extractor': 'test', 'extractor_key': 'Test',
+            'webpage_url': 'http://x/', 'formats': formats}
+
+
+def process(quality, mode='Video', info=None, audio_codecs=None):
+    params = {'quiet': True, 'simulate': True}
+    params.update(build_format_options(quality, mode, audio_codecs))
+    with yt_dlp.YoutubeDL(params) as ydl:
+        return ydl.process_ie_result(info or make_info(), download=False)
+
+
+def select(quality, mode='Video', info=None, audio_codecs=None):
+    result = process(quality, mode, info, audio_codecs)
+    return [f['format_id'] for f in result.get('requested_formats') or [result]]
+
+
+def test_parse_height():
+    assert parse_height('720p') == 720
+    assert parse_height('1080') == 1080
+    assert parse_height('best') is None
+    assert parse_height(None) is None
+
+
+def test_quality_limits_height():
+    """الجودة المختارة هي الحد الأقصى للارتفاع"""
+    assert select('360p') == ['360-avc', 'audio-aac']
+    assert select('720p') == ['720-avc', 'audio-aac']
+    assert select('2160p') == ['2160-avc', 'audio-aac']
+
+
+def test_prefers_streams_that_merge_without_remux():
+    """تفضيل mp4/m4a عندما تتوفر نفس الدقة بصيغة webm"""
+    assert select('1080p')[0].endswith('-avc')
+    assert select('1080p')[1] == 'audio-aac'
+
+
+def test_falls_back_to_smallest_when_nothing_fits():
+    info = make_info(heights=(720, 1080))
+    assert select('360p', info=info) == ['720-avc', 'audio-aac']
+
+
+def test_audio_mode_downloads_audio_only():
+    assert select('720p', mode='Audio') == ['audio-opus']
+
+
+def test_keep_original_audio_codec():
+    """الصوت يُحمَّل بالترميز الذي يقبله العميل بدون إعادة ترميز"""
+    assert parse_audio_codecs('M4A, opus, flac, m4a') == ['m4a', 'opus']
+    assert select('720p', mode='Audio', audio_codecs=['m4a']) == ['audio-aac']
+    assert select('720p', mode='Audio', audio_codecs=['opus', 'm4a']) == ['audio-opus']
+
+
+def test_unaccepted_fallback_is_converted():
+    """إذا لم يتوفر ترميز يقبله العميل يُحوَّل الصوت إلى mp3 بدل الاحتفاظ بترميز آخر"""
+    info = make_info()
+    info['formats'] = [f for f in info['formats'] if f['format_id'] != 'audio-aac']
+    result = process('720p', mode='Audio', info=info, audio_codecs=['m4a'])
+    assert result['format_id'] == 'audio-opus'
+    assert audio_postprocessor(['m4a'], result['acodec']) == {
+        'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'}
+    assert audio_postprocessor(['m4a', 'opus'], result['acodec'])['preferredcodec'] == 'opus'
+    assert audio_postprocessor(['m4a'], 'mp4a.40.2')['preferredcodec'] == 'm4a'
+    assert audio_postprocessor(['opus'], 'vorbis')['preferredcodec'] == 'mp3'
+    assert audio_postprocessor()['preferredcodec'] == 'mp3'
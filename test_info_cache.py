@@ -0,0 +1,87 @@
+"""
+اختبارات التخزين المؤقت لمعلومات الفيديو
+"""
+import threading
+import time
+
+from info_cache import InfoCache, normalize_url
+
+
+def test_normalize_url():
+    """روابط مختلفة لنفس الفيديو يجب أن تعطي نفس المفتاح"""
+    expected = normalize_url("https://www.youtube.com/watch?v=abc123")
+    assert normalize_url("https://youtu.be/abc123?si=xyz") == expected
+    assert normalize_url("https://m.youtube.com/watch?v=abc123&feature=share") == expected
+    assert normalize_url("https://www.youtube.com/shorts/abc123") == expected
+    assert normalize_url("https://www.youtube.com/watch?v=other") != expected
+
+
+def test_ttl_and_lru_eviction():
+    cache = InfoCache(max_entries=2, ttl=0.2)
+    cache.put("https://a.com/1", {'id': 1})
+    cache.put("https://a.com/2", {'id': 2})
+    assert cache.get("https://a.com/1") == {'id': 1}
+    cache.put("https://a.com/3", {'id': 3})  # evicts /2, the least recently used
+    assert cache.get("https://a.com/2") is None
+    assert cache.get("https://a.com/1") == {'id': 1}
+    time.sleep(0.25)
+    assert cache.get("https://a.com/1") is None
+    assert cache.stats()['hits'] == 2
+
+
+def test_concurrent_lookups_extract_once():
+    cache = InfoCache()
+    calls = []
+
+    def extract():
+        calls.append(1)
+        time.sleep(0.1)
+        return {'title': 'video'}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        cache.get_or_extract("https://youtu.be/abc", extract))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == [{'title': 'video'}] * 5
+    assert cache.stats()['misses'] == 1
+
+
+class StubYoutubeDL:
+    """Extracts from a table of raw results instead of the network"""
+
+    def __init__(self, results):
+        self.results = results
+        self.calls = []
+
+    def extract_info(self, url, ie_key=None, download=True, process=True):
+        assert download is False and process is False
+        self.calls.append((url, ie_key))
+        return dict(self.results[url])
+
+
+def test_url_results_are_resolved():
+    """الصفحة التي تضمّن فيديو من موقع آخر تُعطي عنوان الفيديو وصورته المصغرة"""
+    from app import resolve_url_result
+
+    video = {'id': 'abc123', 'extractor_key': 'Youtube', 'title': 'Embedded video',
+             'thumbnail': 'https://i.ytimg.com/vi/abc123/hq.jpg', 'webpage_url': 'https://youtube.com/watch?v=abc123'}
+    ydl = StubYoutubeDL({'https://youtube.com/watch?v=abc123': video,
+                         'https://blog.test/post': {'_type': 'url', 'url': 'https://youtube.com/watch?v=abc123',
+                                                    'ie_key': 'Youtube'}})
+    info = resolve_url_result(ydl, {'_type': 'url', 'url': 'https://blog.test/post'})
+    assert info == video
+    assert ydl.calls == [('https://blog.test/post', None), ('https://youtube.com/watch?v=abc123', 'Youtube')]
+
+    # url_transparent keeps the fields the page set, but not its id or extractor
+    info = resolve_url_result(ydl, {'_type': 'url_transparent', 'url': 'https://youtube.com/watch?v=abc123',
+                                    'ie_key': 'Youtube', 'id': 'post', 'extractor_key': 'Generic',
+                                    'title': 'Blog title', 'thumbnail': None})
+    assert info['id'] == 'abc123' and info['extractor_key'] == 'Youtube'
+    assert info['title'] == 'Blog title'
+    assert info['thumbnail'] == video['thumbnail']
+    assert '_type' not in info
@@ -0,0 +1,189 @@
+"""
+اختبار تحميل منشورات Instagram كمهام في الخلفية باستخدام سياق Instaloader وهمي
+"""
+import threading
+import time
+
+import instaloader
+
+import instagram_downloader
+from instagram_config import INSTAGRAM_CONFIG
+from instagram_pool import InstaloaderPool
+from post_cache import PostCache
+from jobs import FINISHED, Job
+
+
+class StubResponse:
+    def __init__(self, url):
+        self.headers = {'Content-Type': 'video/mp4' if url.endswith('.mp4') else 'image/jpeg'}
+        self.content = url.encode()
+
+
+class StubContext:
+    """سياق بديل لا يتصل بالإنترنت ويسجل عدد التحميلات المتزامنة"""
+    iphone_support = False
+    is_logged_in = False
+    max_connection_attempts = 3
+
+    def __init__(self, delay=0.2, failures=0):
+        self.delay = delay
+        self.failures = failures
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def get_raw(self, url):
+        with self.lock:
+            if self.failures:
+                self.failures -= 1
+                raise instaloader.ConnectionException('Connection reset')
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        return StubResponse(url)
+
+    def write_raw(self, resp, filename):
+        with open(filename, 'wb') as f:
+            f.write(resp.content)
+
+    def log(self, *args, **kwargs):
+        pass
+
+    def do_sleep(self):
+        pass
+
+    def error(self, *args, **kwargs):
+        pass
+
+
+def make_sidecar_node(count):
+    edges = [{'node': {'is_video': i % 2 == 1, 'display_url': f'https://cdn.test/{i}.jpg',
+                       'video_url': f'https://cdn.test/{i}.mp4'}} for i in range(count)]
+    return {'shortcode': 'ABC123xyz', '__typename': 'GraphSidecar', 'is_video': False,
+            'display_url': 'https://cdn.test/0.jpg', 'taken_at_timestamp': 1700000000,
+            'edge_media_to_caption': {'edges': [{'node': {'text': 'Carousel caption'}}]},
+            'edge_sidecar_to_children': {'edges': edges}}
+
+
+def make_loader(monkeypatch, node, context):
+    loader = InstaloaderPool(INSTAGRAM_CONFIG).create_loader()
+    loader.context = context
+    monkeypatch.setattr(instagram_downloader, 'get_post',
+                        lambda loader, shortcode: instaloader.Post(context, node))
+    return loader
+
+
+def test_extract_shortcode():
+    assert instagram_downloader.extract_instagram_shortcode('https://www.instagram.com/p/ABC123xyz/') == 'ABC123xyz'
+    assert instagram_downloader.extract_instagram_shortcode('https://www.instagram.com/user/profile/') is None
+
+
+def test_carousel_items_download_concurrently(monkeypatch, tmp_path):
+    """عناصر المنشور المتعدد تُحمَّل بالتوازي مع حد أقصى لعدد العمليات"""
+    context = StubContext()
+    loader = make_loader(monkeypatch, make_sidecar_node(6), context)
+    job = Job('instagram')
+
+    start = time.monotonic()
+    job.run(instagram_downloader.download_instagram_post, loader,
+            'https://www.instagram.com/p/ABC123xyz/', str(tmp_path), max_workers=3)
+    elapsed = time.monotonic() - start
+
+    status = job.snapshot()
+    assert status['state'] == FINISHED
+    assert status['progress'] == 100
+    assert status['title'] == 'Carousel caption'
+    assert context.max_active == 3
+    assert elapsed < 6 * context.delay
+    media = [name for name in status['files'] if not name.endswith('.txt')]
+    assert len(media) == 6
+    assert sum(name.endswith('.mp4') for name in media) == 3
+
+
+def test_jobs_keep_their_own_results(monkeypatch, tmp_path):
+    """كل مهمة تحتفظ بنتيجتها الخاصة ولا تختلط بنتائج المستخدمين الآخرين"""
+    context = StubContext(delay=0)
+    loader = make_loader(monkeypatch, make_sidecar_node(2), context)
+    first, second = Job('instagram'), Job('instagram')
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'b').mkdir()
+    first.run(instagram_downloader.download_instagram_post, loader,
+              'https://www.instagram.com/p/ABC123xyz/', str(tmp_path / 'a'))
+    second.run(instagram_downloader.download_instagram_post, loader,
+               'https://www.instagram.com/p/ABC123xyz/', str(tmp_path / 'b'))
+    assert first.get('output_path').startswith(str(tmp_path / 'a'))
+    assert second.get('output_path').startswith(str(tmp_path / 'b'))
+
+
+def test_invalid_url_fails_the_job(tmp_path):
+    job = Job('instagram')
+    job.run(instagram_downloader.download_instagram_post, None,
+            'https://www.instagram.com/user/profile/', str(tmp_path))
+    assert job.get('state') == 'failed'
+    assert 'Invalid Instagram URL' in job.get('message')
+
+
+def test_cached_post_skips_second_lookup(monkeypatch, tmp_path):
+    """التحميل بعد جلب المعلومات لا يطلب بيانات المنشور مرة أخرى"""
+    context = StubContext(delay=0)
+    loader = make_loader(monkeypatch, make_sidecar_node(2), context)
+    lookups = []
+    get_post = instagram_downloader.get_post
+    monkeypatch.setattr(instagram_downloader, 'get_post',
+                        lambda loader, shortcode: lookups.append(shortcode) or get_post(loader, shortcode))
+    cache = PostCache(str(tmp_path / 'cache'), ttl=60)
+
+    post, media_items = instagram_downloader.load_post(loader, 'ABC123xyz', cache)
+    assert len(media_items) == 2
+    job = Job('instagram')
+    job.run(instagram_downloader.download_instagram_post, loader,
+            'https://www.instagram.com/p/ABC123xyz/', str(tmp_path), cache=cache)
+    assert job.get('state') == FINISHED
+    assert lookups == ['ABC123xyz']
+
+    # The disk copy survives a restart
+    post, _ = instagram_downloader.load_post(loader, 'ABC123xyz', PostCache(str(tmp_path / 'cache'), ttl=60))
+    assert post.caption == 'Carousel caption'
+    assert lookups == ['ABC123xyz']
+    assert PostCache(str(tmp_path / 'cache'), ttl=0).get('ABC123xyz') is None
+
+
+def test_reports_exactly_the_files_written(monkeypatch, tmp_path):
+    """النتيجة تحتوي فقط على الملفات التي كتبها التحميل وليس كل ما في المجلد"""
+    context = StubContext(delay=0)
+    loader = make_loader(monkeypatch, make_sidecar_node(2), context)
+    # Unrelated file with the same date prefix in the folder the job writes to
+    (tmp_path / '2023-11-14_22-13-20_UTC_GraphSidecar_9.jpg').write_bytes(b'old')
+    job = Job('instagram')
+    job.run(instagram_downloader.download_instagram_post, loader,
+            'https://www.instagram.com/p/ABC123xyz/', str(tmp_path))
+
+    prefix = '2023-11-14_22-13-20_UTC_GraphSidecar'
+    assert job.get('files') == [f'{prefix}_1.jpg', f'{prefix}_2.mp4', f'{prefix}.txt']
+    assert job.get('output_path') == str(tmp_path / f'{prefix}_1.jpg')
+    assert job.get('current_file') == f'{prefix}_1.jpg'
+
+
+def test_subfolder_paths_are_relative_to_the_download_folder(monkeypatch, tmp_path):
+    context = StubContext(delay=0)
+    loader = make_loader(monkeypatch, make_sidecar_node(1), context)
+    job = Job('instagram')
+    job.run(instagram_downloader.download_instagram_post, loader,
+            'https://www.instagram.com/p/ABC123xyz/', str(tmp_path), subfolder_format='{platform}/{job_id}')
+
+    prefix = f'instagram/{job.id}/2023-11-14_22-13-20_UTC_GraphSidecar'
+    assert job.get('files') == [f'{prefix}_1.jpg', f'{prefix}.txt']
+    assert job.get('output_path') == str(tmp_path / f'{prefix}_1.jpg')
+
+
+def test_media_downloads_retry_dropped_connections(monkeypatch, tmp_path):
+    """انقطاع الاتصال مرة واحدة يُعاد المحاولة بدل إفشال المنشور كله"""
+    context = StubContext(delay=0, failures=2)
+    loader = make_loader(monkeypatch, make_sidecar_node(1), context)
+    job = Job('instagram')
+    job.run(instagram_downloader.download_instagram_post, loader,
+            'https://www.instagram.com/p/ABC123xyz/', str(tmp_path))
+    assert job.get('state') == FINISHED, job.get('message')
+    assert job.get('files')[0] == '2023-11-14_22-13-20_UTC_GraphSidecar_1.jpg'
@@ -0,0 +1,72 @@
+"""
+اختبار مجمع نسخ Instaloader ومحدد معدل الطلبات
+"""
+import threading
+import time
+
+from instagram_pool import InstaloaderPool, TokenBucket
+
+
+def test_token_bucket_queues_instead_of_failing():
+    """الطلبات الزائدة تنتظر دورها بدلاً من الفشل"""
+    bucket = TokenBucket(rate=20, burst=2)
+    start = time.monotonic()
+    waits = [bucket.acquire() for _ in range(6)]
+    elapsed = time.monotonic() - start
+
+    assert waits[:2] == [0.0, 0.0]
+    assert all(wait > 0 for wait in waits[2:])
+    assert 0.15 < elapsed < 0.5
+    stats = bucket.stats()
+    assert stats['requests'] == 6
+    assert stats['delayed'] == 4
+    assert stats['max_wait'] > 0
+
+
+def test_concurrent_callers_are_spaced_out():
+    bucket = TokenBucket(rate=50, burst=1)
+    done = []
+    threads = [threading.Thread(target=lambda: done.append((bucket.acquire(), time.monotonic())))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    times = sorted(at for _, at in done)
+    assert times[-1] - times[0] >= 4 / 50 * 0.9
+
+
+def test_pool_reuses_a_bounded_number_of_loaders():
+    """المجمع يعيد استخدام عدد محدود من النسخ"""
+    pool = InstaloaderPool({'pool_size': 2, 'requests_per_minute': None})
+    seen = []
+    barrier = threading.Barrier(2)
+
+    def borrow():
+        with pool.loader() as loader:
+            seen.append(loader)
+            try:
+                barrier.wait(timeout=0.3)
+            except threading.BrokenBarrierError:
+                pass
+
+    threads = [threading.Thread(target=borrow) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(seen) == 4
+    assert len({id(loader) for loader in seen}) == 2
+    stats = pool.stats()
+    assert stats['created'] == 2
+    assert stats['idle'] == 2
+    assert stats['borrows'] == 4
+    assert stats['rate_limit'] is None
+
+
+def test_loaders_share_the_rate_limiter():
+    pool = InstaloaderPool({'pool_size': 2, 'requests_per_minute': 600, 'burst': 1})
+    with pool.loader() as loader:
+        controller = loader.context._rate_controller
+    assert controller.limiter is pool.limiter
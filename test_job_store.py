@@ -0,0 +1,112 @@
+"""
+اختبار مشاركة حالة التحميلات بين عدة عمليات عبر قاعدة بيانات المهام
+"""
+from job_store import JobStore
+from jobs import FAILED, FINISHED, Job, JobManager
+
+
+def test_claim_once_per_server_run(tmp_path):
+    """المهمة غير المكتملة تُستأنف في عملية واحدة فقط"""
+    path = str(tmp_path / 'jobs.db')
+    old = JobStore(path, owner='run-old')
+    old.add(Job('video', job_id='a'), {'url': 'https://example.com/a'})
+    old.close()
+
+    first, second = JobStore(path, owner='run-new'), JobStore(path, owner='run-new')
+    assert [row['job_id'] for row in first.unfinished()] == ['a']
+    assert first.claim('a')
+    assert not second.claim('a')
+    assert JobStore(path, owner='run-next').claim('a')
+
+
+def test_pause_request_from_another_worker(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    owner, other = JobStore(path, owner='run'), JobStore(path, owner='run')
+    job = Job('video', job_id='a')
+    job.watchers.append(owner.mark_dirty)  # As JobManager does
+    owner.add(job, {'url': 'https://example.com/a'})
+
+    assert other.request_control('a', 'pause')
+    owner.apply_controls()
+    assert job.get('is_paused')
+    owner.flush()
+    assert other.get('a')['paused'] == 1
+
+    other.request_control('a', 'resume')
+    owner.apply_controls()
+    assert not job.get('is_paused')
+    assert owner.get('a')['control'] is None
+
+
+def test_flush_writes_progress(tmp_path):
+    """التقدم يُكتب في القاعدة عند التفريغ الدفعي وليس مع كل تحديث"""
+    store = JobStore(str(tmp_path / 'jobs.db'), flush_interval=3600)
+    job = Job('video', job_id='a')
+    job.watchers.append(store.mark_dirty)
+    store.add(job, {'url': 'https://example.com/a'})
+
+    job.update(state='running', progress=42.5, downloaded_bytes=425, total_bytes=1000, message='Downloading...')
+    assert store.get('a')['progress'] == 0
+    store.flush()
+    row = store.get('a')
+    assert (row['state'], row['progress'], row['bytes_done'], row['total_bytes']) == ('running', 42.5, 425, 1000)
+    assert row['message'] == 'Downloading...'
+
+
+def test_resume_unfinished_under_same_id(tmp_path, monkeypatch):
+    """المهمة المقطوعة تُعاد بنفس المعرف وخياراتها بعد إعادة التشغيل"""
+    import app as downloader
+
+    path = str(tmp_path / 'jobs.db')
+    old = JobStore(path, owner='run-old')
+    old.add(Job('video', title='Clip', job_id='a'), {'url': 'https://example.com/a', 'quality': '720p'})
+    finished = Job('video', job_id='b')
+    old.add(finished, {'url': 'https://example.com/b'})
+    finished.update(state=FINISHED)
+    old.mark_dirty(finished)
+    old.close()
+
+    calls = []
+    store = JobStore(path, owner='run-new')
+    monkeypatch.setattr(downloader, 'job_store', store)
+    monkeypatch.setattr(downloader, 'job_manager', JobManager(max_workers=1, store=store))
+    monkeypatch.setitem(downloader.JOB_TARGETS, 'video', lambda job, **options: calls.append((job.id, options)))
+
+    assert [row['job_id'] for row in store.unfinished()] == ['a']
+    assert downloader.resume_unfinished_jobs() == 1
+    job = downloader.job_manager.get('a')
+    assert job.wait_until_finished(5)
+    assert calls == [('a', {'url': 'https://example.com/a', 'quality': '720p'})]
+    assert job.get('title') == 'Clip'
+
+    store.flush()
+    assert store.unfinished() == []
+    assert store.history()[1] == 2
+    # Already claimed by this server run
+    assert downloader.resume_unfinished_jobs() == 0
+
+
+def test_history_pages_and_state(tmp_path, monkeypatch):
+    """سجل التحميلات مقسم إلى صفحات، الأحدث أولاً، مع التصفية حسب الحالة"""
+    import app as downloader
+
+    store = JobStore(str(tmp_path / 'jobs.db'))
+    for index in range(5):
+        job = Job('video', title=f'video {index}', job_id=str(index))
+        job.created_at = 1000 + index
+        store.add(job, {'url': f'https://example.com/{index}'})
+        job.update(state=FINISHED if index % 2 else FAILED)
+        store.mark_dirty(job)
+
+    rows, total = store.history(page=1, per_page=2)
+    assert total == 5 and [row['job_id'] for row in rows] == ['4', '3']
+    rows, total = store.history(page=3, per_page=2)
+    assert [row['job_id'] for row in rows] == ['0']
+    rows, total = store.history(page=1, per_page=20, state=FINISHED)
+    assert total == 2 and [row['job_id'] for row in rows] == ['3', '1']
+
+    monkeypatch.setattr(downloader, 'job_store', store)
+    data = downloader.app.test_client().get('/history?page=2&per_page=2&state=failed').get_json()
+    assert (data['page'], data['per_page'], data['total']) == (2, 2, 3)
+    assert [item['job_id'] for item in data['items']] == ['0']
+    assert data['items'][0]['title'] == 'video 0' and data['items'][0]['state'] == FAILED
@@ -0,0 +1,85 @@
+"""
+اختبار قائمة المهام ومراحل التنفيذ (التحميل ثم المعالجة)
+"""
+import threading
+
+from jobs import FAILED, FINISHED, RUNNING, Handoff, JobManager
+
+
+def test_handoff_finishes_in_postprocess_stage():
+    """المهمة تنتقل إلى مرحلة المعالجة وتبقى جارية حتى تنتهي هناك"""
+    manager = JobManager(max_workers=1, postprocess_workers=1)
+    release = threading.Event()
+    threads = {}
+
+    def postprocess(job, path):
+        threads['postprocess'] = threading.current_thread().name
+        release.wait(5)
+        job.update(output_path=path)
+
+    def download(job):
+        threads['download'] = threading.current_thread().name
+        return Handoff(manager.postprocess_stage, postprocess, '/tmp/video.mp4')
+
+    job = manager.submit('video', download)
+    # The download worker is free for the next job while this one is post-processed
+    other = manager.submit('video', lambda job: None)
+    assert other.wait_until_finished(5)
+    assert job.get('state') == RUNNING
+
+    release.set()
+    assert job.wait_until_finished(5)
+    assert job.get('state') == FINISHED
+    assert not job.get('is_downloading')
+    assert job.get('output_path') == '/tmp/video.mp4'
+    assert threads['download'].startswith('download-worker')
+    assert threads['postprocess'].startswith('postprocess-worker')
+    stats = manager.stats()
+    assert stats['download']['completed'] == 2
+    assert stats['postprocess']['completed'] == 1
+
+
+def test_failures_in_either_stage_fail_the_job():
+    manager = JobManager(max_workers=1, postprocess_workers=1)
+
+    def convert(job):
+        raise RuntimeError('ffmpeg exited with code 1\nfull log')
+
+    def fail(job):
+        raise ValueError('Unsupported URL')
+
+    handed_off = manager.submit('video', lambda job: Handoff(manager.postprocess_stage, convert))
+    failed = manager.submit('video', fail)
+    for job in (handed_off, failed):
+        assert job.wait_until_finished(5)
+        assert job.get('state') == FAILED
+        assert not job.get('is_downloading')
+    # Only the first line of the error is shown
+    assert handed_off.get('message') == 'Error: ffmpeg exited with code 1'
+    assert failed.get('message') == 'Error: Unsupported URL'
+
+
+def test_history_keeps_unfinished_jobs():
+    """تقليم السجل يحذف أقدم المهام المنتهية فقط"""
+    manager = JobManager(max_workers=1, max_history=2)
+    release = threading.Event()
+    running = manager.submit('video', lambda job: release.wait(5))
+    finished = [manager.submit('video', lambda job: None) for _ in range(2)]
+    queued = manager.submit('video', lambda job: None)
+    try:
+        # None of them has finished yet, so none is forgotten
+        assert len(manager.jobs()) == 4
+        assert manager.get(running.id) is running
+        assert manager.get(queued.id) is queued
+        assert manager.latest() is queued
+    finally:
+        release.set()
+    for job in finished:
+        assert job.wait_until_finished(5)
+    assert queued.wait_until_finished(5)
+
+    manager.submit('audio', lambda job: None).wait_until_finished(5)
+    remaining = manager.jobs()
+    assert len(remaining) == 2
+    assert remaining[-1].kind == 'audio'
+    assert manager.latest('video') is queued
@@ -0,0 +1,150 @@
+"""
+اختبار فهرس الملفات المحملة: الإعادة من الملف الموجود، الحذف عند تجاوز الحصة، ومشاركة التحميلات المتطابقة
+"""
+import os
+import threading
+
+from jobs import FINISHED, Job
+from media_cache import MediaCache
+
+
+def write(path, size):
+    path.write_bytes(b'x' * size)
+    return str(path)
+
+
+def test_hit_is_hardlinked(tmp_path):
+    """الطلب المتكرر يُخدم من الملف نفسه عبر رابط صلب دون نسخه"""
+    cache = MediaCache(str(tmp_path / 'media.db'))
+    source = write(tmp_path / 'first.mp4', 100)
+    cache.add('key', source)
+
+    cached = cache.lookup('key')
+    assert cached == source
+    destination = cache.materialize(cached, str(tmp_path / 'second.mp4'))
+    assert os.path.samefile(source, destination)
+    assert os.stat(source).st_nlink == 2
+    assert cache.lookup('other') is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_hits_are_written_in_batches(tmp_path):
+    """الإصابات لا تكتب الفهرس في كل مرة، وعملية أخرى ترى الملفات المضافة"""
+    cache = MediaCache(str(tmp_path / 'media.db'), touch_interval=3600)
+    cache.add('key', write(tmp_path / 'a.mp4', 10))
+    cache.lookup('key')
+    assert cache._touched
+
+    other = MediaCache(str(tmp_path / 'media.db'))
+    assert other.lookup('key') == str(tmp_path / 'a.mp4')
+    cache.flush()
+    assert not cache._touched
+
+
+def test_quota_evicts_least_recently_used(tmp_path):
+    """تجاوز الحصة يحذف الأقدم استخدامًا ويتخطى الملف الجديد والملفات قيد التحميل"""
+    cache = MediaCache(str(tmp_path / 'media.db'), quota_bytes=250)
+    oldest = write(tmp_path / 'oldest.mp4', 100)
+    busy = write(tmp_path / 'busy.mp4', 100)
+    used = write(tmp_path / 'used.mp4', 100)
+    cache.add('oldest', oldest)
+    cache.add('busy', busy)
+    cache.add('used', used)
+    assert not os.path.exists(oldest)
+
+    running = Job('video')
+    running.update(output_path=busy)
+    cache.begin('running', running)
+    cache.lookup('used')
+    newest = write(tmp_path / 'newest.mp4', 100)
+    cache.add('newest', newest)
+
+    # busy is the least recently used file but its job is still running
+    assert os.path.exists(busy) and os.path.exists(newest)
+    assert not os.path.exists(used)
+    assert cache.lookup('used') is None
+    assert cache.stats()['files'] == 2
+
+
+def test_identical_job_follows_running_one(tmp_path, monkeypatch):
+    """المهمة المطابقة تتابع المهمة الجارية ثم تنتهي من ملفها بدل تحميل ثانٍ"""
+    import app as downloader
+
+    cache = MediaCache(str(tmp_path / 'media.db'))
+    monkeypatch.setattr(downloader, 'media_cache', cache)
+    first, second = Job('video'), Job('video')
+    assert cache.begin('key', first) is None
+    assert cache.begin('key', second) is first
+
+    def download(job):
+        job.update(progress=50, message='Downloading...')
+        path = write(tmp_path / 'video.mp4', 100)
+        cache.add('key', path)
+        cache.end('key', job)
+        job.update(output_path=path, progress=100)
+
+    follower = threading.Thread(target=downloader.follow_job, args=(second, first))
+    follower.start()
+    first.run(download)
+    follower.join(5)
+    assert not follower.is_alive()
+
+    assert first.get('state') == FINISHED
+    assert downloader.finish_from_media_cache(second, 'key', 'copy', str(tmp_path))
+    destination = second.get('output_path')
+    assert os.path.basename(destination) == 'copy.mp4'
+    assert os.path.samefile(destination, first.get('output_path'))
+
+
+def test_existing_file_is_not_replaced(tmp_path):
+    """ملف موجود مسبقًا بنفس الاسم لا يُحذف، ويُستخدم اسم آخر متاح"""
+    cache = MediaCache(str(tmp_path / 'media.db'))
+    source = write(tmp_path / 'cached.mp4', 100)
+    mine = tmp_path / 'video.mp4'
+    mine.write_bytes(b'my own file')
+
+    destination = cache.materialize(source, str(mine))
+    assert destination == str(tmp_path / 'video (1).mp4')
+    assert os.path.samefile(source, destination)
+    assert mine.read_bytes() == b'my own file'
+    # Materializing again reuses the link instead of adding another name
+    assert cache.materialize(source, str(mine)) == destination
+
+
+def test_generic_urls_with_the_same_file_name_are_not_shared(tmp_path, monkeypatch):
+    """روابط مباشرة من مضيفين مختلفين بنفس اسم الملف لا تُخدم من ملف واحد"""
+    from functools import partial
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+    import app as downloader
+
+    class QuietHandler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    monkeypatch.setattr(downloader, 'media_cache', MediaCache(str(tmp_path / 'media.db')))
+    servers, urls = [], []
+    for size in (5000, 7000):
+        origin = tmp_path / f'origin-{size}'
+        origin.mkdir()
+        write(origin / 'video.mp4', size)
+        server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHandler, directory=str(origin)))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        urls.append(f'http://127.0.0.1:{server.server_address[1]}/video.mp4')
+
+    try:
+        sizes = []
+        for number, url in enumerate(urls):
+            folder = tmp_path / f'downloads-{number}'
+            folder.mkdir()
+            job = Job('video', title='video')
+            job.run(downloader.download_video, url, 'best', 'Video', str(folder))
+            assert job.wait_until_finished(30)
+            assert job.get('state') == FINISHED, job.get('message')
+            sizes.append(os.path.getsize(job.get('output_path')))
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+    assert sizes == [5000, 7000]
@@ -0,0 +1,48 @@
+"""
+اختبار مقاييس Prometheus والسجلات المنظمة
+"""
+import json
+import logging
+
+from log_config import JsonFormatter
+from metrics import Counter, Histogram, Registry
+
+
+def test_render_counter_and_histogram():
+    """الصيغة النصية لـ Prometheus مع الفئات التراكمية"""
+    registry = Registry()
+    served = Counter('served_total', 'Served requests', ['status'], registry=registry)
+    wait = Histogram('wait_seconds', 'Queue wait', ['stage'], buckets=(0.1, 1), registry=registry)
+    served.inc(status='200')
+    served.inc(2, status='200')
+    wait.observe(0.05, stage='download')
+    wait.observe(0.5, stage='download')
+    wait.observe(3, stage='download')
+
+    text = registry.render()
+    assert '# TYPE served_total counter' in text
+    assert 'served_total{status="200"} 3' in text
+    assert 'wait_seconds_bucket{stage="download",le="0.1"} 1' in text
+    assert 'wait_seconds_bucket{stage="download",le="1"} 2' in text
+    assert 'wait_seconds_bucket{stage="download",le="+Inf"} 3' in text
+    assert 'wait_seconds_sum{stage="download"} 3.55' in text
+    assert 'wait_seconds_count{stage="download"} 3' in text
+
+
+def test_labels_must_match():
+    counter = Counter('jobs_total', 'Jobs', ['kind'], registry=None)
+    try:
+        counter.inc(state='finished')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('unknown label accepted')
+
+
+def test_json_log_keeps_extra_fields():
+    """الحقول الإضافية تبقى مفاتيح منفصلة في سطر JSON"""
+    record = logging.LogRecord('app', logging.INFO, __file__, 1, 'Job %s', ('finished',), None)
+    record.job_id = 'abc'
+    data = json.loads(JsonFormatter().format(record))
+    assert data['message'] == 'Job finished'
+    assert data['level'] == 'INFO' and data['job_id'] == 'abc'
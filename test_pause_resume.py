@@ -0,0 +1,169 @@
+"""
+اختبار الإيقاف المؤقت والاستئناف بدون إعادة تحميل أي بايت
+"""
+import os
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import yt_dlp
+
+from jobs import FINISHED, QUEUED, Job, JobManager
+
+FILE_SIZE = 8 * 1024 * 1024
+PAUSE_AT = 1024 * 1024
+# The first response stalls here until the test lets it continue or drops it
+STALL_AT = 2 * 1024 * 1024
+PAYLOAD = os.urandom(FILE_SIZE)
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serve PAYLOAD slowly, honoring Range headers and logging what was sent"""
+
+    def do_GET(self):
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header:
+            start = int(range_header.split('=')[1].split('-')[0])
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{FILE_SIZE - 1}/{FILE_SIZE}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(FILE_SIZE - start))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+
+        record = {'start': start, 'sent': 0}
+        self.server.requests.append(record)
+        try:
+            for offset in range(start, FILE_SIZE, 64 * 1024):
+                if offset == STALL_AT and len(self.server.requests) == 1:
+                    self.server.proceed.wait(10)
+                    if self.server.drop:
+                        self.connection.shutdown(socket.SHUT_WR)
+                        return
+                chunk = PAYLOAD[offset:offset + 64 * 1024]
+                self.wfile.write(chunk)
+                record['sent'] += len(chunk)
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def run_paused_download(tmp_path, drop_connection):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    server.requests = []
+    server.proceed = threading.Event()
+    server.drop = drop_connection
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    job = Job('video')
+    paused = threading.Event()
+    progress = {}
+
+    def hook(d):
+        job.wait_while_paused()
+        progress['bytes'] = d.get('downloaded_bytes')
+        if not paused.is_set() and (d.get('downloaded_bytes') or 0) >= PAUSE_AT:
+            job.pause()
+            paused.set()
+
+    url = f'http://127.0.0.1:{server.server_address[1]}/big.mp4'
+    opts = {
+        'outtmpl': str(tmp_path / '%(id)s.%(ext)s'),
+        'progress_hooks': [hook],
+        'quiet': True,
+        'continuedl': True,
+        'retries': 3,
+        # Reads aligned with the server chunks, so a dropped connection never
+        # discards a partially read block inside the HTTP library
+        'buffersize': 64 * 1024,
+        'noresizebuffer': True,
+    }
+
+    def download():
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            ydl.process_ie_result({'id': 'big', 'title': 'big', 'url': url, 'ext': 'mp4'}, download=True)
+
+    worker = threading.Thread(target=download)
+    worker.start()
+    try:
+        assert paused.wait(10)
+
+        # The worker must stay blocked in place while paused
+        time.sleep(0.3)
+        paused_at = progress['bytes']
+        server.proceed.set()
+        time.sleep(0.3)
+        assert progress['bytes'] == paused_at
+    finally:
+        server.proceed.set()
+        job.resume()
+        worker.join(30)
+        server.shutdown()
+        server.server_close()
+
+    assert (tmp_path / 'big.mp4').read_bytes() == PAYLOAD
+    return server.requests
+
+
+def test_pause_keeps_connection(tmp_path):
+    """الإيقاف المؤقت يحافظ على نفس الاتصال"""
+    requests = run_paused_download(tmp_path, drop_connection=False)
+    assert len(requests) == 1
+    assert sum(r['sent'] for r in requests) == FILE_SIZE
+
+
+def test_resume_after_dropped_connection(tmp_path):
+    """الاستئناف بعد انقطاع الاتصال يكمل من نفس الموضع"""
+    requests = run_paused_download(tmp_path, drop_connection=True)
+    assert len(requests) == 2
+    assert requests[1]['start'] == requests[0]['sent']
+    assert sum(r['sent'] for r in requests) == FILE_SIZE
+
+
+def test_pause_queued_job():
+    """مهمة أُوقفت وهي في قائمة الانتظار تبقى موقوفة ثم تبدأ عند الاستئناف"""
+    manager = JobManager(max_workers=1)
+    release = threading.Event()
+    manager.submit('video', lambda job: release.wait(5))
+    steps = []
+    queued = manager.submit('video', lambda job: (job.wait_while_paused(), steps.append(job.get('is_paused'))))
+
+    queued.pause()
+    release.set()
+    time.sleep(0.2)
+    assert queued.get('state') == QUEUED and queued.get('is_paused')
+    assert steps == []
+
+    queued.resume()
+    assert queued.wait_until_finished(5)
+    assert queued.get('state') == FINISHED and steps == [False]
+
+
+def test_paused_queued_job_frees_worker():
+    """المهام الموقوفة في قائمة الانتظار لا تشغل العمال ولا توقف بقية المهام"""
+    manager = JobManager(max_workers=2)
+    release = threading.Event()
+    blockers = [manager.submit('video', lambda job: release.wait(5)) for _ in range(2)]
+    paused = [manager.submit('video', lambda job: None) for _ in range(2)]
+    others = [manager.submit('video', lambda job: None) for _ in range(3)]
+    for job in paused:
+        job.pause()
+    release.set()
+
+    for job in blockers + others:
+        assert job.wait_until_finished(5)
+        assert job.get('state') == FINISHED
+    assert all(job.get('state') == QUEUED for job in paused)
+    assert manager.download_stage.stats()['active'] == 0
+
+    for job in paused:
+        job.resume()
+    for job in paused:
+        assert job.wait_until_finished(5)
+        assert job.get('state') == FINISHED
@@ -0,0 +1,70 @@
+"""
+اختبار فصل مرحلة المعالجة اللاحقة (الدمج والتحويل) عن مرحلة التحميل
+"""
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import yt_dlp
+from yt_dlp.postprocessor import PostProcessor
+
+from jobs import FINISHED, Handoff, JobManager
+from postprocessing import DeferredPostProcessing
+
+
+def test_handoff_frees_the_download_worker():
+    """المهمة التالية تبدأ التحميل بينما الأولى ما زالت في مرحلة المعالجة"""
+    manager = JobManager(max_workers=1, postprocess_workers=1)
+    release = threading.Event()
+
+    def convert(job):
+        release.wait(5)
+        job.update(message='Converted')
+
+    first = manager.submit('video', lambda job: Handoff(manager.postprocess_stage, convert))
+    second = manager.submit('video', lambda job: job.update(message='Downloaded'))
+
+    assert second.wait_until_finished(5)
+    assert not first.is_finished
+    release.set()
+    assert first.wait_until_finished(5)
+    assert first.get('state') == FINISHED and first.get('message') == 'Converted'
+    stats = manager.stats()
+    assert stats['download']['completed'] == 2
+    assert stats['postprocess']['completed'] == 1
+
+
+class RecordingPP(PostProcessor):
+    def __init__(self):
+        super().__init__()
+        self.threads = []
+
+    def run(self, info):
+        self.threads.append(threading.current_thread().name)
+        return [], info
+
+
+def test_yt_dlp_post_processing_is_deferred(tmp_path):
+    (tmp_path / 'www').mkdir()
+    (tmp_path / 'www' / 'clip.mp4').write_bytes(b'\0' * 4096)
+    handler = partial(SimpleHTTPRequestHandler, directory=str(tmp_path / 'www'))
+    handler.log_message = lambda *args: None
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        pp = RecordingPP()
+        with yt_dlp.YoutubeDL({'quiet': True, 'outtmpl': str(tmp_path / '%(id)s.%(ext)s')}) as ydl:
+            ydl.add_post_processor(pp, when='post_process')
+            deferred = DeferredPostProcessing(ydl)
+            info = ydl.extract_info(f'http://127.0.0.1:{httpd.server_address[1]}/clip.mp4', download=True)
+            assert pp.threads == []
+            assert (tmp_path / 'clip.mp4').exists()
+
+            results = []
+            worker = threading.Thread(target=lambda: results.append(deferred.run()), name='postprocess-worker-1')
+            worker.start()
+            worker.join()
+        assert pp.threads == ['postprocess-worker-1']
+        assert results[0]['filepath'] == info['requested_downloads'][0]['filepath'] == str(tmp_path / 'clip.mp4')
+    finally:
+        httpd.shutdown()
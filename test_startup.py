@@ -0,0 +1,22 @@
+"""
+اختبار سرعة بدء التشغيل: المكتبات الثقيلة تُحمَّل عند أول استخدام فقط
+"""
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_import_app_stays_light(tmp_path):
+    """استيراد التطبيق لا يحمّل yt_dlp ولا instaloader ولا يكتب في مجلد التحميل"""
+    folder = tmp_path / 'downloads'
+    env = dict(os.environ, PYTHONPATH=ROOT, DOWNLOADER_DOWNLOAD_FOLDER=str(folder))
+    code = ("import json, sys, app; "
+            "print(json.dumps(sorted({m.split('.')[0] for m in sys.modules} & "
+            "{'yt_dlp', 'instaloader', 'mutagen', 'requests'})))")
+    result = subprocess.run([sys.executable, '-c', code], cwd=tmp_path, env=env,
+                            capture_output=True, text=True, check=True)
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == []
+    assert not folder.exists()
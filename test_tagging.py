@@ -0,0 +1,66 @@
+"""
+اختبار قواعد تحديد النوع الموسيقي وإعادة كتابة الوسوم لمكتبة موجودة
+"""
+import json
+
+from mutagen.id3 import ID3
+
+from retag import find_audio_files, load_genre_rules, retag_file
+from tagging import GenreMatcher, determine_genre
+
+# Valid MPEG frames, enough for mutagen to open the file as an MP3
+SILENT_MP3 = (b'\xff\xfb\x90\x64' + b'\x00' * 413) * 20
+
+
+def test_specific_genres_are_reachable():
+    """مهرجان وشعبي وكلاسيكي لم تعد تُصنَّف قبل أنواعها الخاصة"""
+    assert determine_genre('أغنية مهرجان جديد', '') == 'Mahraganat'
+    assert determine_genre('موسيقى كلاسيكية', '') == 'Classical'
+    assert determine_genre('طرب كلاسيكي', '') == 'Arabic Classical'
+    assert determine_genre('أغنية جديدة', None) == 'Arabic Pop'
+    assert determine_genre('Live', 'Hip Hop session') == 'Arabic Rap'
+    assert determine_genre('Vlog', '') == 'Music'
+
+
+def test_latin_keywords_match_whole_words():
+    """الكلمات اللاتينية تُطابق ككلمات كاملة وليس كجزء من كلمة أخرى"""
+    assert determine_genre('أغنية جديدة', 'Lyrics in the second paragraph') == 'Arabic Pop'
+    assert determine_genre('Music therapy', '') == 'Music'
+    assert determine_genre('Most popular songs', '') == 'Music'
+    assert determine_genre('New Rap single', '') == 'Arabic Rap'
+    assert determine_genre('Pop-rock mix', '') == 'Pop'
+
+
+def test_priority_does_not_depend_on_rule_order():
+    rules = [('Low', 1, ['song']), ('High', 5, ['live', 'song'])]
+    matcher = GenreMatcher(rules, default='Other')
+    assert matcher.match('A song', '') == 'High'
+    assert GenreMatcher(list(reversed(rules))).match('', 'SONG') == 'High'
+    assert matcher.match('', '') == 'Other'
+
+
+def test_retag_library(tmp_path):
+    """إعادة كتابة الوسوم من ملف .info.json المحفوظ بجانب الملف الصوتي"""
+    album = tmp_path / 'album'
+    album.mkdir()
+    (album / 'track.mp3').write_bytes(SILENT_MP3)
+    (album / 'track.info.json').write_text(json.dumps({
+        'title': 'مهرجان الصيف', 'uploader': 'Artist', 'upload_date': '20240105'}), encoding='utf-8')
+    (album / 'other.mp3').write_bytes(SILENT_MP3)
+
+    files, missing = find_audio_files(str(tmp_path))
+    assert files == [str(album / 'track.mp3')] and missing == 1
+    assert retag_file(files[0])
+    tags = ID3(files[0])
+    assert str(tags['TIT2']) == 'مهرجان الصيف'
+    assert str(tags['TCON']) == 'Mahraganat'
+    assert str(tags['TDRC']) == '2024'
+
+
+def test_retag_uses_configured_rules(tmp_path, monkeypatch):
+    """أداة إعادة الوسوم تستخدم نفس قواعد الأنواع المضبوطة للتطبيق"""
+    monkeypatch.setenv('DOWNLOADER_GENRE_RULES', json.dumps([['Podcast', 1, ['episode']]]))
+    assert load_genre_rules() == [['Podcast', 1, ['episode']]]
+    rules_file = tmp_path / 'rules.json'
+    rules_file.write_text(json.dumps([['Lecture', 1, ['lesson']]]), encoding='utf-8')
+    assert load_genre_rules(str(rules_file)) == [['Lecture', 1, ['lesson']]]
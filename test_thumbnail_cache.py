@@ -0,0 +1,107 @@
+"""
+اختبار ذاكرة التخزين المؤقت للصور المصغرة
+"""
+import threading
+import time
+
+import pytest
+
+from thumbnail_cache import ThumbnailCache
+
+
+def make_fetch(calls, delay=0):
+    def fetch(url):
+        calls.append(url)
+        time.sleep(delay)
+        return url.encode() * 100, 'image/jpeg', None
+    return fetch
+
+
+def test_allowed_hosts(tmp_path):
+    cache = ThumbnailCache(str(tmp_path), ['ytimg.com'])
+    assert cache.is_allowed('https://i.ytimg.com/vi/x/hqdefault.jpg')
+    assert cache.is_allowed('https://ytimg.com/x.jpg')
+    assert not cache.is_allowed('https://evilytimg.com/x.jpg')
+    assert not cache.is_allowed('file:///etc/passwd')
+    assert not cache.is_allowed('http://127.0.0.1/x.jpg')
+
+
+def test_concurrent_requests_fetch_once(tmp_path):
+    """الطلبات المتزامنة لنفس الرابط تشترك في عملية جلب واحدة"""
+    calls = []
+    cache = ThumbnailCache(str(tmp_path), ['ytimg.com'])
+    fetch = make_fetch(calls, delay=0.2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('https://i.ytimg.com/a.jpg', fetch)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert len({entry.etag for entry in results}) == 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    calls = []
+    ThumbnailCache(str(tmp_path), ['ytimg.com']).get('https://i.ytimg.com/a.jpg', make_fetch(calls))
+    entry = ThumbnailCache(str(tmp_path), ['ytimg.com']).get('https://i.ytimg.com/a.jpg', make_fetch(calls))
+    assert len(calls) == 1
+    assert entry.data == b'https://i.ytimg.com/a.jpg' * 100
+
+
+def test_memory_budget_evicts_least_recently_used(tmp_path):
+    calls = []
+    cache = ThumbnailCache(str(tmp_path), ['ytimg.com'], memory_budget=6000)
+    fetch = make_fetch(calls)
+    for name in ('a', 'b', 'c'):
+        cache.get(f'https://i.ytimg.com/{name}.jpg', fetch)
+    stats = cache.stats()
+    assert stats['memory_bytes'] <= 6000
+    assert stats['memory_entries'] == 2
+
+
+class FakeResponse:
+    def __init__(self, status, headers, data=b''):
+        self.status_code = status
+        self.headers = headers
+        self.data = data
+        self.is_redirect = status in (301, 302, 303, 307, 308)
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        yield self.data
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+def test_redirects_stay_on_allowed_hosts(monkeypatch):
+    """كل تحويل يُتحقق من مضيفه قبل متابعته"""
+    import app as downloader
+
+    responses = {
+        'https://i.ytimg.com/a.jpg': FakeResponse(302, {'location': '/b.jpg'}),
+        'https://i.ytimg.com/b.jpg': FakeResponse(200, {'content-type': 'image/png'}, b'image'),
+        'https://i.ytimg.com/evil.jpg': FakeResponse(302, {'location': 'http://127.0.0.1/secret'}),
+    }
+    requested = []
+
+    def get(url, **kwargs):
+        assert kwargs['allow_redirects'] is False
+        requested.append(url)
+        return responses[url]
+
+    monkeypatch.setattr(downloader.http_session, 'get', get)
+    assert downloader.fetch_thumbnail('https://i.ytimg.com/a.jpg') == (b'image', 'image/png', None)
+    with pytest.raises(ValueError):
+        downloader.fetch_thumbnail('https://i.ytimg.com/evil.jpg')
+    assert 'http://127.0.0.1/secret' not in requested
@@ -0,0 +1,201 @@
+"""
+Two-tier cache for images served by `/download_thumbnail_proxy`.
+
+Proxied thumbnails are kept in an in-memory LRU with a byte budget, backed by
+an on-disk store, so popular thumbnails are fetched from the origin once.
+Concurrent requests for the same URL share a single upstream fetch, and only
+hosts on an allow list are proxied so the cache can't be filled with
+arbitrary URLs.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+class ThumbnailEntry:
+    """
+    A cached image and the validators used for conditional requests
+    """
+
+    def __init__(self, data, content_type, last_modified=None, stored_at=None):
+        self.data = data
+        self.content_type = content_type or 'image/jpeg'
+        self.stored_at = stored_at or time.time()
+        self.last_modified = last_modified or self.stored_at
+        self.etag = hashlib.sha256(data).hexdigest()[:32]
+
+    @property
+    def size(self):
+        return len(self.data)
+
+
+class ThumbnailCache:
+    """
+    Memory LRU in front of a disk store, with single-flight upstream fetches
+    """
+
+    def __init__(self, folder, allowed_hosts, memory_budget=32 * 1024 * 1024,
+                 disk_budget=512 * 1024 * 1024, ttl=7 * 24 * 3600):
+        self.folder = folder
+        self.allowed_hosts = [host.lower().lstrip('.') for host in allowed_hosts]
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.ttl = ttl
+        self.stats_counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'fetches': 0}
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def is_allowed(self, url):
+        parts = urlsplit(url)
+        host = (parts.hostname or '').lower()
+        if parts.scheme not in ('http', 'https') or not host:
+            return False
+        return any(host == allowed or host.endswith('.' + allowed) for allowed in self.allowed_hosts)
+
+    def get(self, url, fetch):
+        """
+        Return the ThumbnailEntry for url, calling `fetch(url)` on a miss
+
+        `fetch` returns (data, content_type, last_modified timestamp or None).
+        """
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        while True:
+            with self._lock:
+                entry = self._memory_get(key)
+                if entry is not None:
+                    self.stats_counters['memory_hits'] += 1
+                    return entry
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = threading.Event()
+                    break
+            # Another request is fetching this URL, wait for it
+            pending.wait()
+
+        try:
+            entry = self._disk_get(key)
+            with self._lock:
+                if entry is not None:
+                    self.stats_counters['disk_hits'] += 1
+                else:
+                    self.stats_counters['misses'] += 1
+                    self.stats_counters['fetches'] += 1
+            if entry is None:
+                data, content_type, last_modified = fetch(url)
+                entry = ThumbnailEntry(data, content_type, last_modified)
+                self._disk_put(key, entry)
+            with self._lock:
+                self._memory_put(key, entry)
+            return entry
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.stats_counters, memory_entries=len(self._memory),
+                        memory_bytes=self._memory_bytes, disk_bytes=self._disk_bytes)
+
+    # --- Memory tier ---
+    def _memory_get(self, key):
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry.stored_at > self.ttl:
+            self._memory_bytes -= entry.size
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return entry
+
+    def _memory_put(self, key, entry):
+        if entry.size > self.memory_budget:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old.size
+        self._memory[key] = entry
+        self._memory_bytes += entry.size
+        while self._memory_bytes > self.memory_budget:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.size
+
+    # --- Disk tier ---
+    def _paths(self, key):
+        base = os.path.join(self.folder, key[:2], key)
+        return base + '.bin', base + '.json'
+
+    def _disk_get(self, key):
+        data_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if time.time() - meta['stored_at'] > self.ttl:
+                return None
+            with open(data_path, 'rb') as f:
+                data = f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+        return ThumbnailEntry(data, meta.get('content_type'), meta.get('last_modified'), meta['stored_at'])
+
+    def _disk_put(self, key, entry):
+        data_path, meta_path = self._paths(key)
+        try:
+            os.makedirs(os.path.dirname(data_path), exist_ok=True)
+            with open(data_path + '.tmp', 'wb') as f:
+                f.write(entry.data)
+            os.replace(data_path + '.tmp', data_path)
+            with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'content_type': entry.content_type, 'last_modified': entry.last_modified,
+                           'stored_at': entry.stored_at}, f)
+            os.replace(meta_path + '.tmp', meta_path)
+        except OSError as e:
+            logger.warning('Could not cache thumbnail on disk', extra={'error': str(e)})
+            return
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk_bytes()
+            else:
+                self._disk_bytes += entry.size
+            over_budget = self._disk_bytes > self.disk_budget
+        if over_budget:
+            self._trim_disk()
+
+    def _scan_disk_bytes(self):
+        total = 0
+        for root, _, files in os.walk(self.folder):
+            total += sum(os.path.getsize(os.path.join(root, name)) for name in files if name.endswith('.bin'))
+        return total
+
+    def _trim_disk(self):
+        # Remove the oldest images until the store is at 80% of its budget
+        files = []
+        for root, _, names in os.walk(self.folder):
+            for name in names:
+                if name.endswith('.bin'):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_budget * 0.8:
+                break
+            for stale in (path, path[:-len('.bin')] + '.json'):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
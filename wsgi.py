@@ -0,0 +1,11 @@
+"""
+WSGI entry point, for running the app under any WSGI server:
+
+    gunicorn wsgi:app
+
+gunicorn picks up the settings in gunicorn.conf.py. `python serve.py` does
+the same without a separate command line.
+"""
+from serve import start_app
+
+app = start_app()